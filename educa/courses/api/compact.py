@@ -0,0 +1,182 @@
+"""
+Read-only serialization straight from .values() rows.
+
+A FieldPlan is computed once per serializer class (and serializer
+context) from the fields of the serializer: which columns to read,
+which values need the field's to_representation() (dates) and which
+are already what the serializer would output (strings, integers,
+booleans, primary keys). Nested many=True serializers and primary key
+lists are read with one query each for the whole page, like the
+prefetches of the model path.
+
+The output is the same OrderedDicts, in the same field order, as the
+serializer's, so the rendered JSON is byte for byte identical; only
+list views use it, the detail and write paths keep the serializers.
+"""
+from collections import OrderedDict, defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+# fields whose to_representation() leaves database values unchanged
+PLAIN_REPRESENTATIONS = (
+    serializers.CharField.to_representation,
+    serializers.IntegerField.to_representation,
+    serializers.BooleanField.to_representation,
+)
+# context entries that do not change the fields of a serializer
+REQUEST_CONTEXT = ('request', 'view', 'format')
+
+
+class FieldPlan(object):
+    """
+    Arguments:
+        serializer {ModelSerializer} -- an unbound serializer instance
+        whose fields are planned
+    """
+    _plans = {}
+
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        opts = self.model._meta
+        self.pk = opts.pk.attname
+        self.columns = [self.pk]
+        # (name, column or None, converter) in output order
+        self.steps = []
+        # name -> callable loading {pk: representation} for a page
+        self.relations = {}
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            source = field.source.replace('.', '__')
+            if isinstance(field, serializers.ListSerializer):
+                self.relations[name] = self._nested(
+                    opts.get_field(source), FieldPlan(field.child))
+                self.steps.append((name, None, None))
+            elif isinstance(field, ManyRelatedField):
+                self.relations[name] = self._pk_list(opts.get_field(source))
+                self.steps.append((name, None, None))
+            elif isinstance(field, serializers.BaseSerializer):
+                raise ImproperlyConfigured(
+                    '{}: nested serializers need many=True'.format(name))
+            elif isinstance(field, serializers.RelatedField):
+                if not isinstance(field, PrimaryKeyRelatedField):
+                    raise ImproperlyConfigured(
+                        '{}: only primary key relations are planned'.format(
+                            name))
+                self._add_column(source)
+                self.steps.append((name, source, None))
+            else:
+                self._add_column(source)
+                plain = type(field).to_representation in PLAIN_REPRESENTATIONS
+                self.steps.append(
+                    (name, source, None if plain else field.to_representation))
+
+    def _add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+
+    @classmethod
+    def for_serializer(cls, serializer_class, context=None):
+        """
+        The plan of serializer_class, computed on first use
+
+        Arguments:
+            serializer_class {type} -- a ModelSerializer subclass
+            context {dict} -- the serializer context (default: {None})
+        """
+        # plans outlive requests, so they are built without them
+        context = dict(
+            (name, value) for name, value in (context or {}).items()
+            if name not in REQUEST_CONTEXT)
+        key = (serializer_class, tuple(sorted(context.items())))
+        plan = cls._plans.get(key)
+        if plan is None:
+            plan = cls._plans[key] = cls(serializer_class(context=context))
+        return plan
+
+    def _nested(self, relation, plan):
+        """
+        Representations of the rows of a reverse foreign key, by the
+        primary key of the row they point to
+        """
+        column = relation.field.name
+        plan._add_column(column)
+        manager = relation.related_model._default_manager
+
+        def load(pks):
+            grouped = defaultdict(list)
+            rows = list(manager.filter(
+                **{'{}__in'.format(column): pks}).values(*plan.columns))
+            for row, data in zip(rows, plan.represent(rows)):
+                grouped[row[column]].append(data)
+            return grouped
+        return load
+
+    def _pk_list(self, field):
+        """
+        Primary keys of the rows a many-to-many field points to, read
+        like the prefetch of that field
+        """
+        query_name = field.related_query_name()
+        manager = field.rel.to._default_manager
+
+        def load(pks):
+            grouped = defaultdict(list)
+            for pk, related in manager.filter(
+                    **{'{}__in'.format(query_name): pks}).values_list(
+                        query_name, 'pk'):
+                grouped[pk].append(related)
+            return grouped
+        return load
+
+    def values(self, queryset):
+        """
+        queryset reduced to the columns of the plan
+        """
+        return queryset.values(*self.columns)
+
+    def represent(self, rows):
+        """
+        Arguments:
+            rows {list} -- rows of values(), evaluated once
+
+        Returns:
+            list -- an OrderedDict per row, like serializer.data
+        """
+        rows = list(rows)
+        related = {}
+        if self.relations:
+            pks = [row[self.pk] for row in rows]
+            related = dict(
+                (name, load(pks)) for name, load in self.relations.items())
+        data = []
+        for row in rows:
+            item = OrderedDict()
+            for name, column, convert in self.steps:
+                if column is None:
+                    item[name] = related[name].get(row[self.pk], [])
+                    continue
+                value = row[column]
+                if convert is not None and value is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+
+class CompactListMixin(object):
+    """
+    A list action serialized by the FieldPlan of the serializer class
+    """
+    def list(self, request, *args, **kwargs):
+        plan = FieldPlan.for_serializer(
+            self.get_serializer_class(), self.get_serializer_context())
+        queryset = plan.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.represent(page))
+        return Response(plan.represent(queryset))
@@ -0,0 +1,18 @@
+from django.utils import six
+from rest_framework.pagination import CursorPagination
+
+
+class CourseCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the catalog order (newest first, id breaking
+    ties), so deep pages cost the same as the first one
+    """
+    ordering = ('-created', '-id')
+    page_size = 20
+
+    def _get_position_from_instance(self, instance, ordering):
+        # the compact list paginates .values() rows
+        if isinstance(instance, dict):
+            return six.text_type(instance[ordering[0].lstrip('-')])
+        return super(CourseCursorPagination, self)._get_position_from_instance(
+            instance, ordering)
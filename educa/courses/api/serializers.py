@@ -15,6 +15,13 @@ class ModuleSerializer(serializers.ModelSerializer):
 
 
 class CourseSerializer(serializers.ModelSerializer):
+    """
+    The ``students`` context entry controls the students field: 'list'
+    (the enrolled ids, default), 'count' (read from ``total_students``)
+    or 'omit'.
+    """
+    STUDENTS_MODES = ('list', 'count', 'omit')
+
     modules = ModuleSerializer(many=True, read_only=True)
 
     class Meta:
@@ -23,6 +30,15 @@ class CourseSerializer(serializers.ModelSerializer):
             'modules', 'id', 'title', 'slug', 'overview', 'created',
             'owner', 'subject', 'students')
 
+    def __init__(self, *args, **kwargs):
+        super(CourseSerializer, self).__init__(*args, **kwargs)
+        students = self.context.get('students', 'list')
+        if students == 'omit':
+            self.fields.pop('students')
+        elif students == 'count':
+            self.fields['students'] = serializers.IntegerField(
+                source='total_students', read_only=True)
+
 
 class ItemRelatedField(serializers.RelatedField):
     def to_representation(self, value):
@@ -0,0 +1,43 @@
+"""
+Streaming serialization of a course with all its contents.
+
+The course header is sent first, then each module with its contents,
+one module at a time, so memory use does not depend on the course size.
+The bytes are the same as CourseWithContentSerializer rendered by the
+JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+
+from ..models import render_many
+from .serializers import CourseWithContentSerializer
+from .serializers import ModuleWithContentSerializer, ContentSerializer
+
+
+def stream_course_contents(course, context):
+    """
+    Arguments:
+        course {Course} -- the course to export
+        context {dict} -- the serializer context of the view
+
+    Yields:
+        bytes -- consecutive chunks of the JSON document
+    """
+    renderer = JSONRenderer()
+    header = CourseWithContentSerializer(course, context=context)
+    # modules is the last field, streamed below
+    header.fields.pop('modules')
+    yield renderer.render(header.data)[:-1] + b',"modules":['
+
+    modules = course.modules.all().iterator()
+    for position, module in enumerate(modules):
+        contents = list(module.contents.with_items())
+        render_many([
+            content.item for content in contents
+            if content.item is not None])
+        serializer = ModuleWithContentSerializer(module, context=context)
+        serializer.fields.pop('contents')
+        data = serializer.data
+        data['contents'] = ContentSerializer(
+            contents, many=True, context=context).data
+        yield (b',' if position else b'') + renderer.render(data)
+    yield b']}'
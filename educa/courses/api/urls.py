@@ -14,6 +14,9 @@ urlpatterns = [
     url(r'^subjects/(?P<pk>\d+)/$',
         views.SubjetDetailView.as_view(),
         name='subject_detail'),
+    url(r'^search/$',
+        views.SearchView.as_view(),
+        name='search'),
     # Don't need the following URL since we implemented
     # a view set that allows enroll
     # url(
@@ -1,18 +1,27 @@
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from rest_framework import viewsets
 from rest_framework import generics
+from rest_framework import status
 from rest_framework.decorators import detail_route
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.authentication import BasicAuthentication
 from rest_framework.permissions import IsAuthenticated
-from ..models import Subject, Course
+from ..models import Subject, Course, Content, render_many
+from .. import conditional, enrollment, search, versions
+from .compact import CompactListMixin
 from .serializers import SubjectSerializer, CourseSerializer
 from .serializers import CourseWithContentSerializer
 from .permissions import IsEnrolled
+from .pagination import CourseCursorPagination
+from .streaming import stream_course_contents
 
 
-class SubjectListView(generics.ListAPIView):
+class SubjectListView(CompactListMixin, generics.ListAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
 
@@ -22,6 +31,20 @@ class SubjetDetailView(generics.RetrieveAPIView):
     serializer_class = SubjectSerializer
 
 
+class SearchView(APIView):
+    """
+    Ranked full-text search: ``?q=<terms>&limit=<n>``
+    """
+    def get(self, request, format=None):
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            limit = 20
+        results = search.search(query, limit) if query else []
+        return Response([result._asdict() for result in results])
+
+
 class CourseEnrollView(APIView):
     authentication_classes = (BasicAuthentication,)
     permission_classes = (IsAuthenticated,)
@@ -32,9 +55,82 @@ class CourseEnrollView(APIView):
         return Response({'enrolled': True})
 
 
-class CourseViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Course.objects.all()
+class CourseViewSet(CompactListMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Courses with their modules. ``?students=count`` or ``?students=omit``
+    replace the list of enrolled student ids by its length or drop it.
+    ``contents/?stream=1`` sends the course contents module by module.
+    The list and the contents carry ETag and Last-Modified validators
+    (see courses.versions) and answer 304 without serializing anything.
+    The list is serialized from .values() rows (see courses.api.compact).
+    """
+    queryset = Course.objects.select_related(
+        'owner', 'subject').prefetch_related('modules')
     serializer_class = CourseSerializer
+    pagination_class = CourseCursorPagination
+
+    def get_students_mode(self):
+        mode = self.request.query_params.get('students', 'list')
+        if mode not in CourseSerializer.STUDENTS_MODES:
+            return 'list'
+        return mode
+
+    def wants_stream(self):
+        return self.request.query_params.get('stream') in ('1', 'true')
+
+    def get_serializer_context(self):
+        context = super(CourseViewSet, self).get_serializer_context()
+        context['students'] = self.get_students_mode()
+        return context
+
+    def conditional_response(self, stamp, respond):
+        """
+        Call respond() only when the client copy is stale, answer 304
+        otherwise
+
+        Arguments:
+            stamp {tuple} -- (etag, last modified) from courses.versions
+            respond {callable} -- builds the full response
+        """
+        etag, last_modified = stamp
+        # the JSON and the browsable API are distinct representations
+        etag = conditional.make_etag(
+            etag.strip('"'), self.request.accepted_renderer.format)
+        if conditional.not_modified(self.request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = respond()
+        patch_vary_headers(response, ('Accept',))
+        return conditional.set_validators(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        # one aggregate over the whole course table per request, cursor
+        # pages included, see versions.catalog_stamp()
+        return self.conditional_response(
+            versions.catalog_stamp(request.get_full_path()),
+            lambda: super(CourseViewSet, self).list(
+                request, *args, **kwargs))
+
+    def get_queryset(self):
+        qs = super(CourseViewSet, self).get_queryset()
+        if self.action == 'list':
+            # the compact list reads modules and students itself
+            qs = Course.objects.all()
+        elif self.action == 'retrieve':
+            students = self.get_students_mode()
+            if students == 'list':
+                qs = qs.prefetch_related(Prefetch(
+                    'students', queryset=User.objects.only('id')))
+        elif self.action == 'contents' and self.wants_stream():
+            # modules and contents are fetched while streaming
+            qs = Course.objects.all()
+        elif self.action == 'contents':
+            # ContentSerializer renders every item, so resolve the
+            # generic items per content type up front
+            qs = qs.prefetch_related(Prefetch(
+                'modules__contents',
+                queryset=Content.objects.with_items()))
+        return qs
 
     @detail_route(
         methods=['post'],
@@ -42,7 +138,7 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
         permission_classes=[IsAuthenticated])
     def enroll(self, request, *args, **kwargs):
         course = self.get_object()
-        course.students.add(request.user)
+        enrollment.enroll(request.user, course.id)
         return Response({'enrolled': True})
 
     @detail_route(
@@ -50,5 +146,29 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
         serializer_class=CourseWithContentSerializer,
         authentication_classes=[BasicAuthentication],
         permission_classes=[IsAuthenticated, IsEnrolled])
-    def contents(self, requests, *args, **kwargs):
-        return self.retrieve(requests, *args, **kwargs)
+    def contents(self, request, *args, **kwargs):
+        try:
+            course_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        stamp = versions.course_stamp(course_id)
+        if stamp is None:
+            raise Http404
+        # enrollment is checked before answering 304
+        self.check_object_permissions(request, Course(id=course_id))
+        return self.conditional_response(stamp, self.contents_response)
+
+    def contents_response(self):
+        course = self.get_object()
+        if self.wants_stream():
+            return StreamingHttpResponse(
+                stream_course_contents(
+                    course, self.get_serializer_context()),
+                content_type='application/json')
+        render_many([
+            content.item
+            for module in course.modules.all()
+            for content in module.contents.all()
+            if content.item is not None])
+        serializer = self.get_serializer(course)
+        return Response(serializer.data)
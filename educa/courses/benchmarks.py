@@ -0,0 +1,267 @@
+"""
+HTTP load benchmarks of the catalog, learning and API paths.
+
+The server under test is started the usual way (uwsgi with
+config/uwsgi.ini, or runserver) on a database seeded with
+``manage.py seed_benchmark``; ``manage.py bench_load`` then drives
+concurrent traffic at it with one thread per simulated client and
+records throughput and latency percentiles per scenario as JSON, tagged
+with the current commit so runs can be compared.
+"""
+import base64
+import json
+import os
+import subprocess
+import threading
+import time
+from http.cookiejar import CookieJar
+from itertools import count
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+from .models import Course, Module
+
+SCENARIOS = (
+    'course_list',
+    'course_detail',
+    'student_course_detail_module',
+    'api:course-list',
+    'api:course-contents',
+)
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+class Client(object):
+    """
+    One simulated user agent, keeping its own cookies
+    """
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def request(self, path, data=None, headers=None):
+        """
+        Returns:
+            tuple -- (ok, seconds): ok is False for errors and for
+            redirects away from path (e.g. to the login page)
+        """
+        request = Request(
+            self.base_url + path, data=data, headers=headers or {})
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                ok = urlsplit(response.geturl()).path == urlsplit(path).path
+        except (HTTPError, URLError, OSError):
+            ok = False
+        return ok, time.perf_counter() - started
+
+    def login(self, username, password):
+        path = reverse('login')
+        self.request(path)
+        token = next(
+            (c.value for c in self.cookies if c.name == 'csrftoken'), '')
+        self.request(
+            path,
+            data=urlencode({
+                'username': username, 'password': password,
+                'csrfmiddlewaretoken': token}).encode(),
+            headers={'Referer': self.base_url + path})
+        return any(c.name == 'sessionid' for c in self.cookies)
+
+
+def learners(prefix, limit):
+    """
+    Seeded students with one course they are enrolled in and the
+    modules of that course
+
+    Returns:
+        list -- (username, course_id, [module ids]) tuples
+    """
+    Enrollment = Course.students.through
+    rows = Enrollment.objects.filter(
+        user__username__startswith='{}-student-'.format(prefix)
+    ).order_by('user_id').values_list('user__username', 'course_id')
+    picked = []
+    seen = set()
+    for username, course_id in rows.iterator():
+        if username not in seen:
+            seen.add(username)
+            picked.append((username, course_id))
+            if len(picked) == limit:
+                break
+    modules = {}
+    for course_id, module_id in Module.objects.filter(
+            course_id__in=set(c for u, c in picked)
+    ).order_by('order').values_list('course_id', 'id'):
+        modules.setdefault(course_id, []).append(module_id)
+    return [(username, course_id, modules.get(course_id, []))
+            for username, course_id in picked]
+
+
+class Scenario(object):
+    """
+    What each simulated client of a scenario requests
+
+    Arguments:
+        name {str} -- URL name
+        prefix {str} -- prefix of the seeded data
+        password {str} -- password of the seeded students
+    """
+    def __init__(self, name, prefix, password):
+        self.name = name
+        self.prefix = prefix
+        self.password = password
+        self.slugs = list(Course.objects.filter(
+            slug__startswith='{}-course-'.format(prefix)
+        ).values_list('slug', flat=True))
+
+    def client(self, base_url, learner):
+        """
+        A client logged in as needed, and a function of the request
+        number returning the path and headers of that request
+        """
+        client = Client(base_url)
+        username, course_id, module_ids = learner
+        if self.name == 'course_list':
+            return client, lambda i: (reverse('course_list'), {})
+        if self.name == 'course_detail':
+            return client, lambda i: (reverse(
+                'course_detail', args=[self.slugs[i % len(self.slugs)]]), {})
+        if self.name == 'student_course_detail_module':
+            client.login(username, self.password)
+            return client, lambda i: (reverse(
+                'student_course_detail_module',
+                args=[course_id, module_ids[i % len(module_ids)]]), {})
+        if self.name == 'api:course-list':
+            return client, lambda i: (reverse('api:course-list'), {})
+        if self.name == 'api:course-contents':
+            auth = 'Basic {}'.format(base64.b64encode('{}:{}'.format(
+                username, self.password).encode()).decode())
+            return client, lambda i: (
+                reverse('api:course-contents', args=[course_id]),
+                {'Authorization': auth})
+        raise ValueError('unknown scenario {}'.format(self.name))
+
+
+def run(scenario, base_url, learners, duration, warmup=0.0):
+    """
+    Drive one scenario with one thread per learner
+
+    Returns:
+        dict -- summary of the requests sent after the warmup
+    """
+    clients = [scenario.client(base_url, learner) for learner in learners]
+    timings = []
+    errors = [0]
+    lock = threading.Lock()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop = measure_from + duration
+
+    def work(client, next_request):
+        local_timings = []
+        local_errors = 0
+        for i in count():
+            now = time.perf_counter()
+            if now >= stop:
+                break
+            path, headers = next_request(i)
+            ok, elapsed = client.request(path, headers=headers)
+            if now >= measure_from:
+                if ok:
+                    local_timings.append(elapsed)
+                else:
+                    local_errors += 1
+        with lock:
+            timings.extend(local_timings)
+            errors[0] += local_errors
+
+    threads = [
+        threading.Thread(target=work, args=client)
+        for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(timings, errors[0], duration)
+
+
+def summarize(timings, errors, duration):
+    summary = {
+        'requests': len(timings),
+        'errors': errors,
+        'throughput': len(timings) / duration if duration else 0.0,
+    }
+    if timings:
+        summary.update({
+            'mean_ms': sum(timings) * 1000 / len(timings),
+            'p50_ms': percentile(timings, 0.50) * 1000,
+            'p90_ms': percentile(timings, 0.90) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+            'max_ms': max(timings) * 1000,
+        })
+    return summary
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset(prefix):
+    courses = Course.objects.filter(slug__startswith='{}-course-'.format(
+        prefix))
+    return {
+        'courses': courses.count(),
+        'modules': Module.objects.filter(course__in=courses).count(),
+        'enrollments': Course.students.through.objects.filter(
+            course__in=courses).count(),
+        'database': connection.vendor,
+    }
+
+
+def compare(previous, current):
+    """
+    Lines comparing the throughput and p95 latency of two result files
+    """
+    lines = ['comparing with {} ({})'.format(
+        previous.get('commit'), previous.get('created'))]
+    for name, now in sorted(current['scenarios'].items()):
+        before = previous.get('scenarios', {}).get(name)
+        if not before or not before.get('p95_ms') or not now.get('p95_ms'):
+            lines.append('{}: no previous result'.format(name))
+            continue
+        lines.append(
+            '{}: throughput {:.1f} -> {:.1f} req/s ({:+.1f}%), '
+            'p95 {:.1f} -> {:.1f} ms ({:+.1f}%)'.format(
+                name, before['throughput'], now['throughput'],
+                _change(before['throughput'], now['throughput']),
+                before['p95_ms'], now['p95_ms'],
+                _change(before['p95_ms'], now['p95_ms'])))
+    return lines
+
+
+def _change(before, now):
+    return (now - before) * 100.0 / before if before else 0.0
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
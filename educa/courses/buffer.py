@@ -0,0 +1,111 @@
+"""
+Write-behind buffers shared by every process, kept in the cache.
+
+Events are numbered with an incremented sequence and stored one key per
+event, so they survive the process that appended them being recycled
+or killed. flush() reads them in order under a cache lock and only
+drops them once the writer returned, so writers must be idempotent: a
+flush that fails half way is written again by the next one. An event
+number whose key is missing is waited for once (it may still be being
+written) before it is skipped as evicted.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+class EventBuffer(object):
+    """
+    Arguments:
+        name {str} -- prefix of the cache keys of the buffer
+        timeout_setting {str} -- setting holding the seconds an event
+        is kept in the cache
+    """
+    def __init__(self, name, timeout_setting):
+        self.name = name
+        self.timeout_setting = timeout_setting
+        self.sequence_key = '{}:sequence'.format(name)
+        self.cursor_key = '{}:flushed'.format(name)
+        self.missing_key = '{}:missing'.format(name)
+        self.lock_key = '{}:lock'.format(name)
+
+    def timeout(self):
+        return getattr(settings, self.timeout_setting, 60 * 60 * 24)
+
+    def event_key(self, number):
+        return '{}:event:{}'.format(self.name, number)
+
+    def _next_number(self):
+        try:
+            return cache.incr(self.sequence_key)
+        except ValueError:
+            cache.add(self.sequence_key, 0, None)
+            return cache.incr(self.sequence_key)
+
+    def append(self, event):
+        """
+        Arguments:
+            event {object} -- a picklable event
+
+        Returns:
+            int -- the number of the event
+        """
+        number = self._next_number()
+        cache.set(self.event_key(number), event, self.timeout())
+        return number
+
+    def depth(self):
+        """
+        Number of events appended and not flushed yet, evicted ones
+        included
+        """
+        found = cache.get_many([self.sequence_key, self.cursor_key])
+        last = found.get(self.sequence_key, 0)
+        cursor = found.get(self.cursor_key, 0)
+        return last - cursor if cursor <= last else last
+
+    def flush(self, write, size):
+        """
+        Hand the oldest buffered events to write, unless another
+        process is flushing
+
+        Arguments:
+            write {callable} -- called with the list of events, in order
+            size {int} -- most events read per flush
+
+        Returns:
+            object -- what write returned, 0 when it was not called
+        """
+        if not cache.add(self.lock_key, 1, 5 * 60):
+            return 0
+        try:
+            cursor = cache.get(self.cursor_key, 0)
+            last = cache.get(self.sequence_key, 0)
+            if cursor > last:
+                # the sequence was evicted and restarted
+                cursor = 0
+            numbers = list(range(cursor + 1, min(last, cursor + size) + 1))
+            if not numbers:
+                return 0
+            found = cache.get_many([self.event_key(n) for n in numbers])
+            missed = cache.get(self.missing_key, frozenset())
+            flushed = numbers[-1]
+            missing = set()
+            events = []
+            for number in numbers:
+                event = found.get(self.event_key(number))
+                if event is None:
+                    missing.add(number)
+                    if number not in missed:
+                        flushed = min(flushed, number - 1)
+                    continue
+                events.append(event)
+            result = write(events) if events else 0
+            cache.set(self.cursor_key, flushed, None)
+            cache.set(self.missing_key, frozenset(
+                number for number in missing if number > flushed), None)
+            cache.delete_many([
+                self.event_key(number) for number in numbers
+                if number <= flushed])
+            return result
+        finally:
+            cache.delete(self.lock_key)
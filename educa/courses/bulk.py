@@ -0,0 +1,108 @@
+"""
+Bulk inserts that skip the rows already present, which bulk_create
+cannot do on this Django version.
+"""
+from django.db import connection, transaction
+
+# stay under the 999 parameters of SQLite
+MAX_PARAMETERS = 900
+
+
+def batches(values, size=MAX_PARAMETERS):
+    """
+    values in lists of at most size, e.g. for the ids of an __in lookup
+    """
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def insert_ignore(model, fields, rows, key=None):
+    """
+    Insert rows into the table of model, skipping those that conflict
+    with existing ones on key
+
+    PostgreSQL uses ON CONFLICT DO NOTHING RETURNING; SQLite and MySQL
+    look the existing keys up first and use INSERT OR IGNORE / INSERT
+    IGNORE, so a row inserted concurrently is skipped without failing;
+    other databases fall back to bulk_create.
+
+    Arguments:
+        model {Model} -- the model
+        fields {tuple} -- names of the fields of each row, e.g.
+        ('user', 'course')
+        rows {list} -- tuples of values (ids for foreign keys)
+
+    Keyword Arguments:
+        key {tuple} -- fields of the unique constraint, the first ones
+        of fields (default: {fields})
+
+    The other columns get the defaults of their model fields, which
+    the database does not know about.
+
+    Returns:
+        list -- the inserted rows
+    """
+    key = key or fields
+    width = len(key)
+    opts = model._meta
+    model_fields = [opts.get_field(name) for name in fields]
+    defaults = [
+        field for field in opts.concrete_fields
+        if field not in model_fields and not field.primary_key]
+    columns = [field.column for field in model_fields]
+    attnames = [field.attname for field in model_fields]
+    rows = list(dict((row[:width], row) for row in rows).values())
+    batch_size = max(1, MAX_PARAMETERS // (len(fields) + len(defaults)))
+    default_values = [
+        field.get_db_prep_save(field.get_default(), connection)
+        for field in defaults]
+
+    def insert(verb, batch, suffix=''):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '{} INTO {} ({}) VALUES {}{}'.format(
+                    verb, connection.ops.quote_name(opts.db_table),
+                    ', '.join(
+                        connection.ops.quote_name(field.column)
+                        for field in model_fields + defaults),
+                    ', '.join(['({})'.format(', '.join(
+                        ['%s'] * (len(fields) + len(defaults))))] *
+                        len(batch)),
+                    suffix),
+                [value for row in batch for value in [
+                    field.get_db_prep_save(value, connection)
+                    for field, value in zip(model_fields, row)
+                ] + default_values])
+            return cursor.fetchall() if suffix else None
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            by_key = dict((row[:width], row) for row in rows)
+            inserted = []
+            for start in range(0, len(rows), batch_size):
+                returned = insert(
+                    'INSERT', rows[start:start + batch_size],
+                    ' ON CONFLICT DO NOTHING RETURNING {}'.format(', '.join(
+                        connection.ops.quote_name(c)
+                        for c in columns[:width])))
+                inserted.extend(by_key[tuple(row)] for row in returned)
+            return inserted
+
+        existing = set()
+        for batch in batches(rows, MAX_PARAMETERS // width):
+            lookup = dict(
+                ('{}__in'.format(attname), set(row[i] for row in batch))
+                for i, attname in enumerate(attnames[:width]))
+            existing.update(model.objects.filter(**lookup).values_list(
+                *attnames[:width]))
+        new = [row for row in rows if row[:width] not in existing]
+        if connection.vendor in ('sqlite', 'mysql'):
+            verb = 'INSERT OR IGNORE' if connection.vendor == 'sqlite' \
+                else 'INSERT IGNORE'
+            for start in range(0, len(new), batch_size):
+                insert(verb, new[start:start + batch_size])
+        else:
+            model.objects.bulk_create([
+                model(**dict(zip(attnames, row))) for row in new])
+        return new
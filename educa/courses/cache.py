@@ -0,0 +1,108 @@
+"""
+Helpers shared by the cached read paths.
+
+Invalidation is done with generation numbers: every cache key embeds the
+current version of its namespace, so bumping the version is a single
+increment and stale entries simply stop being read and expire on their
+own. Hits and misses are counted per namespace in this process.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+
+class CacheStats(object):
+    """
+    Thread-safe, in-process hit/miss counters per cache namespace.
+    Listeners are called with (namespace, hits, misses) on every count.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0, 0])
+        self.listeners = []
+
+    def hit(self, namespace, count=1):
+        with self._lock:
+            self._counts[namespace][0] += count
+        for listener in self.listeners:
+            listener(namespace, count, 0)
+
+    def miss(self, namespace, count=1):
+        with self._lock:
+            self._counts[namespace][1] += count
+        for listener in self.listeners:
+            listener(namespace, 0, count)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict -- {namespace: {'hits', 'misses', 'ratio'}}
+        """
+        with self._lock:
+            counts = dict((ns, list(c)) for ns, c in self._counts.items())
+        return dict(
+            (ns, {
+                'hits': hits,
+                'misses': misses,
+                'ratio': float(hits) / (hits + misses) if hits + misses else None,
+            })
+            for ns, (hits, misses) in counts.items())
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
+
+
+def _version_key(name):
+    return 'version:{}'.format(name)
+
+
+def _initial_version():
+    # Start above any generation that may have been evicted so that
+    # entries written under an old generation are never read again.
+    return int(time.time() * 1000)
+
+
+def get_versions(names):
+    """
+    Current generation of each namespace, in one cache round trip
+    when they all exist.
+
+    Arguments:
+        names {list} -- namespace names, e.g. ['catalog', 'course:3']
+
+    Returns:
+        dict -- {name: version}
+    """
+    keys = dict((_version_key(name), name) for name in names)
+    found = cache.get_many(list(keys))
+    versions = dict((keys[key], value) for key, value in found.items())
+    for key, name in keys.items():
+        if name not in versions:
+            cache.add(key, _initial_version(), None)
+            versions[name] = cache.get(key) or _initial_version()
+    return versions
+
+
+def get_version(name):
+    return get_versions([name])[name]
+
+
+def bump_version(name):
+    """
+    Move a namespace to a new generation, invalidating every key
+    built from the previous one.
+    """
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # no generation stored yet (or it was evicted)
+        version = _initial_version()
+        cache.set(key, version, None)
+        return version
@@ -0,0 +1,97 @@
+"""
+Cached catalog listings for CourseListView.
+
+Subjects and courses are stored as plain tuples, already evaluated, under
+keys versioned by the 'catalog' generation. The generation is bumped by
+the signal handlers in courses.signals whenever a subject, course or
+module changes.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import stats, get_version, bump_version
+from .models import Subject, Course
+
+NAMESPACE = 'catalog'
+
+SubjectRow = namedtuple('SubjectRow', 'id title slug total_courses')
+CourseRow = namedtuple(
+    'CourseRow',
+    'id title slug subject_title subject_slug total_modules owner_name')
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+
+def load_subjects():
+    return list(Subject.objects.values_list(
+        'id', 'title', 'slug', 'total_courses'))
+
+
+def load_courses(subject_id=None):
+    courses = Course.objects.all()
+    if subject_id is not None:
+        courses = courses.filter(subject_id=subject_id)
+    return [
+        (id, title, slug, subject_title, subject_slug, total_modules,
+         '{} {}'.format(first_name, last_name).strip())
+        for (id, title, slug, subject_title, subject_slug, total_modules,
+             first_name, last_name)
+        in courses.values_list(
+            'id', 'title', 'slug', 'subject__title', 'subject__slug',
+            'total_modules', 'owner__first_name', 'owner__last_name')]
+
+
+def get_catalog(subject_slug=None):
+    """
+    Subjects and the courses of one subject (or all courses), in two
+    cache round trips on a hit: the generation, then both listings.
+
+    Keyword Arguments:
+        subject_slug {str} -- restrict courses to this subject (default: {None})
+
+    Raises:
+        Subject.DoesNotExist -- subject_slug matches no subject
+
+    Returns:
+        tuple -- (subjects, subject, courses), subject being None when
+        no subject_slug is given
+    """
+    version = get_version(NAMESPACE)
+    subjects_key = 'catalog:{}:subjects'.format(version)
+    if subject_slug is None:
+        courses_key = 'catalog:{}:all_courses'.format(version)
+    else:
+        courses_key = 'catalog:{}:subject_{}_courses'.format(
+            version, subject_slug)
+    found = cache.get_many([subjects_key, courses_key])
+    stats.hit(NAMESPACE, len(found))
+    stats.miss(NAMESPACE, 2 - len(found))
+
+    missing = {}
+    subjects = found.get(subjects_key)
+    if subjects is None:
+        subjects = missing[subjects_key] = load_subjects()
+    subjects = [SubjectRow._make(row) for row in subjects]
+
+    subject = None
+    if subject_slug is not None:
+        matches = [s for s in subjects if s.slug == subject_slug]
+        if not matches:
+            raise Subject.DoesNotExist(subject_slug)
+        subject = matches[0]
+
+    courses = found.get(courses_key)
+    if courses is None:
+        courses = missing[courses_key] = load_courses(
+            subject.id if subject else None)
+    if missing:
+        cache.set_many(missing, _timeout())
+    return subjects, subject, [CourseRow._make(row) for row in courses]
+
+
+def invalidate():
+    bump_version(NAMESPACE)
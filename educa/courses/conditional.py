@@ -0,0 +1,52 @@
+"""
+Conditional GET helpers: validators on responses and 304 decisions.
+"""
+import calendar
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.utils.http import quote_etag
+
+
+def timestamp(value):
+    """
+    Arguments:
+        value {datetime|float} -- a datetime or a POSIX timestamp
+
+    Returns:
+        int -- whole seconds since the epoch
+    """
+    if hasattr(value, 'utctimetuple'):
+        return calendar.timegm(value.utctimetuple())
+    return int(value)
+
+
+def not_modified(request, etag, last_modified):
+    """
+    Whether the client copy is current: If-None-Match decides when
+    present, If-Modified-Since otherwise
+
+    Arguments:
+        request {HttpRequest} -- a GET or HEAD request
+        etag {str} -- quoted entity tag of the current representation
+        last_modified {datetime|float} -- when it last changed
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        # parse_etags() unquotes the tags
+        return if_none_match.strip() == '*' or \
+            parse_etags(etag)[0] in parse_etags(if_none_match)
+    since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and last_modified is not None and \
+        timestamp(last_modified) <= since
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(timestamp(last_modified))
+    return response
+
+
+def make_etag(*parts):
+    return quote_etag('-'.join(str(part) for part in parts))
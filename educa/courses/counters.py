@@ -0,0 +1,86 @@
+"""
+Recount and repair the denormalized counter columns:
+Course.total_modules, Course.total_students, Course.total_contents and
+Subject.total_courses.
+
+They are kept up to date by courses.signals; these functions recompute
+them from the source tables and fix only the rows that drifted, with
+one bulk UPDATE ... CASE per batch.
+"""
+from django.db import models, transaction
+from django.db.models import Count, Case, When, Value
+
+from .models import Subject, Course, Module, Content
+
+Enrollment = Course.students.through
+
+BATCH_SIZE = 500
+
+
+def _counts(model, group_by, ids=None):
+    qs = model.objects.all()
+    if ids is not None:
+        qs = qs.filter(**{'{}__in'.format(group_by): list(ids)})
+    # order_by() keeps the model ordering out of the GROUP BY
+    return dict(qs.order_by().values_list(group_by).annotate(Count('pk')))
+
+
+def _repair(model, field_name, actual, ids=None):
+    """
+    Set field_name to actual[pk] (0 when missing) where it differs
+
+    Returns:
+        int -- number of repaired rows
+    """
+    qs = model.objects.all()
+    if ids is not None:
+        qs = qs.filter(pk__in=list(ids))
+    drifted = [
+        (pk, actual.get(pk, 0))
+        for pk, value in qs.order_by().values_list('pk', field_name)
+        if value != actual.get(pk, 0)]
+    with transaction.atomic():
+        for start in range(0, len(drifted), BATCH_SIZE):
+            batch = drifted[start:start + BATCH_SIZE]
+            model.objects.filter(pk__in=[pk for pk, count in batch]).update(
+                **{field_name: Case(
+                    *[When(pk=pk, then=Value(count)) for pk, count in batch],
+                    output_field=models.PositiveIntegerField())})
+    return len(drifted)
+
+
+def recount_modules(course_ids=None):
+    return _repair(
+        Course, 'total_modules',
+        _counts(Module, 'course_id', course_ids), course_ids)
+
+
+def recount_students(course_ids=None):
+    return _repair(
+        Course, 'total_students',
+        _counts(Enrollment, 'course_id', course_ids), course_ids)
+
+
+def recount_contents(course_ids=None):
+    return _repair(
+        Course, 'total_contents',
+        _counts(Content, 'module__course_id', course_ids), course_ids)
+
+
+def recount_courses(subject_ids=None):
+    return _repair(
+        Subject, 'total_courses',
+        _counts(Course, 'subject_id', subject_ids), subject_ids)
+
+
+def recount_all():
+    """
+    Returns:
+        dict -- number of repaired rows per counter
+    """
+    return {
+        'course.total_modules': recount_modules(),
+        'course.total_students': recount_students(),
+        'course.total_contents': recount_contents(),
+        'subject.total_courses': recount_courses(),
+    }
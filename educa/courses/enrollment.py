@@ -0,0 +1,316 @@
+"""
+Enrollment lookups and writes.
+
+"Is user U enrolled in course C" is answered from a cached set of the
+ids of the courses U is enrolled in. A lookup that finds no set reads
+it from the Course.students table with one indexed query and caches it
+for the next ones. The set is dropped by courses.signals whenever the
+user's enrollments change.
+
+enroll() does not write to the database: it appends the enrollment to
+a courses.buffer.EventBuffer shared by every process and records it in
+a cached pending set that the lookups include, so the student is
+enrolled from their next request on. The pending set is updated under
+a per-user cache lock, so concurrent enrollments of a user all stay
+visible. A background thread in each process flushes the buffer every
+ENROLLMENT_FLUSH_INTERVAL seconds with one bulk insert ignoring the
+rows that already exist, sends m2m_changed once per course of the
+batch and only then removes the flushed courses from the pending sets.
+Enrollments of users or courses deleted meanwhile are dropped.
+
+An acknowledged enrollment lives only in the cache until it is flushed:
+a restart of the cache server or an eviction loses it without a trace,
+which is why the flush interval must stay short (seconds). When the
+pending set of a user cannot be locked within PENDING_LOCK_WAIT seconds
+(e.g. the cache server is down), enroll() writes the enrollment itself.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed
+
+from .buffer import EventBuffer
+from .bulk import batches, insert_ignore
+from .cache import stats
+from .models import Course
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'enrollment'
+
+Enrollment = Course.students.through
+
+# enrollments written per flush
+FLUSH_SIZE = 5000
+# seconds a pending set stays locked by a process that died holding it
+PENDING_LOCK_TIMEOUT = 5
+# seconds enroll() waits for that lock before writing synchronously
+PENDING_LOCK_WAIT = 1
+
+buffer = EventBuffer('enrollment', 'ENROLLMENT_BUFFER_TIMEOUT')
+
+
+def _timeout():
+    return getattr(settings, 'ENROLLMENT_CACHE_TIMEOUT', 60 * 60)
+
+
+def _key(user_id):
+    return 'enrollment:courses:{}'.format(user_id)
+
+
+def _pending_key(user_id):
+    return 'enrollment:pending:{}'.format(user_id)
+
+
+@contextmanager
+def _pending_lock(user_id):
+    """
+    Serialize the updates of the pending set of a user across processes.
+    Yields whether the lock was taken within PENDING_LOCK_WAIT seconds.
+    """
+    key = 'enrollment:pending-lock:{}'.format(user_id)
+    # only the holder releases the lock, not a process whose lock expired
+    token = uuid.uuid4().hex
+    deadline = time.time() + PENDING_LOCK_WAIT
+    locked = cache.add(key, token, PENDING_LOCK_TIMEOUT)
+    while not locked and time.time() < deadline:
+        time.sleep(0.01)
+        locked = cache.add(key, token, PENDING_LOCK_TIMEOUT)
+    try:
+        yield locked
+    finally:
+        if locked and cache.get(key) == token:
+            cache.delete(key)
+
+
+def enrolled_course_ids(user):
+    """
+    Ids of the courses user is enrolled in
+
+    Arguments:
+        user {User} -- the user, possibly anonymous
+
+    Returns:
+        frozenset -- course ids
+    """
+    if not user.is_authenticated():
+        return frozenset()
+    found = cache.get_many([_key(user.id), _pending_key(user.id)])
+    return _course_ids(user, found) | found.get(
+        _pending_key(user.id), frozenset())
+
+
+def _course_ids(user, found):
+    """
+    The cached set of the ids of the courses user is enrolled in, read
+    from the database and cached when it is not in found
+    """
+    key = _key(user.id)
+    course_ids = found.get(key)
+    if course_ids is None:
+        stats.miss(NAMESPACE)
+        course_ids = frozenset(Enrollment.objects.filter(
+            user_id=user.id).values_list('course_id', flat=True))
+        cache.set(key, course_ids, _timeout())
+    else:
+        stats.hit(NAMESPACE)
+    return course_ids
+
+
+def pending_course_ids(user):
+    """
+    Ids of the courses user enrolled in that are not flushed yet
+    """
+    return cache.get(_pending_key(user.id), frozenset())
+
+
+def is_enrolled(user, course_id):
+    """
+    Arguments:
+        user {User} -- the user, possibly anonymous
+        course_id {int} -- the course
+
+    Returns:
+        bool -- whether user is enrolled in the course
+    """
+    if not user.is_authenticated():
+        return False
+    found = cache.get_many([_key(user.id), _pending_key(user.id)])
+    if course_id in found.get(_pending_key(user.id), ()):
+        return True
+    return course_id in _course_ids(user, found)
+
+
+def invalidate(user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+class EnrollmentQueue(object):
+    """
+    Flushes the enrollments buffered by every process in batches.
+    Throughput counters of this process are kept for monitoring.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {
+            'enqueued': 0, 'duplicates': 0, 'flushed': 0, 'inserted': 0,
+            'batches': 0, 'failures': 0, 'max_depth': 0}
+        self.last_flush = None
+
+    def interval(self):
+        return getattr(settings, 'ENROLLMENT_FLUSH_INTERVAL', 1.0)
+
+    def put(self, user_id, course_id):
+        key = _pending_key(user_id)
+        with _pending_lock(user_id) as locked:
+            if locked:
+                pending = cache.get(key, frozenset())
+                duplicate = course_id in pending
+                if not duplicate:
+                    cache.set(key, pending | {course_id}, buffer.timeout())
+                    buffer.append((user_id, course_id))
+        if not locked:
+            logger.warning(
+                'pending enrollments of user %s locked, writing now',
+                user_id)
+            self._write([(user_id, course_id)], forget=False)
+            return
+        depth = buffer.depth()
+        with self._lock:
+            if duplicate:
+                self.counters['duplicates'] += 1
+            else:
+                self.counters['enqueued'] += 1
+            self.counters['max_depth'] = max(self.counters['max_depth'], depth)
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            self.flush()
+        else:
+            self.start()
+
+    def depth(self):
+        return buffer.depth()
+
+    def flush(self, size=FLUSH_SIZE):
+        """
+        Write the buffered enrollments and send m2m_changed for them,
+        unless another process is flushing
+
+        Returns:
+            int -- number of rows inserted
+        """
+        try:
+            return buffer.flush(self._write, size)
+        except Exception:
+            # the buffer keeps them for the next flush
+            with self._lock:
+                self.counters['failures'] += 1
+            raise
+
+    def _write(self, pairs, forget=True):
+        started = time.time()
+        pairs = sorted(set(pairs))
+        # users and courses deleted since the enrollment was buffered
+        user_ids = set()
+        courses = {}
+        for batch in batches(set(user_id for user_id, _ in pairs)):
+            user_ids.update(User.objects.filter(
+                id__in=batch).values_list('id', flat=True))
+        for batch in batches(set(course_id for _, course_id in pairs)):
+            courses.update(Course.objects.in_bulk(batch))
+        rows = [
+            (user_id, course_id) for user_id, course_id in pairs
+            if user_id in user_ids and course_id in courses]
+        # the receivers keep the counters and caches in step with the
+        # rows, so neither is committed without the other
+        with transaction.atomic():
+            inserted = insert_ignore(
+                Enrollment, ('user', 'course'), rows) if rows else []
+            by_course = defaultdict(set)
+            for user_id, course_id in inserted:
+                by_course[course_id].add(user_id)
+            for course_id, added in by_course.items():
+                for action in ('pre_add', 'post_add'):
+                    m2m_changed.send(
+                        sender=Enrollment, action=action,
+                        instance=courses[course_id], reverse=False,
+                        model=User, pk_set=added, using=connection.alias)
+        if forget:
+            _forget_pending(pairs)
+        with self._lock:
+            self.counters['flushed'] += len(pairs)
+            self.counters['inserted'] += len(inserted)
+            self.counters['batches'] += 1
+            self.last_flush = {
+                'at': started, 'rows': len(pairs),
+                'seconds': time.time() - started}
+        return len(inserted)
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='enrollment-flush')
+                    self._thread.daemon = True
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval())
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('enrollment flush failed')
+            finally:
+                connection.close()
+
+    def metrics(self):
+        depth = buffer.depth()
+        with self._lock:
+            metrics = dict(self.counters)
+            metrics['depth'] = depth
+            metrics['last_flush'] = self.last_flush
+        return metrics
+
+
+queue = EnrollmentQueue()
+
+
+def _forget_pending(pairs):
+    """
+    Remove flushed enrollments from the pending sets, keeping the
+    courses enrolled in since the batch was read
+    """
+    by_user = defaultdict(set)
+    for user_id, course_id in pairs:
+        by_user[user_id].add(course_id)
+    for user_id, course_ids in by_user.items():
+        key = _pending_key(user_id)
+        with _pending_lock(user_id) as locked:
+            if not locked:
+                # the flushed ids are enrolled anyway, they expire
+                continue
+            pending = cache.get(key, frozenset()) - course_ids
+            if pending:
+                cache.set(key, pending, buffer.timeout())
+            else:
+                cache.delete(key)
+
+
+def enroll(user, course_id):
+    """
+    Enroll user in a course: visible to the lookups at once, written to
+    the database by the next flush. Enrolling twice is harmless.
+    """
+    queue.put(user.id, course_id)
@@ -1,4 +1,6 @@
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Max, Case, When, Value
 from django.core.exceptions import ObjectDoesNotExist
 
 
@@ -29,18 +31,105 @@ class OrderField(models.PositiveIntegerField):
     instance using setattr()and return it.
     2. If the model instance has a value for the current field, we don't do anything.
     \n
+    With counter=True the next value comes from an OrderCounter row
+    per parent (per for_fields values) instead of the latest() query.
+    The row is incremented atomically inside the insert's transaction,
+    so concurrent inserts never share an order and a failed insert
+    gives its value back. OrderedQuerySet.bulk_create() reserves one
+    block of values per parent for the whole batch.
+    \n
     Arguments:
         models {[type]} -- [description]
     \n
     Returns:
         [type] -- [description]
     """
-    def __init__(self, for_fields=None, *args, **kwargs):
+    def __init__(self, for_fields=None, counter=False, *args, **kwargs):
         self.for_fields = for_fields
+        self.counter = counter
         super(OrderField, self).__init__(*args, **kwargs)
 
+    def parent_values(self, model_instance):
+        """
+        for_fields values of model_instance keyed by column attname,
+        e.g. {'course_id': 3}, read without fetching the related objects
+        """
+        attnames = [
+            self.model._meta.get_field(field).attname
+            for field in self.for_fields or []]
+        return [
+            (attname, getattr(model_instance, attname))
+            for attname in attnames]
+
+    def counter_key(self, model_instance):
+        """
+        Name of the OrderCounter row holding the next order for the
+        parent of model_instance, e.g. ``courses.module.order:course_id=3``
+        """
+        opts = self.model._meta
+        return '{}.{}.{}:{}'.format(
+            opts.app_label, opts.model_name, self.attname,
+            ','.join('{}={}'.format(*value)
+                     for value in self.parent_values(model_instance)))
+
+    def next_value(self, model_instance):
+        """
+        Highest order in the parent + 1, used to seed a new counter row
+        for parents created before the counter existed.
+        """
+        qs = self.model._default_manager.filter(
+            **dict(self.parent_values(model_instance)))
+        last = qs.aggregate(last=Max(self.attname))['last']
+        return 0 if last is None else last + 1
+
+    def reserve(self, model_instance, count=1):
+        """
+        Atomically reserve count consecutive order values in the parent
+        of model_instance. The counter row stays locked until the
+        surrounding transaction ends.
+
+        Arguments:
+            model_instance {Model} -- any instance of the parent
+            count {int} -- number of values to reserve (default: {1})
+
+        Returns:
+            int -- the first reserved value
+        """
+        OrderCounter = apps.get_model('courses', 'OrderCounter')
+        key = self.counter_key(model_instance)
+        counters = OrderCounter.objects.filter(key=key)
+        with transaction.atomic(savepoint=False):
+            if not counters.update(value=F('value') + count):
+                try:
+                    with transaction.atomic():
+                        OrderCounter.objects.create(
+                            key=key,
+                            value=self.next_value(model_instance) + count)
+                except IntegrityError:
+                    # another insert created the row first
+                    counters.update(value=F('value') + count)
+            return counters.values_list('value', flat=True).get() - count
+
+    def assign(self, objs):
+        """
+        Give every object without an order the next values of its
+        parent, with a single reservation per parent.
+        """
+        pending = {}
+        for obj in objs:
+            if getattr(obj, self.attname) is None:
+                pending.setdefault(self.counter_key(obj), []).append(obj)
+        for siblings in pending.values():
+            start = self.reserve(siblings[0], len(siblings))
+            for offset, obj in enumerate(siblings):
+                setattr(obj, self.attname, start + offset)
+
     def pre_save(self, model_instance, add):
-        if getattr(model_instance, self.attname) is None:
+        if getattr(model_instance, self.attname) is None and self.counter:
+            value = self.reserve(model_instance)
+            setattr(model_instance, self.attname, value)
+            return value
+        elif getattr(model_instance, self.attname) is None:
             # No current value
             try:
                 qs = self.model.objects.all()
@@ -61,3 +150,61 @@ class OrderField(models.PositiveIntegerField):
             return value
         else:
             return super(OrderField, self).pre_save(model_instance, add)
+
+
+class OrderedQuerySet(models.QuerySet):
+    """
+    QuerySet for models with a counter-backed OrderField: bulk_create()
+    reserves the order values of the whole batch up front, one
+    reservation per parent, instead of one per row.
+    """
+    def bulk_create(self, objs, batch_size=None):
+        objs = list(objs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            for field in self.model._meta.concrete_fields:
+                if isinstance(field, OrderField) and field.counter:
+                    field.assign(objs)
+            return super(OrderedQuerySet, self).bulk_create(
+                objs, batch_size)
+
+    def set_order(self, orders, field_name='order'):
+        """
+        Apply a drag-and-drop reordering in one transaction: a single
+        query checks which of the pks are visible through this queryset
+        (e.g. owned by the requester) and a single UPDATE ... CASE
+        writes all their new orders.
+
+        Arguments:
+            orders {dict} -- {pk: order}, as posted by the sortable lists
+
+        Keyword Arguments:
+            field_name {str} -- the OrderField to update (default: {'order'})
+
+        Returns:
+            list -- the posted keys that were not updated, either because
+            they are not in this queryset or because pk or order is invalid
+        """
+        wanted = {}
+        rejected = []
+        for key, order in orders.items():
+            try:
+                pk, order = int(key), int(order)
+            except (TypeError, ValueError):
+                rejected.append(key)
+                continue
+            if order < 0:
+                rejected.append(key)
+            else:
+                wanted[pk] = order
+        with transaction.atomic(using=self.db):
+            allowed = set(self.filter(
+                pk__in=list(wanted)).values_list('pk', flat=True))
+            rejected.extend(
+                str(pk) for pk in wanted if pk not in allowed)
+            if allowed:
+                self.model._base_manager.using(self.db).filter(
+                    pk__in=list(allowed)
+                ).update(**{field_name: Case(
+                    *[When(pk=pk, then=Value(wanted[pk])) for pk in allowed],
+                    output_field=models.PositiveIntegerField())})
+        return sorted(str(key) for key in rejected)
@@ -0,0 +1,113 @@
+"""
+Fragment cache for the student learning pages.
+
+The rendered contents of a module are shared by every enrolled student,
+so they are cached once per module under the current version of the
+module and of its course. The instructor views bump those versions when
+contents are added, edited, deleted or reordered, so students see
+changes immediately and nothing user-specific is ever cached. The
+keys also carry models.RENDER_VERSION, bumped with the content
+templates.
+
+The module navigation of a course is cached the same way, under the
+course's updated stamp, which courses.signals and the order views move
+whenever one of its modules is added, changed, deleted or reordered.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .cache import stats, get_versions, bump_version
+from .models import RENDER_VERSION, Content
+
+NAMESPACE = 'learning'
+
+ModuleLink = namedtuple('ModuleLink', 'id course_id order title')
+
+
+def _timeout():
+    return getattr(settings, 'LEARNING_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def course_version_name(course_id):
+    return 'course:{}'.format(course_id)
+
+
+def module_version_name(module_id):
+    return 'module:{}'.format(module_id)
+
+
+def module_fragment(module):
+    """
+    Rendered contents of module for the student course page, with the
+    ids of those contents
+
+    Arguments:
+        module {Module|ModuleLink} -- the module being viewed
+
+    Returns:
+        tuple -- (SafeText of all the module contents, list of ids)
+    """
+    names = [
+        course_version_name(module.course_id),
+        module_version_name(module.id)]
+    versions = get_versions(names)
+    key = 'learning:module:{}:{}:{}:{}'.format(
+        RENDER_VERSION, module.id, *[versions[name] for name in names])
+    fragment = cache.get(key)
+    if fragment is None:
+        stats.miss(NAMESPACE)
+        # a ModuleLink has no related managers
+        contents = list(
+            Content.objects.filter(module_id=module.id).with_items())
+        fragment = (
+            render_to_string(
+                'students/course/module_contents.html',
+                {'contents': contents}),
+            [content.id for content in contents])
+        cache.set(key, fragment, _timeout())
+    else:
+        stats.hit(NAMESPACE)
+    return mark_safe(fragment[0]), fragment[1]
+
+
+def module_skeleton(course):
+    """
+    The modules of course, for the navigation and to pick the module
+    shown
+
+    Arguments:
+        course {Course} -- the course being viewed
+
+    Returns:
+        list -- ModuleLink tuples, in order
+    """
+    key = 'learning:skeleton:{}:{:%Y%m%d%H%M%S%f}'.format(
+        course.id, course.updated)
+    skeleton = cache.get(key)
+    if skeleton is None:
+        stats.miss(NAMESPACE)
+        skeleton = [
+            ModuleLink(*row) for row in course.modules.values_list(
+                'id', 'course_id', 'order', 'title')]
+        cache.set(key, skeleton, _timeout())
+    else:
+        stats.hit(NAMESPACE)
+    return skeleton
+
+
+def module_contents(module):
+    return module_fragment(module)[0]
+
+
+def invalidate_modules(module_ids):
+    for module_id in set(module_ids):
+        bump_version(module_version_name(module_id))
+
+
+def invalidate_courses(course_ids):
+    for course_id in set(course_ids):
+        bump_version(course_version_name(course_id))
@@ -0,0 +1,101 @@
+"""
+Resized and recompressed derivatives of Image contents.
+
+Saving an Image schedules generate() in the background worker pool
+(see courses.signals) to run once the saving transaction has committed,
+i.e. once the row with the saved file is visible to the pool. Until it
+has run the templates fall back to the original file. The derivatives
+of the file it replaced are deleted by the same task.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from . import fragments, versions, workers
+from .models import Content, Image
+
+logger = logging.getLogger(__name__)
+
+# field, maximum width, format, extension
+DERIVATIVES = (
+    ('thumbnail', 320, 'JPEG', 'jpg'),
+    ('medium', 960, 'JPEG', 'jpg'),
+    ('webp', 960, 'WEBP', 'webp'),
+)
+QUALITY = 82
+
+
+def _encode(image, width, format):
+    copy = image.copy()
+    original_width, original_height = copy.size
+    if original_width > width:
+        copy.thumbnail(
+            (width, original_height * width // original_width + 1),
+            PILImage.LANCZOS)
+    if format == 'JPEG' and copy.mode not in ('RGB', 'L'):
+        copy = copy.convert('RGB')
+    buffer = BytesIO()
+    copy.save(buffer, format, quality=QUALITY, optimize=format == 'JPEG')
+    return buffer.getvalue()
+
+
+def generate(image_id, name, stale=()):
+    """
+    Write the derivatives of the file name and record them on the image,
+    unless its file was replaced meanwhile
+
+    Arguments:
+        image_id {int} -- the Image
+        name {str} -- storage name of its original file
+
+    Keyword Arguments:
+        stale {list} -- storage names of the derivatives of the file
+        name replaced, no longer referenced (default: {()})
+
+    Returns:
+        bool -- whether the image was updated
+    """
+    for derivative in stale:
+        default_storage.delete(derivative)
+    with default_storage.open(name) as source:
+        original = PILImage.open(source)
+        original.load()
+    stem = os.path.splitext(os.path.basename(name))[0]
+    fields = dict(zip(('width', 'height'), original.size))
+    for field, width, format, extension in DERIVATIVES:
+        try:
+            data = _encode(original, width, format)
+        except (KeyError, IOError, OSError):
+            # e.g. Pillow built without WebP
+            logger.warning('cannot encode %s as %s', name, format)
+            continue
+        fields[field] = default_storage.save(
+            'images/derivatives/{}_{}.{}'.format(stem, field, extension),
+            ContentFile(data))
+    # a new updated value also changes the render cache key of the item
+    updated = Image.objects.filter(id=image_id, file=name).update(
+        derived_from=name, updated=timezone.now(), **fields)
+    if updated:
+        fragments.invalidate_modules(Content.objects.filter(
+            content_type=ContentType.objects.get_for_model(Image),
+            object_id=image_id).values_list('module_id', flat=True))
+        versions.touch_items(Image, [image_id])
+    else:
+        for field, width, format, extension in DERIVATIVES:
+            if field in fields:
+                default_storage.delete(fields[field])
+    return bool(updated)
+
+
+def schedule(image):
+    if image.file and image.file.name != image.derived_from:
+        # an edited row is visible at once, with its previous file
+        workers.submit_for_row(
+            Image, image.id, generate, image.id, image.file.name,
+            getattr(image, 'stale_derivatives', ()), file=image.file.name)
@@ -0,0 +1,328 @@
+"""
+Bulk course import and cloning.
+
+Courses are read as dicts (one per JSONL line, or the items of a JSON
+array, both streamed by read_records()) of the form::
+
+    {"subject": "<subject slug>", "owner": "<username>",
+     "title": "...", "slug": "...", "overview": "...",
+     "modules": [
+         {"title": "...", "description": "...",
+          "contents": [
+              {"type": "text", "title": "...", "content": "..."},
+              {"type": "video", "title": "...", "url": "..."},
+              {"type": "image", "title": "...", "file": "images/..."},
+              {"type": "file", "title": "...", "file": "files/..."}]}]}
+
+Each batch of courses is written with one bulk_create per model (courses,
+modules, each content type, contents) with the order values assigned up
+front, so the cost does not grow with one query per row. Everything runs
+inside one transaction. bulk_create bypasses the model signals, so the
+counters, catalog and search index are updated here in bulk instead,
+and the video metadata and image derivatives are scheduled once the
+import has committed.
+"""
+import json
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import F, Max
+
+from . import catalog, images, search, videos
+from .models import Subject, Course, Module, Content
+from .models import Text, Video, Image, File
+
+ITEM_MODELS = {
+    'text': (Text, ('content',)),
+    'video': (Video, ('url',)),
+    'image': (Image, ('file',)),
+    'file': (File, ('file',)),
+}
+
+
+class CourseImportError(Exception):
+    pass
+
+
+class ImportStats(object):
+
+    def __init__(self):
+        self.courses = 0
+        self.modules = 0
+        self.items = 0
+        self.seconds = 0.0
+
+    @property
+    def items_per_second(self):
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            '{} courses, {} modules, {} items in {:.2f}s '
+            '({:.0f} items/s)'.format(
+                self.courses, self.modules, self.items, self.seconds,
+                self.items_per_second))
+
+
+def _array_records(dump, chunk_size):
+    """
+    The items of the JSON array in dump, decoded one at a time from
+    chunks of chunk_size characters
+    """
+    decoder = json.JSONDecoder()
+    # the characters accepted where no record may start
+    punctuation = {'open': '[', 'first': ']', 'separator': ',]'}
+    buffer, position, expect = '', 0, 'open'
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position == len(buffer):
+            buffer, position = dump.read(chunk_size), 0
+            if not buffer:
+                raise ValueError('unterminated JSON array')
+            continue
+        char = buffer[position]
+        if expect in ('open', 'separator') or (
+                expect == 'first' and char == ']'):
+            if char not in punctuation[expect]:
+                raise ValueError('malformed JSON array at {!r}'.format(
+                    buffer[position:position + 20]))
+            if char == ']':
+                return
+            expect = 'first' if char == '[' else 'record'
+            position += 1
+            continue
+        try:
+            record, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            chunk = dump.read(chunk_size)
+            if not chunk:
+                raise
+            # the record goes on in the next chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield record
+        expect = 'separator'
+
+
+def read_records(path, chunk_size=1 << 16):
+    """
+    Course records from a JSON array file or from a JSONL file, both
+    streamed: only the record being decoded is held in memory
+    """
+    with open(path) as dump:
+        first = dump.read(1)
+        while first.isspace():
+            first = dump.read(1)
+        dump.seek(0)
+        if first == '[':
+            for record in _array_records(dump, chunk_size):
+                yield record
+        else:
+            for line in dump:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _bulk_create_with_ids(model, objs):
+    """
+    bulk_create objs and set their primary keys, which Django does not
+    do. The new rows are the ones above the previous maximum id, so no
+    other transaction may insert into the table meanwhile: PostgreSQL
+    takes a table lock held until the import commits (reads go on),
+    SQLite already lets one transaction write at a time. Their number is
+    checked too, so a writer on another database aborts the import
+    instead of mixing ids up.
+    """
+    if not objs:
+        return
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE'.format(
+                connection.ops.quote_name(model._meta.db_table)))
+    last = model.objects.aggregate(last=Max('id'))['last'] or 0
+    model.objects.bulk_create(objs)
+    ids = list(model.objects.filter(
+        id__gt=last).order_by('id').values_list('id', flat=True))
+    if len(ids) != len(objs):
+        raise CourseImportError(
+            'concurrent inserts into {} during the import'.format(
+                model._meta.db_table))
+    for obj, id in zip(objs, ids):
+        obj.id = id
+
+
+class CourseImporter(object):
+    """
+    Arguments:
+        batch_size {int} -- courses written per round of bulk_create
+        owner {User} -- owner of every imported course and item,
+        overriding the "owner" of the records (default: {None})
+    """
+
+    def __init__(self, batch_size=100, owner=None):
+        self.batch_size = batch_size
+        self.owner = owner
+        self.subjects = {}
+        self.owners = {}
+        self.created = defaultdict(list)
+
+    def get_subject(self, slug):
+        if slug not in self.subjects:
+            try:
+                self.subjects[slug] = Subject.objects.get(slug=slug)
+            except Subject.DoesNotExist:
+                raise CourseImportError('unknown subject "{}"'.format(slug))
+        return self.subjects[slug]
+
+    def get_owner(self, username):
+        if self.owner is not None:
+            return self.owner
+        if username not in self.owners:
+            try:
+                self.owners[username] = User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CourseImportError('unknown owner "{}"'.format(username))
+        return self.owners[username]
+
+    def run(self, records):
+        """
+        Import an iterable of course records
+
+        Returns:
+            ImportStats -- what was imported and how fast
+        """
+        stats = ImportStats()
+        started = time.time()
+        records = iter(records)
+        self.created = defaultdict(list)
+        with transaction.atomic():
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                self.import_batch(batch, stats)
+        catalog.invalidate()
+        # what post_save would have scheduled for each item
+        for video in self.created[Video]:
+            videos.schedule(video)
+        for image in self.created[Image]:
+            images.schedule(image)
+        stats.seconds = time.time() - started
+        return stats
+
+    def import_batch(self, records, stats):
+        courses = []
+        for record in records:
+            courses.append(Course(
+                owner=self.get_owner(record.get('owner')),
+                subject=self.get_subject(record['subject']),
+                title=record['title'],
+                slug=record['slug'],
+                overview=record.get('overview', ''),
+                total_modules=len(record.get('modules', [])),
+                total_contents=sum(
+                    len(module.get('contents', []))
+                    for module in record.get('modules', []))))
+        _bulk_create_with_ids(Course, courses)
+
+        modules = []
+        module_contents = []
+        for course, record in zip(courses, records):
+            for order, data in enumerate(record.get('modules', [])):
+                modules.append(Module(
+                    course=course, order=order, title=data['title'],
+                    description=data.get('description', '')))
+                module_contents.append(data.get('contents', []))
+        _bulk_create_with_ids(Module, modules)
+
+        items = defaultdict(list)
+        placements = []
+        for module, contents in zip(modules, module_contents):
+            for order, data in enumerate(contents):
+                try:
+                    model, fields = ITEM_MODELS[data['type']]
+                except KeyError:
+                    raise CourseImportError(
+                        'unknown content type "{}"'.format(data.get('type')))
+                item = model(owner=module.course.owner, title=data['title'])
+                for field in fields:
+                    setattr(item, field, data[field])
+                items[model].append(item)
+                placements.append((module, order, item))
+        for model, objs in items.items():
+            _bulk_create_with_ids(model, objs)
+            if model in (Video, Image):
+                self.created[model].extend(objs)
+
+        content_types = dict(
+            (model, ContentType.objects.get_for_model(model))
+            for model in items)
+        Content.objects.bulk_create([
+            Content(
+                module=module, order=order,
+                content_type=content_types[type(item)], object_id=item.id)
+            for module, order, item in placements])
+
+        per_subject = defaultdict(int)
+        for course in courses:
+            per_subject[course.subject_id] += 1
+        for subject_id, count in per_subject.items():
+            Subject.objects.filter(id=subject_id).update(
+                total_courses=F('total_courses') + count)
+
+        self.index(courses, modules, items.get(Text, []), placements)
+        stats.courses += len(courses)
+        stats.modules += len(modules)
+        stats.items += len(placements)
+
+    def index(self, courses, modules, texts, placements):
+        course_type = ContentType.objects.get_for_model(Course)
+        module_type = ContentType.objects.get_for_model(Module)
+        text_type = ContentType.objects.get_for_model(Text)
+        text_courses = dict(
+            (item.id, module.course_id)
+            for module, order, item in placements
+            if isinstance(item, Text))
+        search.index_documents(
+            [(course_type, c.id, c.id, c.title, c.overview)
+             for c in courses] +
+            [(module_type, m.id, m.course_id, m.title, m.description)
+             for m in modules] +
+            [(text_type, t.id, text_courses[t.id], t.title, t.content)
+             for t in texts])
+
+
+def export_course(course):
+    """
+    A course as an import record (see the module docstring), e.g. to
+    clone it. Image and file contents keep pointing at the same files.
+    """
+    modules = []
+    for module in course.modules.prefetch_related('contents__item'):
+        contents = []
+        for content in module.contents.all():
+            item = content.item
+            if item is None:
+                continue
+            model_name = item._meta.model_name
+            data = {'type': model_name, 'title': item.title}
+            for field in ITEM_MODELS[model_name][1]:
+                value = getattr(item, field)
+                data[field] = getattr(value, 'name', value)
+            contents.append(data)
+        modules.append({
+            'title': module.title,
+            'description': module.description,
+            'contents': contents})
+    return {
+        'subject': course.subject.slug,
+        'owner': course.owner.username,
+        'title': course.title,
+        'slug': course.slug,
+        'overview': course.overview,
+        'modules': modules}
@@ -0,0 +1,353 @@
+"""
+Per-request instrumentation.
+
+RequestStatsMiddleware, listed first in MIDDLEWARE_CLASSES, records for
+every request, keyed by its resolved URL name (e.g. "course_detail" or
+"api:course-list"):
+
+* the number and duration of the SQL queries,
+* the time spent rendering templates,
+* the hits and misses of the cached read paths (courses.cache.stats),
+* the total latency, in a fixed-bucket histogram.
+
+Per request the cost is two clock reads per query and template, and one
+lock acquisition to fold the request into the in-process aggregates.
+Every PUBLISH_INTERVAL seconds each process copies its aggregates to the
+cache, where the request_stats command and RequestStatsView merge the
+ones of all processes. A process finds its place in the cache with an
+incremented slot number, so processes starting together never overwrite
+each other's registration; the slots of processes that went away expire
+with their aggregates. The latency of streaming responses only covers
+the view, not the streamed body.
+
+The middleware is not enabled by default; see the README for the
+MIDDLEWARE_CLASSES entry and the measured overhead.
+"""
+import bisect
+import os
+import socket
+import threading
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.utils import CursorWrapper, CursorDebugWrapper
+from django.template.backends.django import Template
+
+from .cache import stats as cache_stats
+
+# upper bounds of the latency buckets, in milliseconds
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+SLOTS_KEY = 'instrumentation:slots'
+FIRST_SLOT_KEY = 'instrumentation:first-slot'
+COUNTERS = (
+    'requests', 'latency', 'queries', 'max_queries', 'sql_time',
+    'template_time', 'cache_hits', 'cache_misses')
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+# (pid, slot) of this process
+_slot = None
+
+
+class RequestRecord(object):
+    """
+    What the current request has spent so far
+    """
+    __slots__ = (
+        'queries', 'sql_time', 'template_time', 'template_depth',
+        'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def current():
+    return getattr(_local, 'record', None)
+
+
+class TimingMixin(object):
+
+    def execute(self, sql, params=None):
+        record = current()
+        if record is None:
+            return super(TimingMixin, self).execute(sql, params)
+        started = perf_counter()
+        try:
+            return super(TimingMixin, self).execute(sql, params)
+        finally:
+            record.queries += 1
+            record.sql_time += perf_counter() - started
+
+    def executemany(self, sql, param_list):
+        record = current()
+        if record is None:
+            return super(TimingMixin, self).executemany(sql, param_list)
+        started = perf_counter()
+        try:
+            return super(TimingMixin, self).executemany(sql, param_list)
+        finally:
+            record.queries += 1
+            record.sql_time += perf_counter() - started
+
+
+class TimedCursorWrapper(TimingMixin, CursorWrapper):
+    pass
+
+
+class TimedCursorDebugWrapper(TimingMixin, CursorDebugWrapper):
+    pass
+
+
+def instrument(connection):
+    """
+    Make the cursors of connection time their queries
+    """
+    if getattr(connection, '_request_stats', False):
+        return
+    connection.make_cursor = \
+        lambda cursor: TimedCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = \
+        lambda cursor: TimedCursorDebugWrapper(cursor, connection)
+    connection._request_stats = True
+
+
+def _render(render):
+    def timed_render(self, context=None, request=None):
+        record = current()
+        if record is None or record.template_depth:
+            # nested renders are part of the outer one
+            return render(self, context, request)
+        record.template_depth += 1
+        started = perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            record.template_depth -= 1
+            record.template_time += perf_counter() - started
+    return timed_render
+
+
+def _count_cache(namespace, hits, misses):
+    record = current()
+    if record is not None:
+        record.cache_hits += hits
+        record.cache_misses += misses
+
+
+def install():
+    """
+    Hook the template renders and the cache counters, once per process
+    """
+    global _installed
+    with _install_lock:
+        if not _installed:
+            Template.render = _render(Template.render)
+            cache_stats.listeners.append(_count_cache)
+            _installed = True
+
+
+def percentile(histogram, fraction):
+    """
+    Upper bound, in milliseconds, of the bucket holding the given
+    fraction of the requests (None past the last bucket)
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    seen = 0
+    for bound, count in zip(BUCKETS + (None,), histogram):
+        seen += count
+        if seen >= fraction * total:
+            return bound
+    return None
+
+
+class RequestStats(object):
+    """
+    Thread-safe aggregates per URL name
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, name, latency, record):
+        bucket = bisect.bisect_left(BUCKETS, latency * 1000)
+        with self._lock:
+            row = self._views.get(name)
+            if row is None:
+                row = self._views[name] = {
+                    'counters': [0] * len(COUNTERS),
+                    'histogram': [0] * (len(BUCKETS) + 1)}
+            counters = row['counters']
+            counters[0] += 1
+            counters[1] += latency
+            counters[2] += record.queries
+            counters[3] = max(counters[3], record.queries)
+            counters[4] += record.sql_time
+            counters[5] += record.template_time
+            counters[6] += record.cache_hits
+            counters[7] += record.cache_misses
+            row['histogram'][bucket] += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            dict -- {url name: {'counters': [...], 'histogram': [...]}},
+            the counters in COUNTERS order
+        """
+        with self._lock:
+            return dict(
+                (name, {'counters': list(row['counters']),
+                        'histogram': list(row['histogram'])})
+                for name, row in self._views.items())
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+requests = RequestStats()
+
+
+def merge(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, row in snapshot.items():
+            if name not in merged:
+                merged[name] = {
+                    'counters': list(row['counters']),
+                    'histogram': list(row['histogram'])}
+                continue
+            counters = merged[name]['counters']
+            for i, value in enumerate(row['counters']):
+                counters[i] = max(counters[i], value) if \
+                    COUNTERS[i] == 'max_queries' else counters[i] + value
+            merged[name]['histogram'] = [
+                a + b for a, b in zip(
+                    merged[name]['histogram'], row['histogram'])]
+    return merged
+
+
+def summarize(snapshot):
+    """
+    Averages and latency percentiles of a snapshot
+
+    Returns:
+        dict -- {url name: {'requests', 'avg_ms', 'p50_ms', 'p95_ms',
+        'p99_ms', 'avg_queries', 'max_queries', 'avg_sql_ms',
+        'avg_template_ms', 'cache_hits', 'cache_misses'}}
+    """
+    summary = {}
+    for name, row in snapshot.items():
+        counters = dict(zip(COUNTERS, row['counters']))
+        count = counters['requests'] or 1
+        summary[name] = {
+            'requests': counters['requests'],
+            'avg_ms': counters['latency'] * 1000 / count,
+            'p50_ms': percentile(row['histogram'], 0.5),
+            'p95_ms': percentile(row['histogram'], 0.95),
+            'p99_ms': percentile(row['histogram'], 0.99),
+            'avg_queries': float(counters['queries']) / count,
+            'max_queries': counters['max_queries'],
+            'avg_sql_ms': counters['sql_time'] * 1000 / count,
+            'avg_template_ms': counters['template_time'] * 1000 / count,
+            'cache_hits': counters['cache_hits'],
+            'cache_misses': counters['cache_misses'],
+        }
+    return summary
+
+
+def _publish_interval():
+    return getattr(settings, 'REQUEST_STATS_PUBLISH_INTERVAL', 10)
+
+
+def _process_key():
+    return 'instrumentation:process:{}:{}'.format(
+        socket.gethostname(), os.getpid())
+
+
+def _slot_key(slot):
+    return 'instrumentation:slot:{}'.format(slot)
+
+
+def _process_slot():
+    """
+    The slot of this process, taken again when collect() skipped it or
+    the cache lost the slot numbers
+    """
+    global _slot
+    pid = os.getpid()
+    found = cache.get_many([FIRST_SLOT_KEY, SLOTS_KEY])
+    if _slot is None or _slot[0] != pid or not (
+            found.get(FIRST_SLOT_KEY, 1) <= _slot[1] <=
+            found.get(SLOTS_KEY, 0)):
+        try:
+            slot = cache.incr(SLOTS_KEY)
+        except ValueError:
+            cache.add(SLOTS_KEY, 0, None)
+            slot = cache.incr(SLOTS_KEY)
+        _slot = (pid, slot)
+    return _slot[1]
+
+
+def publish():
+    """
+    Copy the aggregates of this process to the cache
+    """
+    key = _process_key()
+    timeout = _publish_interval() * 30
+    cache.set(key, requests.snapshot(), timeout)
+    cache.set(_slot_key(_process_slot()), key, timeout)
+
+
+def collect():
+    """
+    Returns:
+        dict -- the merged snapshot of every process that published
+    """
+    first = cache.get(FIRST_SLOT_KEY, 1)
+    slots = range(first, cache.get(SLOTS_KEY, 0) + 1)
+    keys = cache.get_many([_slot_key(slot) for slot in slots])
+    live = [slot for slot in slots if _slot_key(slot) in keys]
+    first_live = live[0] if live else first + len(slots)
+    if first_live > first:
+        # skip the expired slots of the processes that went away
+        cache.set(FIRST_SLOT_KEY, first_live, None)
+    return merge(cache.get_many(list(keys.values())).values())
+
+
+class RequestStatsMiddleware(object):
+
+    def __init__(self):
+        install()
+        self.published = perf_counter()
+
+    def process_request(self, request):
+        for connection in connections.all():
+            instrument(connection)
+        _local.record = RequestRecord()
+        request._stats_started = perf_counter()
+
+    def process_response(self, request, response):
+        record = current()
+        started = getattr(request, '_stats_started', None)
+        if record is None or started is None:
+            return response
+        _local.record = None
+        match = getattr(request, 'resolver_match', None)
+        requests.record(
+            match.view_name if match else '<unresolved>',
+            perf_counter() - started, record)
+        now = perf_counter()
+        if now - self.published > _publish_interval():
+            self.published = now
+            publish()
+        return response
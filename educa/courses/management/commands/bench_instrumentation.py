@@ -0,0 +1,127 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse, resolve
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.http import HttpResponse
+from django.template import engines
+from django.test import Client, RequestFactory
+from django.test.utils import modify_settings
+
+from courses import instrumentation
+from courses.models import Course
+
+MIDDLEWARE = 'courses.instrumentation.RequestStatsMiddleware'
+
+
+def per_call(fn, count):
+    """
+    Returns:
+        float -- seconds per call of fn, best of five runs
+    """
+    best = None
+    for run in range(5):
+        started = time.perf_counter()
+        for i in range(count):
+            fn()
+        seconds = (time.perf_counter() - started) / count
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the per-request overhead of RequestStatsMiddleware on a '
+        'database seeded with seed_benchmark. Whole requests vary by more '
+        'than the overhead, so what the middleware adds is timed on its '
+        'own (per request, per query, per template render) and set '
+        'against the latency and query count of each path.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='requests per path')
+        parser.add_argument('--calls', type=int, default=20000,
+                            help='calls per micro-benchmark')
+        parser.add_argument('--prefix', default='bench')
+
+    def handle(self, *args, **options):
+        course = Course.objects.filter(
+            slug__startswith=options['prefix'] + '-').order_by('id').first()
+        if course is None:
+            raise CommandError(
+                'no seeded courses, run seed_benchmark first')
+        paths = [
+            reverse('course_detail', args=[course.slug]),
+            reverse('api:course-list')]
+        host = next(
+            (host.lstrip('.') for host in settings.ALLOWED_HOSTS
+             if host != '*'), 'localhost')
+
+        with modify_settings(MIDDLEWARE_CLASSES={'prepend': MIDDLEWARE}):
+            client = Client(HTTP_HOST=host)
+            for path in paths:
+                # warm the caches
+                client.get(path)
+        instrumentation.requests.reset()
+        for path in paths:
+            for i in range(options['requests']):
+                response = client.get(path)
+                if response.status_code != 200:
+                    raise CommandError('{} returned {}'.format(
+                        path, response.status_code))
+        summary = instrumentation.summarize(
+            instrumentation.requests.snapshot())
+        costs = self.costs(options['calls'])
+
+        self.stdout.write(
+            'added per request {:.1f}us, per query {:.2f}us, per render '
+            '{:.2f}us'.format(*(cost * 1e6 for cost in costs)))
+        self.stdout.write('{:<28} {:>8} {:>8} {:>9} {:>9}'.format(
+            'path', 'avg_ms', 'queries', 'added_us', 'overhead'))
+        for path in paths:
+            row = summary[resolve(path).view_name]
+            # only the outermost render of a request is timed
+            added = costs[0] + costs[1] * row['avg_queries'] + costs[2]
+            self.stdout.write(
+                '{:<28} {:>8.2f} {:>8.1f} {:>9.1f} {:>8.2f}%'.format(
+                    path, row['avg_ms'], row['avg_queries'], added * 1e6,
+                    added * 1000 / row['avg_ms'] * 100))
+
+    def costs(self, calls):
+        """
+        Returns:
+            tuple -- seconds added per request, per query and per
+            template render
+        """
+        middleware = instrumentation.RequestStatsMiddleware()
+        request = RequestFactory().get('/')
+        request.resolver_match = resolve(reverse('course_list'))
+        response = HttpResponse()
+
+        def request_cycle():
+            middleware.process_request(request)
+            middleware.process_response(request, response)
+        request_cost = per_call(request_cycle, calls)
+        instrumentation.requests.reset()
+
+        connection.ensure_connection()
+        raw = connection.connection.cursor()
+        plain = CursorWrapper(raw, connection)
+        timed = instrumentation.TimedCursorWrapper(raw, connection)
+        template = engines['django'].from_string('{{ value }}')
+
+        def render():
+            template.render({'value': 1})
+        # renders outside a recorded request skip the timing
+        untimed_render = per_call(render, calls)
+        instrumentation._local.record = instrumentation.RequestRecord()
+        try:
+            query_cost = (
+                per_call(lambda: timed.execute('SELECT 1'), calls) -
+                per_call(lambda: plain.execute('SELECT 1'), calls))
+            render_cost = per_call(render, calls) - untimed_render
+        finally:
+            instrumentation._local.record = None
+        return request_cost, max(query_cost, 0), max(render_cost, 0)
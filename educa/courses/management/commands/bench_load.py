@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from courses import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive concurrent HTTP traffic at a running server seeded with '
+        'seed_benchmark and report throughput and latency percentiles '
+        'per scenario.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='simulated clients per scenario')
+        parser.add_argument('--duration', type=float, default=20.0,
+                            help='measured seconds per scenario')
+        parser.add_argument('--warmup', type=float, default=3.0,
+                            help='unmeasured seconds before each scenario')
+        parser.add_argument(
+            '--scenario', action='append', choices=benchmarks.SCENARIOS,
+            help='scenario to run, repeatable (default: all)')
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--output', help='write the results as JSON')
+        parser.add_argument(
+            '--compare', help='results JSON of a previous run to compare')
+
+    def handle(self, *args, **options):
+        learners = benchmarks.learners(
+            options['prefix'], options['concurrency'])
+        if len(learners) < options['concurrency']:
+            raise CommandError(
+                'not enough seeded students, run seed_benchmark first')
+        previous = benchmarks.load(options['compare']) \
+            if options['compare'] else None
+
+        results = {
+            'commit': benchmarks.commit(),
+            'created': timezone.now().isoformat(),
+            'options': dict(
+                (key, options[key]) for key in (
+                    'base_url', 'concurrency', 'duration', 'warmup')),
+            'dataset': benchmarks.dataset(options['prefix']),
+            'scenarios': {},
+        }
+        for name in options['scenario'] or benchmarks.SCENARIOS:
+            scenario = benchmarks.Scenario(
+                name, options['prefix'], options['password'])
+            summary = benchmarks.run(
+                scenario, options['base_url'], learners,
+                options['duration'], options['warmup'])
+            results['scenarios'][name] = summary
+            self.stdout.write(
+                '{}: {:.1f} req/s, p50 {:.1f} p95 {:.1f} p99 {:.1f} ms, '
+                '{} errors'.format(
+                    name, summary['throughput'], summary.get('p50_ms', 0),
+                    summary.get('p95_ms', 0), summary.get('p99_ms', 0),
+                    summary['errors']))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if previous:
+            for line in benchmarks.compare(previous, results):
+                self.stdout.write(line)
@@ -0,0 +1,84 @@
+import random
+import time
+from bisect import bisect
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from courses import search
+from courses.benchmarks import percentile
+from courses.models import Subject, Course
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure search latency on a synthetic corpus with a Zipf-like '
+        'vocabulary. The corpus is built in a transaction that is rolled '
+        'back, so the database is left untouched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=100000)
+        parser.add_argument('--words', type=int, default=40,
+                            help='words per document')
+        parser.add_argument('--vocabulary', type=int, default=20000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--p95-target', type=float, default=100.0,
+                            help='p95 latency target in milliseconds')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = [
+            'term{}'.format(i) for i in range(options['vocabulary'])]
+        weights = list(accumulate(
+            1.0 / rank for rank in range(1, len(vocabulary) + 1)))
+
+        def words(count):
+            return ' '.join(
+                vocabulary[bisect(weights, rng.random() * weights[-1])]
+                for _ in range(count))
+
+        with transaction.atomic():
+            owner = User.objects.create(username='bench-search-owner')
+            subject = Subject.objects.create(
+                title='Benchmark', slug='bench-search-subject')
+            course = Course.objects.create(
+                owner=owner, subject=subject, title='Benchmark',
+                slug='bench-search-course', overview='')
+            content_type = ContentType.objects.get_for_model(Course)
+
+            started = time.time()
+            batch = []
+            for i in range(options['documents']):
+                batch.append((
+                    content_type, course.id + 1 + i, course.id,
+                    words(4), words(options['words'])))
+                if len(batch) == 5000:
+                    search.index_documents(batch)
+                    batch = []
+            search.index_documents(batch)
+            self.stdout.write('indexed {} documents in {:.1f}s'.format(
+                options['documents'], time.time() - started))
+
+            timings = []
+            for i in range(options['queries']):
+                query = words(rng.randint(1, 3))
+                started = time.time()
+                search.search(query)
+                timings.append((time.time() - started) * 1000)
+            transaction.set_rollback(True)
+        cache.delete(search.STATS_KEY)
+
+        p95 = percentile(timings, 0.95)
+        self.stdout.write(
+            'queries: {}  p50: {:.1f}ms  p95: {:.1f}ms  p99: {:.1f}ms  '
+            'max: {:.1f}ms'.format(
+                len(timings), percentile(timings, 0.5), p95,
+                percentile(timings, 0.99), max(timings)))
+        if p95 > options['p95_target']:
+            raise CommandError('p95 {:.1f}ms is above the {:.1f}ms target'.format(
+                p95, options['p95_target']))
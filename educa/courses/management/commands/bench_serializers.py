@@ -0,0 +1,101 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from courses.api.compact import FieldPlan
+from courses.api.serializers import SubjectSerializer, CourseSerializer
+from courses.models import Subject, Course, Module
+
+PREFIX = 'bench-serializers-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the API serializers with the compact .values() path on '
+        'synthetic subjects and courses, checking both render the same '
+        'JSON. The rows are created in a transaction that is rolled back, '
+        'so the database is left untouched. On SQLite, 100,000 rows need '
+        'a build allowing that many query parameters (Debian\'s allows '
+        '250,000).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--modules', type=int, default=3,
+                            help='modules per course')
+        parser.add_argument('--students', type=int, default=2,
+                            help='students enrolled in every course')
+
+    def handle(self, *args, **options):
+        self.renderer = JSONRenderer()
+        self.stdout.write('{:>8} {:<14} {:>11} {:>11} {:>8}'.format(
+            'rows', 'list', 'serializer', 'compact', 'speedup'))
+        for rows in options['rows']:
+            with transaction.atomic():
+                self.populate(rows, options['modules'], options['students'])
+                subjects = Subject.objects.filter(
+                    slug__startswith=PREFIX).order_by('title', 'id')
+                self.compare(
+                    rows, 'subjects', SubjectSerializer, {}, subjects,
+                    subjects)
+                # bulk_create can give several courses the same created
+                courses = Course.objects.filter(
+                    slug__startswith=PREFIX).order_by('-created', '-id')
+                for students in ('list', 'count'):
+                    models = courses.select_related(
+                        'owner', 'subject').prefetch_related('modules')
+                    if students == 'list':
+                        models = models.prefetch_related(Prefetch(
+                            'students', queryset=User.objects.only('id')))
+                    self.compare(
+                        rows, 'courses/{}'.format(students), CourseSerializer,
+                        {'students': students}, models, courses)
+                transaction.set_rollback(True)
+
+    def populate(self, rows, modules, students):
+        owner = User.objects.create(username=PREFIX + 'owner')
+        Subject.objects.bulk_create([
+            Subject(title='Subject {}'.format(i), slug=PREFIX + str(i))
+            for i in range(rows)], batch_size=500)
+        subject = Subject.objects.get(slug=PREFIX + '0')
+        Course.objects.bulk_create([
+            Course(owner=owner, subject=subject, title='Course {}'.format(i),
+                   slug=PREFIX + str(i), overview='Overview')
+            for i in range(rows)], batch_size=500)
+        course_ids = list(Course.objects.filter(
+            slug__startswith=PREFIX).values_list('id', flat=True))
+        Module.objects.bulk_create([
+            Module(course_id=course_id, order=order,
+                   title='Module {}'.format(order), description='')
+            for course_id in course_ids for order in range(modules)],
+            batch_size=500)
+        users = []
+        for i in range(students):
+            users.append(User.objects.create(
+                username=PREFIX + 'student-{}'.format(i)))
+        Enrollment = Course.students.through
+        Enrollment.objects.bulk_create([
+            Enrollment(course_id=course_id, user_id=user.id)
+            for course_id in course_ids for user in users], batch_size=500)
+
+    def compare(self, rows, name, serializer_class, context, models, values):
+        started = time.time()
+        expected = self.renderer.render(serializer_class(
+            models, many=True, context=context).data)
+        serializer_seconds = time.time() - started
+
+        started = time.time()
+        plan = FieldPlan.for_serializer(serializer_class, context)
+        rendered = self.renderer.render(plan.represent(plan.values(values)))
+        compact_seconds = time.time() - started
+
+        if rendered != expected:
+            raise CommandError('{}: the compact JSON differs at {} rows'.format(
+                name, rows))
+        self.stdout.write('{:>8} {:<14} {:>10.3f}s {:>10.3f}s {:>7.1f}x'.format(
+            rows, name, serializer_seconds, compact_seconds,
+            serializer_seconds / compact_seconds if compact_seconds else 0))
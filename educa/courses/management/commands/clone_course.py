@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.importer import CourseImporter, CourseImportError
+from courses.importer import export_course
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy a course with all its modules and contents under a new '
+        'slug. Image and file contents share the original files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('slug')
+        parser.add_argument('--title')
+        parser.add_argument('--owner',
+                            help='username owning the copy')
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.select_related(
+                'owner', 'subject').get(id=options['course_id'])
+        except Course.DoesNotExist:
+            raise CommandError('no course {}'.format(options['course_id']))
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError('unknown user "{}"'.format(options['owner']))
+        record = export_course(course)
+        record['slug'] = options['slug']
+        if options['title']:
+            record['title'] = options['title']
+        try:
+            stats = CourseImporter(owner=owner).run([record])
+        except CourseImportError as e:
+            raise CommandError('clone failed: {}'.format(e))
+        self.stdout.write(str(stats))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from courses import images
+from courses.models import Image
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate the missing thumbnail, medium and WebP derivatives of '
+        'image contents, e.g. after a bulk import.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='regenerate the derivatives of every image')
+
+    def handle(self, *args, **options):
+        queryset = Image.objects.exclude(file='')
+        if not options['all']:
+            queryset = queryset.exclude(derived_from=F('file'))
+        done = failed = 0
+        for image_id, name in queryset.values_list('id', 'file').iterator():
+            try:
+                images.generate(image_id, name)
+            except (IOError, OSError) as e:
+                failed += 1
+                self.stderr.write('{}: {}'.format(name, e))
+            else:
+                done += 1
+        self.stdout.write('{} images processed, {} failed'.format(
+            done, failed))
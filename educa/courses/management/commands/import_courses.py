@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.importer import CourseImporter, CourseImportError, read_records
+
+
+class Command(BaseCommand):
+    help = 'Import courses from a JSON or JSONL dump with bulk inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='courses per round of bulk inserts')
+        parser.add_argument('--owner',
+                            help='username owning every imported course')
+
+    def handle(self, *args, **options):
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError('unknown user "{}"'.format(options['owner']))
+        importer = CourseImporter(options['batch_size'], owner)
+        try:
+            stats = importer.run(read_records(options['path']))
+        except (CourseImportError, KeyError, ValueError) as e:
+            raise CommandError('import failed, nothing was saved: {}'.format(e))
+        self.stdout.write(str(stats))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from courses import catalog, counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the module, student and course counters of courses '
+        'and subjects and repair the rows that drifted.')
+
+    def handle(self, *args, **options):
+        repaired = counters.recount_all()
+        for counter, rows in sorted(repaired.items()):
+            self.stdout.write('{}: {} rows repaired'.format(counter, rows))
+        if any(repaired.values()):
+            catalog.invalidate()
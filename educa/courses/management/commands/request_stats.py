@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from courses import instrumentation
+
+COLUMNS = (
+    ('requests', '{}'), ('avg_ms', '{:.1f}'), ('p95_ms', '{}'),
+    ('avg_queries', '{:.1f}'), ('max_queries', '{}'),
+    ('avg_sql_ms', '{:.1f}'), ('avg_template_ms', '{:.1f}'),
+    ('cache_hits', '{}'), ('cache_misses', '{}'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Show the per-URL query, template, cache and latency aggregates '
+        'published by the RequestStatsMiddleware of every process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json', action='store_true', help='print the raw summary')
+        parser.add_argument(
+            '--sort', default='avg_ms',
+            choices=[column for column, template in COLUMNS],
+            help='column to sort by, descending (default: avg_ms)')
+
+    def handle(self, *args, **options):
+        summary = instrumentation.summarize(instrumentation.collect())
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2, sort_keys=True))
+            return
+        if not summary:
+            self.stdout.write('no requests recorded')
+            return
+        width = max(len(name) for name in summary)
+        self.stdout.write('  '.join(
+            [' ' * width] + [column for column, template in COLUMNS]))
+        rows = sorted(
+            summary.items(),
+            key=lambda item: item[1][options['sort']] or 0, reverse=True)
+        for name, row in rows:
+            self.stdout.write('  '.join(
+                [name.ljust(width)] +
+                [(template.format(row[column])
+                  if row[column] is not None else '-').rjust(len(column))
+                 for column, template in COLUMNS]))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from courses import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index from scratch.'
+
+    def handle(self, *args, **options):
+        documents = search.rebuild()
+        self.stdout.write('{} documents indexed'.format(documents))
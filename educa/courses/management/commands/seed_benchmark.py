@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from courses import catalog
+from courses.models import Subject, Course
+from courses.tests import seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed N courses and M students for the load benchmarks '
+        '(see bench_load).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=200)
+        parser.add_argument('--modules', type=int, default=6,
+                            help='modules per course')
+        parser.add_argument('--contents', type=int, default=8,
+                            help='contents per module')
+        parser.add_argument('--students', type=int, default=5000)
+        parser.add_argument('--enrollments', type=int, default=3,
+                            help='courses per student')
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--password', default='password')
+        parser.add_argument(
+            '--replace', action='store_true',
+            help='delete the data seeded before with the same prefix')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        users = User.objects.filter(username__startswith=prefix + '-')
+        with transaction.atomic():
+            if users.exists():
+                if not options['replace']:
+                    raise CommandError(
+                        'data with prefix "{}" exists, use --replace'.format(
+                            prefix))
+                Course.objects.filter(
+                    slug__startswith=prefix + '-').delete()
+                Subject.objects.filter(
+                    slug__startswith=prefix + '-').delete()
+                users.delete()
+            seeded = seed.seed(
+                courses=options['courses'], modules=options['modules'],
+                contents=options['contents'], students=options['students'],
+                enrollments=options['enrollments'], prefix=prefix,
+                password=options['password'])
+        catalog.invalidate()
+        self.stdout.write('{} courses and {} students seeded'.format(
+            len(seeded.courses), len(seeded.students)))
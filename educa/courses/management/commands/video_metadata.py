@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from courses import videos
+from courses.models import Video
+
+
+class Command(BaseCommand):
+    help = (
+        'Resolve and store the provider metadata of video contents, '
+        'e.g. after a bulk import or for videos saved before it was '
+        'stored.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='resolve the metadata of every video again')
+
+    def handle(self, *args, **options):
+        queryset = Video.objects.exclude(url='')
+        if not options['all']:
+            queryset = queryset.exclude(resolved_from=F('url'))
+        done = failed = 0
+        for video_id, url in queryset.values_list('id', 'url').iterator():
+            if videos.resolve(video_id, url) == {}:
+                failed += 1
+                self.stderr.write('{}: no metadata'.format(url))
+            else:
+                done += 1
+        self.stdout.write('{} videos resolved, {} failed'.format(
+            done, failed))
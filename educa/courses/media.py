@@ -0,0 +1,153 @@
+"""
+Access-controlled serving of uploaded content files.
+
+Files are only handed out to the owner of the course they belong to and
+to its enrolled students. With the MEDIA_ACCEL_REDIRECT setting the
+transfer itself is left to nginx through an X-Accel-Redirect to the
+internal MEDIA_URL location of config/nginx.conf; otherwise (in
+development) the file is streamed by Django with byte ranges and
+conditional GETs.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+from . import conditional, enrollment
+from .models import Content
+
+# the file fields that can be served, per item model
+FIELDS = {
+    'file': ('file',),
+    'image': ('file', 'thumbnail', 'medium', 'webp'),
+}
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def can_access(user, item):
+    """
+    Arguments:
+        user {User} -- the requesting user
+        item {ItemBase} -- a file or image
+
+    Returns:
+        bool -- whether user owns the item or the course it belongs to,
+        or is enrolled in that course
+    """
+    if item.owner_id == user.id:
+        return True
+    placement = Content.objects.filter(
+        content_type=ContentType.objects.get_for_model(item),
+        object_id=item.id
+    ).values_list('module__course_id', 'module__course__owner_id').first()
+    if placement is None:
+        return False
+    course_id, owner_id = placement
+    return owner_id == user.id or enrollment.is_enrolled(user, course_id)
+
+
+def accel_response(name, content_type):
+    response = HttpResponse(content_type=content_type)
+    response['X-Accel-Redirect'] = '{}{}'.format(
+        getattr(settings, 'MEDIA_ACCEL_PREFIX', settings.MEDIA_URL), name)
+    return response
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length:
+            data = f.read(min(BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _byte_range(header, size):
+    """
+    The (start, end) of a single-range Range header, end included,
+    None for a header that is ignored and False when unsatisfiable
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # suffix range: the last n bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def file_response(request, path, content_type):
+    """
+    Stream the file at path, answering conditional GETs with 304 and
+    Range requests with 206
+
+    Arguments:
+        request {HttpRequest} -- the GET request
+        path {str} -- absolute path of the file
+        content_type {str} -- its media type
+
+    Returns:
+        HttpResponse -- the response
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = conditional.make_etag(
+        '{:x}'.format(int(stat.st_mtime)), '{:x}'.format(size))
+    last_modified = http_date(stat.st_mtime)
+
+    if conditional.not_modified(request, etag, stat.st_mtime):
+        response = HttpResponse(status=304)
+    else:
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if 'HTTP_RANGE' in request.META and if_range in (
+                None, etag, last_modified):
+            byte_range = _byte_range(request.META['HTTP_RANGE'], size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _read_range(path, start, end - start + 1),
+                status=206, content_type=content_type)
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(
+                start, end, size)
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(
+                open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    return conditional.set_validators(response, etag, stat.st_mtime)
+
+
+def serve(request, item, field):
+    """
+    Response delivering the file stored in field of item
+    """
+    name = getattr(item, field).name
+    content_type = mimetypes.guess_type(name)[0] or \
+        'application/octet-stream'
+    if getattr(settings, 'MEDIA_ACCEL_REDIRECT', False):
+        response = accel_response(name, content_type)
+    else:
+        response = file_response(
+            request, getattr(item, field).path, content_type)
+    if field == 'file' and item._meta.model_name == 'file':
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+            os.path.basename(name).replace('"', ''))
+    return response
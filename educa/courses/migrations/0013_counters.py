@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def count(apps, schema_editor):
+    Subject = apps.get_model('courses', 'Subject')
+    Course = apps.get_model('courses', 'Course')
+    Module = apps.get_model('courses', 'Module')
+    Enrollment = Course.students.through
+    courses = dict(
+        Course.objects.order_by().values_list(
+            'subject_id').annotate(models.Count('pk')))
+    modules = dict(
+        Module.objects.order_by().values_list(
+            'course_id').annotate(models.Count('pk')))
+    students = dict(
+        Enrollment.objects.order_by().values_list(
+            'course_id').annotate(models.Count('pk')))
+    for subject_id, total in courses.items():
+        Subject.objects.filter(id=subject_id).update(total_courses=total)
+    for course_id in set(modules) | set(students):
+        Course.objects.filter(id=course_id).update(
+            total_modules=modules.get(course_id, 0),
+            total_students=students.get(course_id, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_ordercounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='total_modules',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='total_students',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='total_courses',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0014_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('model_name', models.CharField(max_length=10, choices=[('file', 'File'), ('image', 'Image')])),
+                ('title', models.CharField(max_length=250)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('received', models.BigIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('content', models.OneToOneField(related_name='upload', null=True, blank=True, to='courses.Content', on_delete=django.db.models.deletion.SET_NULL)),
+                ('module', models.ForeignKey(related_name='uploads', to='courses.Module')),
+                ('owner', models.ForeignKey(related_name='uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='width',
+            field=models.PositiveIntegerField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='height',
+            field=models.PositiveIntegerField(null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail',
+            field=models.FileField(upload_to='images/derivatives', blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='medium',
+            field=models.FileField(upload_to='images/derivatives', blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='webp',
+            field=models.FileField(upload_to='images/derivatives', blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='derived_from',
+            field=models.CharField(max_length=100, blank=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def count(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Content = apps.get_model('courses', 'Content')
+    contents = dict(
+        Content.objects.order_by().values_list(
+            'module__course_id').annotate(models.Count('pk')))
+    for course_id, total in contents.items():
+        Course.objects.filter(id=course_id).update(total_contents=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0017_course_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='total_contents',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0019_video_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchposting',
+            name='term',
+            field=models.CharField(max_length=40),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchposting',
+            index_together=set([('term', 'frequency', 'length', 'document')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0020_search_posting_order'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='course',
+            index_together=set([('created', 'id')]),
+        ),
+    ]
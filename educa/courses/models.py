@@ -1,13 +1,84 @@
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
-from .fields import OrderField
+from .fields import OrderField, OrderedQuerySet
+from .cache import stats
 
 
-class Subject(models.Model):
+class CountersMixin(object):
+    """
+    Counter columns listed in counter_fields are maintained with F()
+    updates by courses.signals. Saving an existing instance leaves
+    them out, so a stale instance never overwrites a fresher count.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args and
+                not kwargs.get('force_insert') and
+                kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in self.counter_fields]
+        super(CountersMixin, self).save(*args, **kwargs)
+
+
+class CountedMixin(object):
+    """
+    Rows counted by the counter columns of other models. The save and
+    the courses.signals receivers updating those counters run in one
+    transaction. The values of moved_fields as loaded or last saved are
+    kept, so a move to another parent is counted without a query.
+    """
+    moved_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(CountedMixin, cls).from_db(db, field_names, values)
+        instance._saved_values = dict(
+            (name, value) for name, value in zip(field_names, values)
+            if name in cls.moved_fields)
+        return instance
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            if self.pk is not None:
+                self._read_saved_values(using)
+            super(CountedMixin, self).save(*args, **kwargs)
+        self._saved_values = dict(
+            (name, getattr(self, name)) for name in self.moved_fields)
+
+    def _read_saved_values(self, using):
+        # instances not loaded by a query, or with the fields deferred
+        saved = self.__dict__.setdefault('_saved_values', {})
+        missing = [name for name in self.moved_fields if name not in saved]
+        if missing:
+            row = type(self)._default_manager.using(using).filter(
+                pk=self.pk).values_list(*missing).first()
+            if row is not None:
+                saved.update(zip(missing, row))
+
+    def saved_value(self, name):
+        """
+        Arguments:
+            name {str} -- attribute name of one of moved_fields
+
+        Returns:
+            object -- its value before the current save, None when the
+            row is new
+        """
+        return getattr(self, '_saved_values', {}).get(name)
+
+
+class Subject(CountersMixin, models.Model):
     """[summary]
     Arguments:
         models {[django]} -- [inheritance]
@@ -16,6 +87,9 @@ class Subject(models.Model):
     """
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
+    total_courses = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('total_courses',)
 
     class Meta:
         ordering = ('title',)
@@ -24,7 +98,7 @@ class Subject(models.Model):
         return self.title
 
 
-class Course(models.Model):
+class Course(CountersMixin, CountedMixin, models.Model):
     """
     Course model that defines a complete course that is function
     of a subject.
@@ -37,20 +111,31 @@ class Course(models.Model):
     slug = models.SlugField(max_length=200, unique=True)
     overview = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    # also bumped by courses.versions when modules, contents or items
+    # change, see courses.signals
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     students = models.ManyToManyField(
         User,
         related_name='courses_enrolled',
         blank=True
     )
+    total_modules = models.PositiveIntegerField(default=0, editable=False)
+    total_students = models.PositiveIntegerField(default=0, editable=False)
+    total_contents = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('total_modules', 'total_students', 'total_contents')
+    moved_fields = ('subject_id',)
 
     class Meta:
         ordering = ('-created',)
+        # the API course list pages on (-created, -id)
+        index_together = ('created', 'id')
 
     def __str__(self):
         return self.title
 
 
-class Module(models.Model):
+class Module(CountedMixin, models.Model):
     """[summary]
     Arguments:
         models {[type]} -- [description]
@@ -58,7 +143,11 @@ class Module(models.Model):
     course = models.ForeignKey(Course, related_name='modules')
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    order = OrderField(blank=True, for_fields=['course'])
+    order = OrderField(blank=True, for_fields=['course'], counter=True)
+
+    objects = OrderedQuerySet.as_manager()
+
+    moved_fields = ('course_id',)
 
     class Meta:
         ordering = ['order']
@@ -67,7 +156,21 @@ class Module(models.Model):
         return '{}. {}'.format(self.order, self.title)
 
 
-class Content(models.Model):
+class ContentQuerySet(OrderedQuerySet):
+
+    def with_items(self):
+        """
+        Resolve the generic ``item`` of every content in one query per
+        content type (text, video, image, file) instead of one query
+        per content row.
+
+        Returns:
+            ContentQuerySet -- the queryset with its items prefetched
+        """
+        return self.prefetch_related('item')
+
+
+class Content(CountedMixin, models.Model):
     """
     A generic Content model that links to Django ContentType and
     custom built module type.
@@ -75,7 +178,7 @@ class Content(models.Model):
         models {Django} -- Django model builder
     """
     module = models.ForeignKey(Module, related_name='contents')
-    order = OrderField(blank=True, for_fields=['module'])
+    order = OrderField(blank=True, for_fields=['module'], counter=True)
     content_type = models.ForeignKey(
         ContentType,
         limit_choices_to={
@@ -83,10 +186,73 @@ class Content(models.Model):
     object_id = models.PositiveIntegerField()
     item = GenericForeignKey('content_type', 'object_id')
 
+    objects = ContentQuerySet.as_manager()
+
+    moved_fields = ('module_id',)
+
     class Meta:
         ordering = ['order']
 
 
+class OrderCounter(models.Model):
+    """
+    Next free order value of one parent for OrderField(counter=True),
+    keyed by OrderField.counter_key(), e.g. ``courses.content.order:module_id=7``
+    """
+    key = models.CharField(max_length=255, unique=True)
+    value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return '{} -> {}'.format(self.key, self.value)
+
+
+RENDER_NAMESPACE = 'content_html'
+# Part of the keys of the cached content HTML (here and in
+# courses.fragments). Bump it whenever a template under
+# courses/content/ or students/course/module_contents.html changes, so
+# HTML rendered by the old templates is never served again; the tests
+# fail until the templates' digest is recorded for the new version.
+# 1: protected media URLs, 2: picture/srcset images, 3: stored video
+# iframes
+RENDER_VERSION = 3
+
+
+def _render_timeout():
+    return getattr(settings, 'CONTENT_HTML_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def render_many(items):
+    """
+    Render a batch of items (e.g. all the items of a module) with a
+    single cache get_many() and a single set_many() for the misses.
+    Every item remembers its HTML, so a later item.render() is free.
+
+    Arguments:
+        items {list} -- ItemBase instances of any content type
+
+    Returns:
+        list -- the HTML of each item, in the same order
+    """
+    pending = {}
+    for item in items:
+        if getattr(item, '_rendered_html', None) is None:
+            pending.setdefault(item.render_cache_key(), []).append(item)
+    if pending:
+        found = cache.get_many(list(pending))
+        missing = {}
+        for key, same_items in pending.items():
+            html = found.get(key)
+            if html is None:
+                html = missing[key] = same_items[0].render_uncached()
+            for item in same_items:
+                item._rendered_html = html
+        stats.hit(RENDER_NAMESPACE, len(found))
+        stats.miss(RENDER_NAMESPACE, len(missing))
+        if missing:
+            cache.set_many(missing, _render_timeout())
+    return [item.render() for item in items]
+
+
 class ItemBase(models.Model):
     """Abstract Class that will broadcast in all content classes
 
@@ -107,10 +273,37 @@ class ItemBase(models.Model):
     def __str__(self):
         return self.title
 
-    def render(self):
+    def render_cache_key(self):
+        """
+        Saving an item bumps ``updated``, so an edited item never
+        reads the HTML rendered before the edit, and RENDER_VERSION
+        changes with the templates.
+        """
+        return 'content_html:{}:{}:{}:{:%Y%m%d%H%M%S%f}'.format(
+            RENDER_VERSION, self._meta.model_name, self.pk, self.updated)
+
+    def render_uncached(self):
         return render_to_string('courses/content/{}.html'.format(
             self._meta.model_name), {'item': self})
 
+    def render(self):
+        """
+        HTML of the item, read from the cache (or from a previous
+        render_many() call) when possible.
+        """
+        html = getattr(self, '_rendered_html', None)
+        if html is None:
+            key = self.render_cache_key()
+            html = cache.get(key)
+            if html is None:
+                stats.miss(RENDER_NAMESPACE)
+                html = self.render_uncached()
+                cache.set(key, html, _render_timeout())
+            else:
+                stats.hit(RENDER_NAMESPACE)
+            self._rendered_html = html
+        return mark_safe(html)
+
 
 class Text(ItemBase):
     content = models.TextField()
@@ -121,9 +314,117 @@ class File(ItemBase):
 
 
 class Image(ItemBase):
+    """
+    The thumbnail, medium and WebP derivatives are generated off the
+    request path by courses.images from the file named in derived_from;
+    the original file is served until they exist.
+    """
     file = models.FileField(upload_to='images')
+    width = models.PositiveIntegerField(null=True, editable=False)
+    height = models.PositiveIntegerField(null=True, editable=False)
+    thumbnail = models.FileField(
+        upload_to='images/derivatives', blank=True, editable=False)
+    medium = models.FileField(
+        upload_to='images/derivatives', blank=True, editable=False)
+    webp = models.FileField(
+        upload_to='images/derivatives', blank=True, editable=False)
+    derived_from = models.CharField(
+        max_length=100, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.file.name != self.derived_from:
+            # stale derivatives of a replaced file, deleted from the
+            # storage by courses.images once this save is committed
+            stored = Image.objects.filter(pk=self.pk).values_list(
+                'thumbnail', 'medium', 'webp').first() if self.pk else None
+            self.stale_derivatives = [name for name in stored or () if name]
+            self.thumbnail = self.medium = self.webp = ''
+            self.width = self.height = None
+        super(Image, self).save(*args, **kwargs)
 
 
 class Video(ItemBase):
+    """
+    The provider metadata of url is resolved once by courses.videos off
+    the request path and stored here, so rendering never detects the
+    provider or fetches thumbnails; resolved_from names the url it was
+    resolved from.
+    """
     url = models.URLField()
+    provider = models.CharField(max_length=20, blank=True, editable=False)
+    video_id = models.CharField(max_length=100, blank=True, editable=False)
+    embed_url = models.URLField(blank=True, editable=False)
+    thumbnail_url = models.URLField(blank=True, editable=False)
+    width = models.PositiveIntegerField(null=True, editable=False)
+    height = models.PositiveIntegerField(null=True, editable=False)
+    resolved_from = models.URLField(blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.url != self.resolved_from:
+            # metadata of a replaced url
+            self.provider = self.video_id = ''
+            self.embed_url = self.thumbnail_url = ''
+            self.width = self.height = None
+        super(Video, self).save(*args, **kwargs)
 # /Users/mohameddarwish/Documents/PycharmProjects/Eleanring/env/educa/bin/activate
+
+
+class Upload(models.Model):
+    """
+    A chunked upload of a file or image, written to disk chunk by chunk
+    and attached to a new item and Content row of module once all its
+    bytes are received (see courses.uploads)
+    """
+    MODEL_CHOICES = (('file', 'File'), ('image', 'Image'))
+
+    owner = models.ForeignKey(User, related_name='uploads')
+    module = models.ForeignKey(Module, related_name='uploads')
+    model_name = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    title = models.CharField(max_length=250)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    content = models.OneToOneField(
+        Content, related_name='upload', null=True, blank=True,
+        on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.filename
+
+
+class SearchDocument(models.Model):
+    """
+    One indexed object (course, module or text) of the search index
+    maintained by courses.search
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    course = models.ForeignKey(Course, related_name='search_documents')
+    title = models.CharField(max_length=250)
+    length = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('content_type', 'object_id')
+
+    def __str__(self):
+        return self.title
+
+
+class SearchPosting(models.Model):
+    """
+    Occurrences of one term in one document. The document length is
+    copied here so ranking only needs the postings of the query terms.
+    """
+    term = models.CharField(max_length=40)
+    document = models.ForeignKey(SearchDocument, related_name='postings')
+    frequency = models.PositiveIntegerField()
+    length = models.PositiveIntegerField()
+
+    class Meta:
+        # the best candidates of a common term are read in index order,
+        # without visiting the table
+        index_together = ('term', 'frequency', 'length', 'document')
+
+    def __str__(self):
+        return self.term
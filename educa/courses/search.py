@@ -0,0 +1,262 @@
+"""
+Full-text search over courses, modules and text contents.
+
+A small inverted index stored in the database: one SearchDocument per
+indexed object and one SearchPosting per (term, document). The index is
+updated incrementally by courses.signals and ranked with BM25, reading
+only the postings of the query terms. Of a term found in more than
+MAX_CANDIDATES documents only the postings with the highest frequencies
+are read, so a common word does not load a large part of the index.
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict, namedtuple
+from operator import itemgetter
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from .models import Course, Module, Content, Text
+from .models import SearchDocument, SearchPosting
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have in into is it its of on
+    or that the their then there these this to was were will with
+""".split())
+MAX_TERM_LENGTH = 40
+# title terms count as many times as body terms
+TITLE_WEIGHT = 3
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+BATCH_SIZE = 500
+# postings read per query term
+MAX_CANDIDATES = 5000
+STATS_KEY = 'search:stats'
+
+SearchResult = namedtuple(
+    'SearchResult',
+    'kind object_id title course_id course_title course_slug score')
+
+
+def tokenize(text):
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if 1 < len(token) <= MAX_TERM_LENGTH and token not in STOPWORDS]
+
+
+def document_entry(obj):
+    """
+    What to index for obj
+
+    Arguments:
+        obj {Course|Module|Text} -- an indexable object
+
+    Returns:
+        tuple -- (course_id, title, body), or None when obj cannot be
+        indexed yet (a text not attached to a module)
+    """
+    if isinstance(obj, Course):
+        return obj.id, obj.title, obj.overview
+    if isinstance(obj, Module):
+        return obj.course_id, obj.title, obj.description
+    if isinstance(obj, Text):
+        course_id = Content.objects.filter(
+            content_type=ContentType.objects.get_for_model(Text),
+            object_id=obj.id
+        ).values_list('module__course_id', flat=True).first()
+        if course_id is None:
+            return None
+        return course_id, obj.title, obj.content
+    return None
+
+
+def index_documents(entries):
+    """
+    (Re)index a batch of documents, replacing their previous postings.
+
+    Arguments:
+        entries {iterable} -- (content_type, object_id, course_id, title,
+        body) tuples
+    """
+    entries = list(entries)
+    with transaction.atomic():
+        for start in range(0, len(entries), BATCH_SIZE):
+            _index_batch(entries[start:start + BATCH_SIZE])
+    cache.delete(STATS_KEY)
+
+
+def _index_batch(entries):
+    by_type = defaultdict(list)
+    terms = {}
+    documents = []
+    for content_type, object_id, course_id, title, body in entries:
+        by_type[content_type].append(object_id)
+        counts = Counter(tokenize(title) * TITLE_WEIGHT + tokenize(body))
+        terms[content_type.id, object_id] = counts
+        documents.append(SearchDocument(
+            content_type=content_type, object_id=object_id,
+            course_id=course_id, title=title[:250],
+            length=sum(counts.values())))
+    for content_type, object_ids in by_type.items():
+        SearchDocument.objects.filter(
+            content_type=content_type, object_id__in=object_ids).delete()
+    SearchDocument.objects.bulk_create(documents)
+
+    postings = []
+    for content_type, object_ids in by_type.items():
+        # bulk_create does not return primary keys
+        created = SearchDocument.objects.filter(
+            content_type=content_type, object_id__in=object_ids
+        ).values_list('object_id', 'id', 'length')
+        for object_id, document_id, length in created:
+            postings.extend(
+                SearchPosting(
+                    term=term, document_id=document_id,
+                    frequency=frequency, length=length)
+                for term, frequency
+                in terms[content_type.id, object_id].items())
+    SearchPosting.objects.bulk_create(postings, batch_size=BATCH_SIZE)
+
+
+def index_object(obj):
+    entry = document_entry(obj)
+    if entry is None:
+        return
+    index_documents(
+        [(ContentType.objects.get_for_model(obj), obj.pk) + entry])
+
+
+def unindex_object(obj):
+    SearchDocument.objects.filter(
+        content_type=ContentType.objects.get_for_model(obj),
+        object_id=obj.pk).delete()
+    cache.delete(STATS_KEY)
+
+
+def unindex_module_texts(module):
+    """
+    Drop the documents of the texts attached to module, before it is
+    deleted with its contents
+    """
+    text_type = ContentType.objects.get_for_model(Text)
+    SearchDocument.objects.filter(
+        content_type=text_type,
+        object_id__in=Content.objects.filter(
+            module_id=module.pk, content_type=text_type
+        ).values('object_id')).delete()
+    cache.delete(STATS_KEY)
+
+
+def rebuild():
+    """
+    Index every course, module and attached text from scratch
+
+    Returns:
+        int -- number of indexed documents
+    """
+    def collect():
+        for model in (Course, Module):
+            content_type = ContentType.objects.get_for_model(model)
+            for obj in model.objects.order_by().iterator():
+                yield (content_type, obj.pk) + document_entry(obj)
+        text_type = ContentType.objects.get_for_model(Text)
+        courses = dict(Content.objects.filter(
+            content_type=text_type
+        ).values_list('object_id', 'module__course_id'))
+        for text in Text.objects.order_by().iterator():
+            if text.id in courses:
+                yield (text_type, text.id, courses[text.id],
+                       text.title, text.content)
+
+    with transaction.atomic():
+        SearchPosting.objects.all().delete()
+        SearchDocument.objects.all().delete()
+        entries = list(collect())
+        index_documents(entries)
+    return len(entries)
+
+
+def corpus_stats():
+    """
+    Returns:
+        tuple -- (number of documents, average document length)
+    """
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        aggregate = SearchDocument.objects.aggregate(
+            total=Count('id'), average=Avg('length'))
+        stats = (aggregate['total'], aggregate['average'] or 0)
+        cache.set(
+            STATS_KEY, stats,
+            getattr(settings, 'SEARCH_STATS_CACHE_TIMEOUT', 5 * 60))
+    return stats
+
+
+def search(query, limit=20):
+    """
+    Rank the indexed documents against query with BM25
+
+    Arguments:
+        query {str} -- free text typed by the user
+
+    Keyword Arguments:
+        limit {int} -- maximum number of results (default: {20})
+
+    Returns:
+        list -- SearchResult tuples, best first
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    found = dict(SearchPosting.objects.filter(
+        term__in=terms).values_list('term').annotate(
+            documents=Count('id')).order_by())
+    if not found:
+        return []
+    fields = ('term', 'document_id', 'frequency', 'length')
+    rare = [term for term in found if found[term] <= MAX_CANDIDATES]
+    queries = [SearchPosting.objects.filter(
+        term__in=rare).values_list(*fields)] if rare else []
+    queries.extend(
+        # the candidates a common term scores highest
+        SearchPosting.objects.filter(term=term).order_by(
+            '-frequency', 'length').values_list(*fields)[:MAX_CANDIDATES]
+        for term in found if found[term] > MAX_CANDIDATES)
+    postings = defaultdict(list)
+    for postings_query in queries:
+        for term, document_id, frequency, length in postings_query:
+            postings[term].append((document_id, frequency, length))
+
+    total, average = corpus_stats()
+    average = average or 1
+    scores = defaultdict(float)
+    for term, matches in postings.items():
+        idf = math.log(
+            1 + (total - found[term] + 0.5) / (found[term] + 0.5))
+        for document_id, frequency, length in matches:
+            scores[document_id] += idf * frequency * (K1 + 1) / (
+                frequency + K1 * (1 - B + B * length / average))
+    best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+    documents = SearchDocument.objects.select_related(
+        'course', 'content_type'
+    ).in_bulk([document_id for document_id, score in best])
+    return [
+        SearchResult(
+            kind=document.content_type.model,
+            object_id=document.object_id,
+            title=document.title,
+            course_id=document.course_id,
+            course_title=document.course.title,
+            course_slug=document.course.slug,
+            score=score)
+        for document, score in (
+            (documents.get(document_id), score)
+            for document_id, score in best)
+        if document is not None]
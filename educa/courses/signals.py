@@ -0,0 +1,221 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import catalog, counters, enrollment, images, search, versions
+from . import videos
+from .models import Subject, Course, Module, Content, Text, Video, Image
+from .models import File
+
+
+@receiver([post_save, post_delete], sender=Subject)
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Module)
+def invalidate_catalog(sender, **kwargs):
+    """
+    Any change to a subject, course or module can change a catalog
+    listing (titles, slugs, instructor, course and module counts)
+    """
+    catalog.invalidate()
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def invalidate_enrollments(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drop the cached enrolled-course sets of every user whose
+    enrollments changed, whichever side of the relation was used
+    """
+    if action == 'pre_clear' and not reverse:
+        # the cleared students are not known after the clear
+        instance._cleared_student_ids = list(
+            instance.students.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            user_ids = [instance.pk]
+        elif action == 'post_clear':
+            user_ids = getattr(instance, '_cleared_student_ids', [])
+        else:
+            user_ids = pk_set
+        enrollment.invalidate(user_ids)
+
+
+def _increment(qs, field_name, amount=1):
+    if amount > 0:
+        qs.update(**{field_name: F(field_name) + amount})
+    elif amount < 0:
+        # never below zero: drift is repaired by recount_counters
+        qs.filter(**{'{}__gte'.format(field_name): -amount}).update(
+            **{field_name: F(field_name) + amount})
+
+
+@receiver(post_save, sender=Module)
+def count_saved_module(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance.saved_value('course_id')
+    if created:
+        _increment(
+            Course.objects.filter(id=instance.course_id), 'total_modules')
+    elif previous not in (None, instance.course_id):
+        # moved to another course with its contents
+        contents = instance.contents.count()
+        for course_id, sign in ((previous, -1), (instance.course_id, 1)):
+            course = Course.objects.filter(id=course_id)
+            _increment(course, 'total_modules', sign)
+            _increment(course, 'total_contents', sign * contents)
+
+
+@receiver(post_delete, sender=Module)
+def count_deleted_module(sender, instance, **kwargs):
+    _increment(
+        Course.objects.filter(id=instance.course_id), 'total_modules', -1)
+
+
+@receiver(post_save, sender=Content)
+def count_saved_content(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance.saved_value('module_id')
+    if created:
+        _increment(
+            Course.objects.filter(modules__id=instance.module_id),
+            'total_contents')
+    elif previous not in (None, instance.module_id):
+        _increment(
+            Course.objects.filter(modules__id=previous),
+            'total_contents', -1)
+        _increment(
+            Course.objects.filter(modules__id=instance.module_id),
+            'total_contents')
+
+
+@receiver(post_delete, sender=Content)
+def count_deleted_content(sender, instance, **kwargs):
+    _increment(
+        Course.objects.filter(modules__id=instance.module_id),
+        'total_contents', -1)
+
+
+@receiver(post_save, sender=Course)
+def count_saved_course(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance.saved_value('subject_id')
+    if created or previous != instance.subject_id:
+        _increment(
+            Subject.objects.filter(id=instance.subject_id), 'total_courses')
+    if not created and previous not in (None, instance.subject_id):
+        _increment(
+            Subject.objects.filter(id=previous), 'total_courses', -1)
+
+
+@receiver(post_delete, sender=Course)
+def count_deleted_course(sender, instance, **kwargs):
+    _increment(
+        Subject.objects.filter(id=instance.subject_id), 'total_courses', -1)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def count_students(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Additions only report the rows actually inserted, so they are
+    counted with F() updates; removals may name rows that did not
+    exist, so the affected courses are recounted instead
+    """
+    if action == 'pre_clear' and reverse:
+        instance._cleared_course_ids = list(
+            instance.courses_enrolled.values_list('id', flat=True))
+    elif action == 'post_add' and reverse:
+        _increment(Course.objects.filter(id__in=pk_set), 'total_students')
+    elif action == 'post_add':
+        _increment(
+            Course.objects.filter(id=instance.pk),
+            'total_students', len(pk_set))
+    elif action == 'post_remove' and reverse:
+        counters.recount_students(pk_set)
+    elif action == 'post_clear' and reverse:
+        counters.recount_students(
+            getattr(instance, '_cleared_course_ids', []))
+    elif action in ('post_remove', 'post_clear'):
+        counters.recount_students([instance.pk])
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Module)
+@receiver(post_save, sender=Text)
+def index_for_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_object(instance)
+
+
+@receiver(post_save, sender=Content)
+def index_content_for_search(sender, instance, created, raw=False, **kwargs):
+    # a text is saved before the content row attaching it to a module
+    if created and not raw and instance.content_type.model == 'text':
+        search.index_object(instance.item)
+
+
+@receiver(post_delete, sender=Module)
+@receiver(post_delete, sender=Text)
+def unindex_for_search(sender, instance, **kwargs):
+    # deleting a course cascades to its search documents
+    search.unindex_object(instance)
+
+
+@receiver(pre_delete, sender=Module)
+def unindex_module_texts(sender, instance, **kwargs):
+    # its contents are deleted with it, leaving the texts unattached
+    search.unindex_module_texts(instance)
+
+
+@receiver(post_save, sender=Image)
+def generate_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.schedule(instance)
+
+
+@receiver(post_save, sender=Video)
+def resolve_video_metadata(sender, instance, raw=False, **kwargs):
+    if not raw:
+        videos.schedule(instance)
+
+
+@receiver([post_save, post_delete], sender=Module)
+def touch_module_course(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # a moved module changes the course it left too
+        versions.touch_courses(filter(None, [
+            instance.course_id, instance.saved_value('course_id')]))
+
+
+@receiver([post_save, post_delete], sender=Content)
+def touch_content_course(sender, instance, raw=False, **kwargs):
+    if not raw:
+        versions.touch_modules(filter(None, [
+            instance.module_id, instance.saved_value('module_id')]))
+
+
+@receiver(post_save, sender=Text)
+@receiver(post_save, sender=Video)
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=File)
+def touch_item_courses(sender, instance, created, raw=False, **kwargs):
+    # a new item is not shown anywhere until its Content row is saved
+    if not created and not raw:
+        versions.touch_items(sender, [instance.id])
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def touch_left_courses(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Enrollments are part of the course listings; additions already
+    change their total_students sum, removals are stamped here
+    """
+    if action == 'post_remove':
+        versions.touch_courses(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        # count_students stashed the cleared courses on pre_clear
+        versions.touch_courses(
+            getattr(instance, '_cleared_course_ids', []) if reverse
+            else [instance.pk])
@@ -1,4 +1,7 @@
 from django import template
+from django.core.urlresolvers import reverse
+
+from ..models import render_many
 
 
 register = template.Library()
@@ -10,3 +13,25 @@ def model_name(obj):
         return obj._meta.model_name
     except AttributeError:
         return None
+
+
+@register.filter
+def rendered(contents):
+    """
+    Evaluate contents and render all their items with one cache
+    round trip, e.g. ``{% for content in contents|rendered %}``
+    """
+    contents = list(contents)
+    render_many([
+        content.item for content in contents if content.item is not None])
+    return contents
+
+
+@register.filter
+def media_url(item, field='file'):
+    """
+    URL of the access-controlled view serving a file of item,
+    e.g. ``{{ item|media_url:'thumbnail' }}``
+    """
+    return reverse(
+        'content_media', args=[item._meta.model_name, item.pk, field])
@@ -0,0 +1,159 @@
+"""
+Query and wall-time budgets for views, used by the test suites.
+
+QueryBudgetTestCase seeds a realistic catalog once per test class (see
+courses.tests.seed) plus a sparse course with one module holding one content
+of each type. assertBudget issues a request with a cold cache and fails
+when it runs more queries than its budget, or takes longer than the
+QUERY_BUDGET_SECONDS setting when that is set: wall time depends on the
+machine, so it is only checked on request. When the
+same view is also issued against the sparse objects, the two query
+counts must match, so per-module or per-content queries (N+1) fail even
+under budget. Failures print the normalized queries, as a diff between
+the sparse and dense requests when there is one.
+"""
+import difflib
+import random
+import re
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.urlresolvers import get_resolver
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import counters
+from ..importer import CourseImporter
+from ..models import Course
+from .seed import course_record, seed
+
+PASSWORD = 'password'
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+IN_LIST_RE = re.compile(r'IN \(\?(?:, \?)*\)')
+
+# a request: HTTP method, URL, username to log in as (or None) and the
+# extra arguments of the test client method
+Call = namedtuple('Call', 'method url user extra')
+
+
+def call(method, url, user=None, **extra):
+    return Call(method, url, user, extra)
+
+
+def normalize(sql):
+    """
+    sql with its literals replaced, so the same query with other
+    parameters compares equal
+    """
+    return IN_LIST_RE.sub('IN (...)', LITERAL_RE.sub('?', sql))
+
+
+def url_names(urlconf, namespace=None):
+    """
+    Names of the URL patterns of urlconf, prefixed with namespace
+    """
+    names = set(
+        name for name in get_resolver(urlconf).reverse_dict
+        if isinstance(name, str))
+    if namespace:
+        names = set('{}:{}'.format(namespace, name) for name in names)
+    return names
+
+
+class QueryBudgetTestCase(TestCase):
+    seed_options = {
+        'courses': 30, 'modules': 6, 'contents': 8,
+        'students': 2000, 'enrollments': 3}
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed(password=PASSWORD, prefix='budget', **cls.seed_options)
+        cls.instructor = seeded.instructor
+        cls.instructor.is_staff = True
+        cls.instructor.save()
+        instructors = Group.objects.create(name='Instructors')
+        instructors.permissions.add(*Permission.objects.filter(
+            content_type__app_label='courses'))
+        cls.instructor.groups.add(instructors)
+
+        CourseImporter(owner=cls.instructor).run([course_record(
+            seeded.subjects[-1].slug, 'budget-sparse', 1, 4,
+            random.Random(1))])
+        cls.sparse_course = Course.objects.get(slug='budget-sparse')
+        cls.dense_course = Course.objects.get(id=seeded.courses[0])
+        cls.sparse_module = cls.sparse_course.modules.get()
+        cls.dense_module = cls.dense_course.modules.last()
+
+        cls.students = seeded.students
+        cls.sparse_student = 'budget-student-0'
+        cls.dense_student = 'budget-student-1'
+        Enrollment = Course.students.through
+        Enrollment.objects.filter(user_id__in=seeded.students[:2]).delete()
+        Enrollment.objects.bulk_create(
+            [Enrollment(user_id=seeded.students[0],
+                        course_id=cls.sparse_course.id)] +
+            [Enrollment(user_id=seeded.students[1], course_id=course_id)
+             for course_id in [cls.sparse_course.id] + seeded.courses])
+        counters.recount_students()
+
+    def issue(self, request):
+        cache.clear()
+        self.client.logout()
+        if request.user:
+            self.assertTrue(self.client.login(
+                username=request.user, password=PASSWORD))
+        with CaptureQueriesContext(connection) as context:
+            started = time.time()
+            response = getattr(self.client, request.method)(
+                request.url, **request.extra)
+            elapsed = time.time() - started
+        self.assertLess(
+            response.status_code, 400,
+            '{} {} answered {}'.format(
+                request.method.upper(), request.url, response.status_code))
+        return [normalize(query['sql'])
+                for query in context.captured_queries], elapsed
+
+    def assertBudget(self, name, queries, dense, sparse=None, seconds=None):
+        """
+        Arguments:
+            name {str} -- URL name, for the messages
+            queries {int} -- maximum number of queries
+            dense {Call} -- the request, on the dense objects
+
+        Keyword Arguments:
+            sparse {Call} -- the same view on the sparse objects, which
+            must cost as many queries (default: {None})
+            seconds {float} -- wall-time budget, checked when the
+            QUERY_BUDGET_SECONDS setting is set (default: {the setting})
+        """
+        limit = getattr(settings, 'QUERY_BUDGET_SECONDS', None)
+        seconds = seconds or limit
+        baseline = self.issue(sparse)[0] if sparse else None
+        issued, elapsed = self.issue(dense)
+        if baseline is not None and len(baseline) != len(issued):
+            self.fail('{}: {} queries on sparse objects, {} on dense ones\n'
+                      '{}'.format(name, len(baseline), len(issued),
+                                  self.diff(baseline, issued)))
+        if len(issued) > queries:
+            self.fail('{}: {} queries, budget {}\n{}'.format(
+                name, len(issued), queries,
+                self.diff(baseline, issued) if baseline else
+                self.listing(issued)))
+        if limit is not None:
+            self.assertLessEqual(
+                elapsed, seconds, '{}: {:.3f}s, budget {:.3f}s'.format(
+                    name, elapsed, seconds))
+
+    def diff(self, baseline, issued):
+        return '\n'.join(difflib.unified_diff(
+            baseline, issued, 'sparse', 'dense', lineterm=''))
+
+    def listing(self, issued):
+        return '\n'.join(
+            '{:>4}x {}'.format(count, sql)
+            for sql, count in Counter(issued).most_common())
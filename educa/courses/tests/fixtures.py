@@ -0,0 +1,29 @@
+"""
+Objects most test cases start from.
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..models import Subject, Course
+
+
+class CourseFixtureMixin(object):
+    """
+    An instructor (password "pw") owning the course "algebra" of the
+    subject "maths", as self.owner, self.subject and self.course
+    """
+
+    def setUp(self):
+        super(CourseFixtureMixin, self).setUp()
+        # ids are reused by the next test, entries cached for them are not
+        cache.clear()
+        self.owner = User.objects.create_user('instructor', password='pw')
+        self.subject = Subject.objects.create(title='Maths', slug='maths')
+        self.course = Course.objects.create(
+            owner=self.owner, subject=self.subject, title='Algebra',
+            slug='algebra', overview='Groups and rings')
+
+
+class CourseTestCase(CourseFixtureMixin, TestCase):
+    pass
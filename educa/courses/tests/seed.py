@@ -0,0 +1,120 @@
+"""
+Synthetic courses and students for the query budget tests and the load
+benchmarks.
+
+Courses are written through the bulk importer, students and enrollments
+with bulk_create, so seeding thousands of rows stays fast.
+"""
+import random
+from collections import namedtuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from .. import counters
+from ..importer import CourseImporter
+from ..models import Subject, Course
+
+Seeded = namedtuple('Seeded', 'instructor subjects courses students')
+
+CONTENT_TYPES = ('text', 'video', 'image', 'file')
+WORDS = (
+    'algebra geometry calculus statistics physics chemistry biology '
+    'history economics design systems networks databases compilers '
+    'graphs proofs vectors matrices signals energy markets').split()
+
+
+def content_record(kind, number, rng):
+    title = '{} {} {}'.format(
+        rng.choice(WORDS).title(), kind, number)
+    if kind == 'text':
+        return {'type': kind, 'title': title, 'content': ' '.join(
+            rng.choice(WORDS) for i in range(120))}
+    if kind == 'video':
+        return {'type': kind, 'title': title,
+                'url': 'https://www.youtube.com/watch?v=seed{:06d}'.format(
+                    number)}
+    return {'type': kind, 'title': title,
+            'file': '{}s/seed.{}'.format(
+                kind, 'png' if kind == 'image' else 'pdf')}
+
+
+def course_record(subject, slug, modules, contents, rng):
+    """
+    An import record (see courses.importer) with modules modules of
+    contents contents each, cycling through the content types
+    """
+    number = 0
+    module_records = []
+    for m in range(modules):
+        items = []
+        for c in range(contents):
+            number += 1
+            items.append(content_record(
+                CONTENT_TYPES[c % len(CONTENT_TYPES)], number, rng))
+        module_records.append({
+            'title': 'Module {}: {}'.format(m + 1, rng.choice(WORDS)),
+            'description': ' '.join(rng.choice(WORDS) for i in range(20)),
+            'contents': items})
+    return {
+        'subject': subject,
+        'title': '{} {}'.format(rng.choice(WORDS).title(), slug),
+        'slug': slug,
+        'overview': ' '.join(rng.choice(WORDS) for i in range(60)),
+        'modules': module_records}
+
+
+def seed(courses=20, modules=5, contents=8, students=1000, enrollments=3,
+         subjects=4, password='password', prefix='seed', random_seed=0):
+    """
+    Create an instructor, subjects, courses and enrolled students
+
+    Keyword Arguments:
+        courses {int} -- number of courses (default: {20})
+        modules {int} -- modules per course (default: {5})
+        contents {int} -- contents per module (default: {8})
+        students {int} -- number of students (default: {1000})
+        enrollments {int} -- courses each student is enrolled in
+        (default: {3})
+        subjects {int} -- number of subjects (default: {4})
+        password {str} -- password of every created user
+        prefix {str} -- prefix of usernames and slugs (default: {'seed'})
+        random_seed {int} -- seed of the generated text and enrollments
+
+    Returns:
+        Seeded -- (instructor, subjects, course ids, student ids)
+    """
+    rng = random.Random(random_seed)
+    instructor = User.objects.create_user(
+        '{}-instructor'.format(prefix), password=password)
+    subject_objs = [
+        Subject.objects.create(
+            title='{} subject {}'.format(prefix, i).title(),
+            slug='{}-subject-{}'.format(prefix, i))
+        for i in range(subjects)]
+    CourseImporter(owner=instructor).run(
+        course_record(
+            subject_objs[i % subjects].slug,
+            '{}-course-{}'.format(prefix, i), modules, contents, rng)
+        for i in range(courses))
+    course_ids = list(Course.objects.filter(
+        slug__startswith='{}-course-'.format(prefix)
+    ).order_by('id').values_list('id', flat=True))
+
+    hashed = make_password(password)
+    User.objects.bulk_create([
+        User(username='{}-student-{}'.format(prefix, i), password=hashed)
+        for i in range(students)], batch_size=500)
+    student_ids = list(User.objects.filter(
+        username__startswith='{}-student-'.format(prefix)
+    ).order_by('id').values_list('id', flat=True))
+
+    Enrollment = Course.students.through
+    Enrollment.objects.bulk_create([
+        Enrollment(user_id=student_id, course_id=course_id)
+        for student_id in student_ids
+        for course_id in rng.sample(
+            course_ids, min(enrollments, len(course_ids)))],
+        batch_size=500)
+    counters.recount_students(course_ids)
+    return Seeded(instructor, subject_objs, course_ids, student_ids)
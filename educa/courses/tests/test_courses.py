@@ -0,0 +1,1515 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO, StringIO
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_save
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.test.utils import modify_settings
+from PIL import Image as PILImage
+from rest_framework.renderers import JSONRenderer
+
+from ..models import Subject, Course, Module, Content, Text, Video, Image, File
+from ..models import Upload, render_many
+from ..importer import CourseImporter, CourseImportError, export_course
+from ..importer import read_records
+from ..api.compact import FieldPlan
+from ..api.serializers import SubjectSerializer, CourseSerializer
+from .budgets import QueryBudgetTestCase, call, url_names
+from .fixtures import CourseFixtureMixin, CourseTestCase
+from ..cache import stats
+from .. import catalog, counters, enrollment, fragments, images, search
+from .. import instrumentation, models, uploads, videos, workers
+
+
+class ContentItemsPrefetchTest(CourseTestCase):
+    """
+    Resolving the items of a module must cost one query for the
+    contents plus one per content type, whatever the module size.
+    """
+
+    def setUp(self):
+        super(ContentItemsPrefetchTest, self).setUp()
+        self.module = Module.objects.create(course=self.course, title='Intro')
+
+    def add_contents(self, count):
+        for i in range(count):
+            for item in (
+                    Text(title='text', content='body'),
+                    Video(title='video', url='http://example.com/v'),
+                    Image(title='image', file='images/i.png'),
+                    File(title='file', file='files/f.pdf')):
+                item.owner = self.owner
+                item.save()
+                Content.objects.create(module=self.module, item=item)
+
+    def test_items_resolved_per_content_type(self):
+        self.add_contents(3)
+        with self.assertNumQueries(5):
+            items = [c.item for c in self.module.contents.with_items()]
+        self.assertEqual(len(items), 12)
+        self.assertEqual(
+            set(type(item) for item in items),
+            set([Text, Video, Image, File]))
+
+    def test_query_count_does_not_grow_with_contents(self):
+        self.add_contents(10)
+        with self.assertNumQueries(5):
+            for content in self.module.contents.with_items():
+                content.item.title
+
+
+class OrderCounterTest(CourseTestCase):
+
+    def test_orders_follow_existing_rows(self):
+        Module.objects.create(course=self.course, title='Old', order=4)
+        first = Module.objects.create(course=self.course, title='A')
+        second = Module.objects.create(course=self.course, title='B')
+        self.assertEqual((first.order, second.order), (5, 6))
+
+    def test_orders_are_per_parent(self):
+        other = Course.objects.create(
+            owner=self.course.owner, subject=self.course.subject,
+            title='Geometry', slug='geometry', overview='Shapes')
+        Module.objects.create(course=self.course, title='A')
+        self.assertEqual(
+            Module.objects.create(course=other, title='B').order, 0)
+
+    def test_bulk_create_reserves_one_block(self):
+        Module.objects.create(course=self.course, title='First')
+        modules = [
+            Module(course=self.course, title=str(i)) for i in range(50)]
+        # counter update + read back, then the INSERT itself
+        with self.assertNumQueries(3):
+            Module.objects.bulk_create(modules)
+        self.assertEqual(
+            list(self.course.modules.values_list('order', flat=True)),
+            list(range(51)))
+
+
+class SetOrderTest(CourseTestCase):
+
+    def setUp(self):
+        super(SetOrderTest, self).setUp()
+        self.modules = Module.objects.bulk_create([
+            Module(course=self.course, title=str(i)) for i in range(20)])
+        self.modules = list(self.course.modules.all())
+
+    def test_reorder_in_one_check_and_one_update(self):
+        orders = {
+            str(module.id): 19 - module.order for module in self.modules}
+        with CaptureQueriesContext(connection) as queries:
+            rejected = Module.objects.filter(
+                course__owner=self.owner).set_order(orders)
+        statements = [
+            q['sql'] for q in queries.captured_queries
+            if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(rejected, [])
+        self.assertEqual(
+            list(self.course.modules.values_list('title', flat=True)),
+            [str(i) for i in reversed(range(20))])
+
+    def test_foreign_and_invalid_ids_are_rejected(self):
+        intruder = User.objects.create_user('intruder', password='pw')
+        module = self.modules[0]
+        rejected = Module.objects.filter(
+            course__owner=intruder).set_order(
+                {str(module.id): 5, 'abc': 1, '999999': 2})
+        self.assertEqual(
+            set(rejected), set([str(module.id), 'abc', '999999']))
+        self.assertEqual(Module.objects.get(id=module.id).order, 0)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogCacheTest(CourseTestCase):
+
+    def setUp(self):
+        stats.reset()
+        catalog.invalidate()
+        super(CatalogCacheTest, self).setUp()
+        self.owner.first_name, self.owner.last_name = 'Ada', 'Lovelace'
+        self.owner.save()
+        Module.objects.create(course=self.course, title='Intro')
+
+    def test_hit_does_not_query(self):
+        catalog.get_catalog()
+        with self.assertNumQueries(0):
+            subjects, subject, courses = catalog.get_catalog()
+        self.assertEqual(subjects[0].total_courses, 1)
+        self.assertEqual(courses[0].total_modules, 1)
+        self.assertEqual(courses[0].owner_name, 'Ada Lovelace')
+        self.assertEqual(stats.snapshot()['catalog']['hits'], 2)
+
+    def test_changes_invalidate_listing(self):
+        catalog.get_catalog('maths')
+        self.course.title = 'Linear algebra'
+        self.course.save()
+        Module.objects.create(course=self.course, title='Vectors')
+        subjects, subject, courses = catalog.get_catalog('maths')
+        self.assertEqual(subject.slug, 'maths')
+        self.assertEqual(courses[0].title, 'Linear algebra')
+        self.assertEqual(courses[0].total_modules, 2)
+        self.course.delete()
+        self.assertEqual(catalog.get_catalog('maths')[2], [])
+
+    def test_unknown_subject(self):
+        with self.assertRaises(Subject.DoesNotExist):
+            catalog.get_catalog('nope')
+
+
+# models.RENDER_VERSION -> digest of the templates it renders with
+RENDER_TEMPLATE_DIGESTS = {
+    3: 'aa91a8816810d89ad107984a967e5ff11f5000f5',
+}
+
+
+def render_templates_digest():
+    """
+    Returns:
+        str -- SHA-1 of the templates under courses/content/ and of
+        students/course/module_contents.html
+    """
+    content = os.path.join(
+        apps.get_app_config('courses').path,
+        'templates', 'courses', 'content')
+    paths = sorted(
+        os.path.join(content, name) for name in os.listdir(content))
+    paths.append(os.path.join(
+        apps.get_app_config('students').path,
+        'templates', 'students', 'course', 'module_contents.html'))
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode() + b'\0')
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RenderCacheTest(TestCase):
+
+    def setUp(self):
+        stats.reset()
+        owner = User.objects.create_user('instructor', password='pw')
+        for i in range(3):
+            Text.objects.create(
+                owner=owner, title=str(i), content='paragraph {}'.format(i))
+
+    def test_render_many_reuses_cached_fragments(self):
+        first = render_many(Text.objects.all())
+        self.assertIn('paragraph 0', first[0])
+        self.assertEqual(stats.snapshot()['content_html']['misses'], 3)
+        texts = list(Text.objects.all())
+        second = render_many(texts)
+        self.assertEqual(first, second)
+        self.assertEqual(stats.snapshot()['content_html']['hits'], 3)
+        # rendered HTML is kept on the instance
+        texts[0].render()
+        self.assertEqual(stats.snapshot()['content_html']['hits'], 3)
+
+    def test_edit_renders_again(self):
+        text = Text.objects.get(title='0')
+        text.render()
+        text = Text.objects.get(title='0')
+        text.content = 'changed'
+        text.save()
+        self.assertIn('changed', Text.objects.get(title='0').render())
+
+    def test_render_version_renders_again(self):
+        Text.objects.get(title='0').render()
+        self.addCleanup(
+            setattr, models, 'RENDER_VERSION', models.RENDER_VERSION)
+        models.RENDER_VERSION += 1
+        Text.objects.get(title='0').render()
+        self.assertEqual(stats.snapshot()['content_html']['misses'], 2)
+
+    def test_templates_match_render_version(self):
+        self.assertEqual(
+            render_templates_digest(),
+            RENDER_TEMPLATE_DIGESTS.get(models.RENDER_VERSION),
+            'the content templates changed: bump models.RENDER_VERSION '
+            'and record their new digest in RENDER_TEMPLATE_DIGESTS')
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LearningFragmentTest(CourseTestCase):
+
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+        super(LearningFragmentTest, self).setUp()
+        self.module = Module.objects.create(course=self.course, title='Intro')
+        self.add_text('first')
+
+    def add_text(self, content):
+        text = Text.objects.create(
+            owner=self.owner, title=content, content=content)
+        Content.objects.create(module=self.module, item=text)
+
+    def test_fragment_is_reused_until_invalidated(self):
+        fragments.module_contents(self.module)
+        with self.assertNumQueries(0):
+            html = fragments.module_contents(self.module)
+        self.assertIn('first', html)
+        self.assertEqual(stats.snapshot()['learning']['hits'], 1)
+
+        self.add_text('second')
+        self.assertNotIn('second', fragments.module_contents(self.module))
+        fragments.invalidate_modules([self.module.id])
+        self.assertIn('second', fragments.module_contents(self.module))
+
+    def test_course_invalidation_covers_its_modules(self):
+        fragments.module_contents(self.module)
+        fragments.invalidate_courses([self.module.course_id])
+        fragments.module_contents(self.module)
+        self.assertEqual(stats.snapshot()['learning']['misses'], 2)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class EnrollmentLookupTest(CourseTestCase):
+
+    def setUp(self):
+        super(EnrollmentLookupTest, self).setUp()
+        self.student = User.objects.create_user('student', password='pw')
+        enrollment.invalidate([self.student.id])
+
+    def test_cached_set_answers_without_queries(self):
+        self.course.students.add(self.student)
+        # the miss caches the set for the next lookups
+        with self.assertNumQueries(1):
+            self.assertTrue(
+                enrollment.is_enrolled(self.student, self.course.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                enrollment.is_enrolled(self.student, self.course.id))
+            self.assertFalse(
+                enrollment.is_enrolled(self.student, self.course.id + 1))
+
+    def test_enrollment_changes_invalidate(self):
+        self.assertEqual(
+            enrollment.enrolled_course_ids(self.student), frozenset())
+        self.course.students.add(self.student)
+        self.assertTrue(enrollment.is_enrolled(self.student, self.course.id))
+        enrollment.enrolled_course_ids(self.student)
+        self.student.courses_enrolled.remove(self.course)
+        self.assertFalse(
+            enrollment.is_enrolled(self.student, self.course.id))
+        enrollment.enrolled_course_ids(self.student)
+        self.course.students.add(self.student)
+        enrollment.enrolled_course_ids(self.student)
+        self.course.students.clear()
+        self.assertEqual(
+            enrollment.enrolled_course_ids(self.student), frozenset())
+
+
+class CourseApiListTest(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('instructor', password='pw')
+        subject = Subject.objects.create(title='Maths', slug='maths')
+        students = [
+            User.objects.create_user('s{}'.format(i)) for i in range(3)]
+        for i in range(25):
+            course = Course.objects.create(
+                owner=owner, subject=subject, title=str(i),
+                slug='course-{}'.format(i), overview='...')
+            course.students.add(*students)
+
+    def get(self, url):
+        return json.loads(self.client.get(url).content.decode('utf-8'))
+
+    def test_list_is_cursor_paginated(self):
+        page = self.get(reverse('api:course-list'))
+        self.assertEqual(len(page['results']), 20)
+        self.assertEqual(page['results'][0]['title'], '24')
+        self.assertEqual(len(page['results'][0]['students']), 3)
+        rest = self.get(page['next'])
+        self.assertEqual(
+            [course['title'] for course in rest['results']],
+            ['4', '3', '2', '1', '0'])
+        self.assertIsNone(rest['next'])
+
+    def test_students_count_and_omit(self):
+        url = reverse('api:course-list')
+        counted = self.get(url + '?students=count')['results'][0]
+        self.assertEqual(counted['students'], 3)
+        omitted = self.get(url + '?students=omit')['results'][0]
+        self.assertNotIn('students', omitted)
+
+    def test_list_queries_do_not_grow_with_courses(self):
+        # the catalog stamp, the courses page, its modules and students
+        with self.assertNumQueries(4):
+            self.client.get(reverse('api:course-list'))
+
+
+class CourseContentsStreamTest(CourseTestCase):
+
+    def setUp(self):
+        super(CourseContentsStreamTest, self).setUp()
+        student = User.objects.create_user('student', password='pw')
+        self.course.students.add(student)
+        for m in range(3):
+            module = Module.objects.create(
+                course=self.course, title='Module {}'.format(m))
+            for t in range(2):
+                text = Text.objects.create(
+                    owner=self.owner, title='t', content='text {}'.format(t))
+                Content.objects.create(module=module, item=text)
+
+    def get(self, query=''):
+        credentials = base64.b64encode(b'student:pw').decode('ascii')
+        return self.client.get(
+            reverse('api:course-contents', args=[self.course.id]) + query,
+            HTTP_AUTHORIZATION='Basic ' + credentials)
+
+    def test_stream_matches_serialized_contents(self):
+        response = self.get()
+        expected = json.loads(response.content.decode('utf-8'))
+        streamed = self.get('?stream=1')
+        self.assertTrue(streamed.streaming)
+        body = b''.join(streamed.streaming_content).decode('utf-8')
+        self.assertEqual(json.loads(body), expected)
+        self.assertEqual(len(expected['modules']), 3)
+        self.assertEqual(len(expected['modules'][0]['contents']), 2)
+
+    def test_stream_of_course_without_modules(self):
+        self.course.modules.all().delete()
+        body = b''.join(self.get('?stream=1').streaming_content)
+        self.assertEqual(json.loads(body.decode('utf-8'))['modules'], [])
+
+
+class CounterColumnsTest(CourseTestCase):
+
+    def setUp(self):
+        super(CounterColumnsTest, self).setUp()
+        self.student = User.objects.create_user('student', password='pw')
+        self.maths = self.subject
+        self.physics = Subject.objects.create(title='Physics', slug='physics')
+
+    def refresh(self, obj):
+        return type(obj).objects.get(pk=obj.pk)
+
+    def test_modules_are_counted(self):
+        module = Module.objects.create(course=self.course, title='Intro')
+        Module.objects.create(course=self.course, title='Groups')
+        self.assertEqual(self.refresh(self.course).total_modules, 2)
+        module.delete()
+        self.assertEqual(self.refresh(self.course).total_modules, 1)
+
+    def test_stale_instance_does_not_overwrite_counts(self):
+        Module.objects.create(course=self.course, title='Intro')
+        self.course.title = 'Linear algebra'
+        self.course.save()
+        self.assertEqual(self.refresh(self.course).total_modules, 1)
+
+    def test_courses_are_counted_per_subject(self):
+        self.assertEqual(self.refresh(self.maths).total_courses, 1)
+        self.course.subject = self.physics
+        self.course.save()
+        self.assertEqual(self.refresh(self.maths).total_courses, 0)
+        self.assertEqual(self.refresh(self.physics).total_courses, 1)
+        self.course.delete()
+        self.assertEqual(self.refresh(self.physics).total_courses, 0)
+
+    def test_students_are_counted(self):
+        self.course.students.add(self.student)
+        self.course.students.add(self.student)
+        self.assertEqual(self.refresh(self.course).total_students, 1)
+        self.course.students.remove(self.owner)
+        self.assertEqual(self.refresh(self.course).total_students, 1)
+        self.student.courses_enrolled.clear()
+        self.assertEqual(self.refresh(self.course).total_students, 0)
+
+    def test_moves_are_counted(self):
+        other = Course.objects.create(
+            owner=self.owner, subject=self.physics, title='Mechanics',
+            slug='mechanics', overview='Forces')
+        module = Module.objects.create(course=self.course, title='Intro')
+        for title in ('a', 'b'):
+            Content.objects.create(module=module, item=Text.objects.create(
+                owner=self.owner, title=title, content='c'))
+        module = Module.objects.get(pk=module.pk)
+        module.course = other
+        module.save()
+        self.assertEqual(
+            (self.refresh(self.course).total_modules,
+             self.refresh(self.course).total_contents), (0, 0))
+        self.assertEqual(
+            (self.refresh(other).total_modules,
+             self.refresh(other).total_contents), (1, 2))
+        content = module.contents.first()
+        content.module = Module.objects.create(
+            course=self.course, title='Back')
+        content.save()
+        self.assertEqual(self.refresh(self.course).total_contents, 1)
+        self.assertEqual(self.refresh(other).total_contents, 1)
+
+    def test_subject_of_unloaded_course_is_read(self):
+        course = Course(
+            id=self.course.id, owner=self.owner, subject=self.physics,
+            title='Algebra', slug='algebra', overview='Groups and rings',
+            created=self.course.created)
+        course.save()
+        self.assertEqual(self.refresh(self.maths).total_courses, 0)
+        self.assertEqual(self.refresh(self.physics).total_courses, 1)
+
+    def test_recount_repairs_drift(self):
+        Module.objects.create(course=self.course, title='Intro')
+        Course.objects.filter(id=self.course.id).update(total_modules=7)
+        Subject.objects.filter(id=self.maths.id).update(total_courses=0)
+        repaired = counters.recount_all()
+        self.assertEqual(repaired['course.total_modules'], 1)
+        self.assertEqual(repaired['subject.total_courses'], 1)
+        self.assertEqual(repaired['course.total_students'], 0)
+        self.assertEqual(self.refresh(self.course).total_modules, 1)
+
+
+class CounterAtomicityTest(CourseFixtureMixin, TransactionTestCase):
+
+    def test_failed_save_keeps_counts(self):
+        def fail(sender, **kwargs):
+            raise RuntimeError('receiver failed')
+        post_save.connect(fail, sender=Module)
+        try:
+            with self.assertRaises(RuntimeError):
+                Module.objects.create(course=self.course, title='Intro')
+        finally:
+            post_save.disconnect(fail, sender=Module)
+        self.assertFalse(Module.objects.exists())
+        self.assertEqual(
+            Course.objects.get(pk=self.course.pk).total_modules, 0)
+
+
+class SearchIndexTest(CourseTestCase):
+
+    def setUp(self):
+        super(SearchIndexTest, self).setUp()
+        self.algebra = self.course
+        self.geometry = Course.objects.create(
+            owner=self.owner, subject=self.subject, title='Geometry',
+            slug='geometry', overview='Triangles and circles')
+        self.module = Module.objects.create(
+            course=self.geometry, title='Euclid',
+            description='Axioms of plane geometry')
+
+    def test_title_matches_rank_first(self):
+        Module.objects.create(
+            course=self.algebra, title='Vectors',
+            description='Geometry of vector spaces')
+        results = search.search('geometry')
+        self.assertEqual(
+            [(r.kind, r.title) for r in results][0], ('course', 'Geometry'))
+        self.assertEqual(len(results), 3)
+
+    def test_texts_are_indexed_once_attached(self):
+        text = Text.objects.create(
+            owner=self.owner, title='Proof', content='pythagoras theorem')
+        self.assertEqual(search.search('pythagoras'), [])
+        Content.objects.create(module=self.module, item=text)
+        result, = search.search('pythagoras')
+        self.assertEqual((result.kind, result.course_slug), ('text', 'geometry'))
+
+    def test_updates_and_deletes_are_incremental(self):
+        self.module.title = 'Hilbert'
+        self.module.save()
+        self.assertEqual(search.search('euclid'), [])
+        self.assertEqual(len(search.search('hilbert')), 1)
+        self.module.delete()
+        self.assertEqual(search.search('hilbert'), [])
+        self.geometry.delete()
+        self.assertEqual(search.search('triangles'), [])
+
+    def test_rebuild(self):
+        self.assertEqual(search.rebuild(), 3)
+        self.assertEqual(len(search.search('rings')), 1)
+
+    def test_module_deletion_unindexes_its_texts(self):
+        text = Text.objects.create(
+            owner=self.owner, title='Proof', content='pythagoras theorem')
+        Content.objects.create(module=self.module, item=text)
+        self.module.delete()
+        self.assertEqual(search.search('pythagoras'), [])
+
+    def test_common_terms_read_their_best_postings(self):
+        self.addCleanup(
+            setattr, search, 'MAX_CANDIDATES', search.MAX_CANDIDATES)
+        search.MAX_CANDIDATES = 2
+        for i in range(4):
+            Module.objects.create(
+                course=self.algebra, title='Part {}'.format(i),
+                description=' '.join(['lemma'] * (i + 1)))
+        search.corpus_stats()
+        # frequencies, rare postings, best common postings, documents
+        with self.assertNumQueries(4):
+            results = search.search('lemma groups')
+        self.assertEqual(
+            [r.title for r in results], ['Algebra', 'Part 3', 'Part 2'])
+
+
+class CourseImporterTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('instructor', password='pw')
+        self.subject = Subject.objects.create(title='Maths', slug='maths')
+
+    def record(self, slug, modules=3):
+        return {
+            'subject': 'maths', 'owner': 'instructor',
+            'title': slug.title(), 'slug': slug, 'overview': 'About ' + slug,
+            'modules': [{
+                'title': 'Module {}'.format(m),
+                'description': '',
+                'contents': [
+                    {'type': 'text', 'title': 'Notes', 'content': 'lemma'},
+                    {'type': 'video', 'title': 'Talk',
+                     'url': 'http://example.com/v'},
+                    {'type': 'file', 'title': 'Slides',
+                     'file': 'files/slides.pdf'}]
+            } for m in range(modules)]}
+
+    def test_import_builds_ordered_courses(self):
+        stats = CourseImporter(batch_size=2).run(
+            [self.record('algebra'), self.record('geometry'),
+             self.record('topology', modules=1)])
+        self.assertEqual(
+            (stats.courses, stats.modules, stats.items), (3, 7, 21))
+        course = Course.objects.get(slug='algebra')
+        self.assertEqual(course.total_modules, 3)
+        self.assertEqual(Subject.objects.get(slug='maths').total_courses, 3)
+        module = course.modules.all()[1]
+        self.assertEqual(module.title, 'Module 1')
+        items = [c.item for c in module.contents.with_items()]
+        self.assertEqual(
+            [type(item) for item in items], [Text, Video, File])
+        self.assertEqual(items[0].owner, self.owner)
+        self.assertEqual(len(search.search('lemma')), 7)
+
+    def test_counters_continue_after_import(self):
+        CourseImporter().run([self.record('algebra')])
+        course = Course.objects.get(slug='algebra')
+        self.assertEqual(
+            Module.objects.create(course=course, title='Extra').order, 3)
+
+    def test_failure_saves_nothing(self):
+        broken = self.record('geometry')
+        broken['modules'][0]['contents'][0]['type'] = 'hologram'
+        with self.assertRaises(CourseImportError):
+            CourseImporter().run([self.record('algebra'), broken])
+        self.assertFalse(Course.objects.exists())
+
+    def test_clone(self):
+        CourseImporter().run([self.record('algebra')])
+        record = export_course(Course.objects.get(slug='algebra'))
+        self.assertEqual(record, self.record('algebra'))
+        record['slug'] = 'algebra-copy'
+        CourseImporter().run([record])
+        copy = Course.objects.get(slug='algebra-copy')
+        self.assertEqual(copy.modules.count(), 3)
+        self.assertEqual(Content.objects.filter(module__course=copy).count(), 9)
+
+    @override_settings(
+        VIDEO_METADATA_RESOLVER='courses.videos.local_metadata',
+        BACKGROUND_TASKS_EAGER=True)
+    def test_videos_and_images_processed(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        record = self.record('algebra', modules=1)
+        record['modules'][0]['contents'] = [
+            {'type': 'video', 'title': 'Talk',
+             'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'},
+            {'type': 'image', 'title': 'Diagram', 'file': 'images/d.png'}]
+        buffer = BytesIO()
+        PILImage.new('RGB', (640, 480)).save(buffer, 'PNG')
+        with self.settings(MEDIA_ROOT=media):
+            default_storage.save('images/d.png', ContentFile(buffer.getvalue()))
+            CourseImporter().run([record])
+        video = Video.objects.get()
+        self.assertEqual(video.resolved_from, video.url)
+        self.assertEqual(video.provider, 'youtube')
+        image = Image.objects.get()
+        self.assertEqual(image.derived_from, 'images/d.png')
+        self.assertEqual((image.width, image.height), (640, 480))
+
+
+class ReadRecordsTest(TestCase):
+
+    def read(self, text, chunk_size=7):
+        handle, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as f:
+            f.write(text)
+        return list(read_records(path, chunk_size))
+
+    def test_array_is_streamed_across_chunks(self):
+        records = [{'slug': 'algebra', 'modules': [{'title': 'x' * 20}]},
+                   {'slug': 'geometry', 'title': '[not, the, end]'}]
+        text = json.dumps(records, indent=2)
+        self.assertEqual(self.read(text), records)
+        self.assertEqual(self.read(text, chunk_size=1 << 16), records)
+        self.assertEqual(self.read('\n [ ]\n'), [])
+
+    def test_jsonl(self):
+        self.assertEqual(
+            self.read('{"slug": "algebra"}\n\n{"slug": "geometry"}\n'),
+            [{'slug': 'algebra'}, {'slug': 'geometry'}])
+
+    def test_malformed_array(self):
+        for text in ('[{"slug": "algebra"} {"slug": "geometry"}]',
+                     '[{"slug": "algebra"},', '[{"slug": "alg'):
+            with self.assertRaises(ValueError):
+                self.read(text)
+
+
+class ChunkedUploadTest(CourseTestCase):
+
+    def setUp(self):
+        super(ChunkedUploadTest, self).setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.module = Module.objects.create(course=self.course, title='Intro')
+        self.client.login(username='instructor', password='pw')
+
+    def start(self, size):
+        response = self.client.post(
+            reverse('module_upload_create', args=[self.module.id, 'file']),
+            json.dumps({'title': 'Notes', 'filename': 'notes.pdf',
+                        'size': size}),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return json.loads(response.content.decode())['id']
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(
+            '{}?offset={}'.format(
+                reverse('module_upload_chunk', args=[upload_id]), offset),
+            data, content_type='application/octet-stream')
+
+    def test_resume_and_attach(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            upload_id = self.start(10)
+            self.assertEqual(self.put(upload_id, 0, b'01234').status_code, 200)
+            # a retried chunk at a stale offset is refused with the offset
+            response = self.put(upload_id, 0, b'01234')
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(json.loads(response.content.decode())['received'], 5)
+
+            response = self.put(upload_id, 5, b'56789')
+            self.assertEqual(response.status_code, 200)
+            upload = Upload.objects.get(id=upload_id)
+            item = upload.content.item
+            self.assertIsInstance(item, File)
+            self.assertEqual(item.title, 'Notes')
+            with open(os.path.join(self.media, item.file.name), 'rb') as f:
+                self.assertEqual(f.read(), b'0123456789')
+            self.assertFalse(os.path.exists(
+                os.path.join(self.media, 'uploads', str(upload_id))))
+
+    def test_stale_retry_after_the_next_chunk(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            upload_id = self.start(15)
+            # the row as read by a retry of chunk 0 delayed in transit
+            stale = Upload.objects.get(id=upload_id)
+            self.assertEqual(self.put(upload_id, 0, b'01234').status_code, 200)
+            self.assertEqual(self.put(upload_id, 5, b'56789').status_code, 200)
+            with self.assertRaises(uploads.OffsetMismatch):
+                uploads.write_chunk(stale, 0, BytesIO(b'xxxxx'), 5)
+            self.assertEqual(
+                sorted(os.listdir(
+                    os.path.join(self.media, 'uploads', str(upload_id)))),
+                ['00000000000000000000.part', '00000000000000000005.part'])
+
+            self.assertEqual(self.put(upload_id, 10, b'abcde').status_code, 200)
+            item = Upload.objects.get(id=upload_id).content.item
+            with open(os.path.join(self.media, item.file.name), 'rb') as f:
+                self.assertEqual(f.read(), b'0123456789abcde')
+
+    def test_oversized_chunk_rejected(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            upload_id = self.start(4)
+            self.assertEqual(self.put(upload_id, 0, b'01234').status_code, 400)
+            self.assertEqual(Upload.objects.get(id=upload_id).received, 0)
+
+    def fail_once(self, module, name):
+        original = getattr(module, name)
+
+        def failing(*args, **kwargs):
+            setattr(module, name, original)
+            raise OSError('disk full')
+        setattr(module, name, failing)
+        self.addCleanup(setattr, module, name, original)
+
+    def test_failed_rename_gives_the_range_back(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            upload_id = self.start(10)
+            self.fail_once(uploads.os, 'rename')
+            with self.assertRaises(OSError):
+                uploads.write_chunk(
+                    Upload.objects.get(id=upload_id), 0, BytesIO(b'01234'), 5)
+            self.assertEqual(Upload.objects.get(id=upload_id).received, 0)
+
+            self.assertEqual(self.put(upload_id, 0, b'01234').status_code, 200)
+            self.assertEqual(self.put(upload_id, 5, b'56789').status_code, 200)
+            item = Upload.objects.get(id=upload_id).content.item
+            with open(os.path.join(self.media, item.file.name), 'rb') as f:
+                self.assertEqual(f.read(), b'0123456789')
+
+    def test_failed_attach_is_retried(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            upload_id = self.start(5)
+            self.fail_once(uploads, 'assemble')
+            with self.assertRaises(OSError):
+                uploads.write_chunk(
+                    Upload.objects.get(id=upload_id), 0, BytesIO(b'01234'), 5)
+            upload = Upload.objects.get(id=upload_id)
+            self.assertEqual((upload.received, upload.content), (5, None))
+
+            # any later request for the upload attaches it
+            self.assertEqual(self.put(upload_id, 5, b'').status_code, 200)
+            item = Upload.objects.get(id=upload_id).content.item
+            with open(os.path.join(self.media, item.file.name), 'rb') as f:
+                self.assertEqual(f.read(), b'01234')
+            self.assertEqual(Content.objects.filter(module=self.module).count(), 1)
+
+
+class DeferredExecutor(object):
+    """
+    Stands in for the worker pool: submitted tasks run in the test
+    thread when run() is called, and rows that are not visible then are
+    not waited for
+    """
+    def __init__(self, test):
+        self.tasks = []
+        test.addCleanup(setattr, workers, '_executor', workers._executor)
+        test.addCleanup(
+            setattr, workers, 'VISIBILITY_DELAYS', workers.VISIBILITY_DELAYS)
+        workers._executor = self
+        workers.VISIBILITY_DELAYS = ()
+
+    def submit(self, run, fn, args, kwargs):
+        # run() would close the connection of the test
+        self.tasks.append((fn, args, kwargs))
+
+    def run(self):
+        while self.tasks:
+            fn, args, kwargs = self.tasks.pop(0)
+            workers._call(fn, args, kwargs)
+
+
+class ImageDerivativesTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.owner = User.objects.create_user('instructor', password='pw')
+
+    def png(self, size):
+        buffer = BytesIO()
+        PILImage.new('RGBA', size, (200, 10, 10, 255)).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue())
+
+    def test_original_until_derivatives_exist(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            image = Image.objects.create(
+                owner=self.owner, title='diagram', file='')
+            image.file = 'images/diagram.png'
+            html = image.render_uncached()
+            self.assertIn('src="{}"'.format(reverse(
+                'content_media', args=['image', image.id, 'file'])), html)
+            self.assertNotIn('srcset', html)
+
+    def test_derivatives_generated_on_save(self):
+        with self.settings(MEDIA_ROOT=self.media,
+                           BACKGROUND_TASKS_EAGER=True):
+            image = Image(owner=self.owner, title='diagram')
+            image.file.save('diagram.png', self.png((2000, 1000)))
+            image = Image.objects.get(id=image.id)
+            self.assertEqual((image.width, image.height), (2000, 1000))
+            self.assertEqual(image.derived_from, image.file.name)
+            with open(image.thumbnail.path, 'rb') as f:
+                self.assertEqual(PILImage.open(f).size[0], 320)
+            html = image.render_uncached()
+            self.assertIn('{} 960w'.format(reverse(
+                'content_media', args=['image', image.id, 'medium'])), html)
+            self.assertIn('{} 2000w'.format(reverse(
+                'content_media', args=['image', image.id, 'file'])), html)
+
+            # replacing the file drops the derivatives until regenerated,
+            # and deletes them once the replacement is committed
+            stale = image.thumbnail.path
+            with self.settings(BACKGROUND_TASKS_EAGER=False):
+                executor = DeferredExecutor(self)
+                image.file.save('other.png', self.png((100, 50)))
+                self.assertEqual(image.medium.name, '')
+                self.assertTrue(os.path.exists(stale))
+                executor.run()
+            image = Image.objects.get(id=image.id)
+            self.assertEqual(image.derived_from, image.file.name)
+            self.assertEqual((image.width, image.height), (100, 50))
+            self.assertFalse(os.path.exists(stale))
+
+    def test_edit_waits_for_its_file(self):
+        with self.settings(MEDIA_ROOT=self.media,
+                           BACKGROUND_TASKS_EAGER=False):
+            executor = DeferredExecutor(self)
+            image = Image(owner=self.owner, title='diagram')
+            image.file.save('diagram.png', self.png((640, 480)))
+            executor.run()
+            derived = Image.objects.get(id=image.id).thumbnail.path
+
+            # the row as seen by the pool before the edit commits
+            image.file = default_storage.save('images/other.png',
+                                              self.png((100, 50)))
+            image.stale_derivatives = [derived]
+            images.schedule(image)
+            executor.run()
+            stored = Image.objects.get(id=image.id)
+            self.assertEqual(stored.derived_from, 'images/diagram.png')
+            self.assertTrue(os.path.exists(derived))
+
+            image.save()
+            executor.run()
+            stored = Image.objects.get(id=image.id)
+            self.assertEqual(stored.derived_from, 'images/other.png')
+            self.assertEqual(stored.width, 100)
+            self.assertFalse(os.path.exists(derived))
+
+    def test_replaced_file_not_overwritten(self):
+        with self.settings(MEDIA_ROOT=self.media):
+            name = default_storage.save('images/old.png', self.png((50, 50)))
+            image = Image.objects.create(
+                owner=self.owner, title='diagram', file='')
+            self.assertFalse(images.generate(image.id, name))
+            self.assertEqual(Image.objects.get(id=image.id).derived_from, '')
+            self.assertEqual(
+                os.listdir(os.path.join(self.media, 'images', 'derivatives')),
+                [])
+
+
+class ContentMediaTest(CourseTestCase):
+
+    def setUp(self):
+        super(ContentMediaTest, self).setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.student = User.objects.create_user('student', password='pw')
+        module = Module.objects.create(course=self.course, title='Intro')
+        os.makedirs(os.path.join(self.media, 'files'))
+        with open(os.path.join(self.media, 'files', 'notes.pdf'), 'wb') as f:
+            f.write(b'0123456789')
+        item = File.objects.create(
+            owner=self.owner, title='Notes', file='files/notes.pdf')
+        Content.objects.create(module=module, item=item)
+        self.url = reverse('content_media', args=['file', item.id, 'file'])
+        self.client.login(username='student', password='pw')
+
+    def get(self, **headers):
+        with self.settings(MEDIA_ROOT=self.media):
+            return self.client.get(self.url, **headers)
+
+    def test_enrollment_required(self):
+        self.assertEqual(self.get().status_code, 404)
+        self.course.students.add(self.student)
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_range_and_conditional_get(self):
+        self.course.students.add(self.student)
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(self.get(HTTP_RANGE='bytes=-3').status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=20-').status_code, 416)
+        etag = response['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_accel_redirect(self):
+        self.course.students.add(self.student)
+        with self.settings(MEDIA_ACCEL_REDIRECT=True, MEDIA_URL='/media/'):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/media/files/notes.pdf')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@modify_settings(MIDDLEWARE_CLASSES={
+    'prepend': 'courses.instrumentation.RequestStatsMiddleware'})
+class RequestStatsTest(CourseTestCase):
+
+    def setUp(self):
+        instrumentation.requests.reset()
+        super(RequestStatsTest, self).setUp()
+
+    def test_recorded_per_url_name(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('course_detail', args=['algebra']))
+        # the next request resets the query log
+        count = len(queries)
+        self.client.get(reverse('course_detail', args=['algebra']))
+        row = instrumentation.summarize(
+            instrumentation.requests.snapshot())['course_detail']
+        self.assertEqual(row['requests'], 2)
+        self.assertEqual(row['max_queries'], count)
+        self.assertGreater(row['avg_template_ms'], 0)
+        self.assertIsNotNone(row['p95_ms'])
+
+    def test_histogram_percentiles(self):
+        record = instrumentation.RequestRecord()
+        for latency in [0.003] * 95 + [0.4] * 5:
+            instrumentation.requests.record('view', latency, record)
+        row = instrumentation.summarize(
+            instrumentation.requests.snapshot())['view']
+        self.assertEqual((row['p50_ms'], row['p95_ms'], row['p99_ms']),
+                         (5, 5, 500))
+        merged = instrumentation.merge([
+            instrumentation.requests.snapshot()] * 2)
+        self.assertEqual(merged['view']['counters'][0], 200)
+
+    def test_every_published_process_is_collected(self):
+        cache.clear()
+        self.addCleanup(setattr, instrumentation, '_slot', None)
+        self.addCleanup(
+            setattr, instrumentation, '_process_key',
+            instrumentation._process_key)
+        instrumentation.requests.record(
+            'view', 0.01, instrumentation.RequestRecord())
+        instrumentation.publish()
+        # another process
+        instrumentation._slot = None
+        instrumentation._process_key = lambda: 'instrumentation:process:b:1'
+        instrumentation.publish()
+        self.assertEqual(
+            instrumentation.collect()['view']['counters'][0], 2)
+
+        # the first one went away
+        cache.delete(instrumentation._slot_key(1))
+        self.assertEqual(
+            instrumentation.collect()['view']['counters'][0], 1)
+        self.assertEqual(cache.get(instrumentation.FIRST_SLOT_KEY), 2)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CourseQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Cold-cache query budgets of every named course and API URL
+    """
+    BUDGETS = {
+        'course_list': 4,
+        'course_list_subject': 4,
+        'course_detail': 5,
+        'course_search': 5,
+        'manage_course_list': 5,
+        'course_create': 7,
+        'course_edit': 8,
+        'course_delete': 7,
+        'course_module_update': 6,
+        'module_content_create': 5,
+        'module_content_update': 6,
+        'module_content_delete': 16,
+        'module_upload_create': 6,
+        'module_upload_chunk': 5,
+        'content_media': 7,
+        'module_content_list': 10,
+        'module_order': 8,
+        'content_order': 8,
+        'cache_stats': 3,
+        'enrollment_queue_stats': 3,
+        'request_stats': 3,
+        'api:api-root': 1,
+        'api:subject_list': 3,
+        'api:subject_detail': 3,
+        'api:search': 5,
+        'api:course-list': 5,
+        'api:course-detail': 5,
+        'api:course-enroll': 17,
+        'api:course-contents': 12,
+    }
+
+    def basic_auth(self, username):
+        return 'Basic {}'.format(base64.b64encode('{}:{}'.format(
+            username, 'password').encode()).decode())
+
+    def check(self, name, dense, sparse=None):
+        self.assertBudget(name, self.BUDGETS[name], dense, sparse)
+
+    def test_every_url_has_a_budget(self):
+        names = url_names('courses.urls') | url_names(
+            'courses.api.urls', 'api') | {'course_list'}
+        self.assertEqual(names - set(self.BUDGETS), set())
+
+    def test_catalog(self):
+        self.check('course_list', call('get', reverse('course_list')))
+        self.check('course_list_subject', call('get', reverse(
+            'course_list_subject', args=[self.dense_course.subject.slug])))
+        self.check(
+            'course_detail',
+            call('get', reverse('course_detail', args=[
+                self.dense_course.slug])),
+            call('get', reverse('course_detail', args=[
+                self.sparse_course.slug])))
+        self.check('course_search', call(
+            'get', reverse('course_search'), data={'q': 'algebra proofs'}))
+
+    def test_course_management(self):
+        user = self.instructor.username
+        self.check('manage_course_list', call(
+            'get', reverse('manage_course_list'), user))
+        self.check('course_create', call(
+            'get', reverse('course_create'), user))
+        for name in ('course_edit', 'course_delete', 'course_module_update'):
+            self.check(
+                name,
+                call('get', reverse(name, args=[self.dense_course.id]), user),
+                call('get', reverse(name, args=[self.sparse_course.id]), user))
+
+    def test_content_management(self):
+        user = self.instructor.username
+        content = self.dense_module.contents.last()
+        self.check('module_content_create', call('get', reverse(
+            'module_content_create', args=[self.dense_module.id, 'text']),
+            user))
+        self.check('module_content_update', call('get', reverse(
+            'module_content_update', args=[
+                self.dense_module.id, content.content_type.model,
+                content.object_id]), user))
+        self.check(
+            'module_content_list',
+            call('get', reverse(
+                'module_content_list', args=[self.dense_module.id]), user),
+            call('get', reverse(
+                'module_content_list', args=[self.sparse_module.id]), user))
+        self.check('module_order', call(
+            'post', reverse('module_order'), user,
+            data=json.dumps(dict(
+                (module.id, i) for i, module in enumerate(
+                    self.dense_course.modules.reverse()))),
+            content_type='application/json'))
+        self.check('content_order', call(
+            'post', reverse('content_order'), user,
+            data=json.dumps(dict(
+                (content.id, i) for i, content in enumerate(
+                    self.dense_module.contents.reverse()))),
+            content_type='application/json'))
+        self.check('module_content_delete', call('post', reverse(
+            'module_content_delete', args=[content.id]), user))
+
+    def test_uploads_and_media(self):
+        user = self.instructor.username
+        self.check('module_upload_create', call(
+            'post', reverse('module_upload_create', args=[
+                self.dense_module.id, 'file']), user,
+            data=json.dumps({'filename': 'notes.pdf', 'size': 10}),
+            content_type='application/json'))
+        upload = Upload.objects.create(
+            owner=self.instructor, module=self.dense_module,
+            model_name='file', title='Notes', filename='notes.pdf', size=10)
+        self.check('module_upload_chunk', call('get', reverse(
+            'module_upload_chunk', args=[upload.id]), user))
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        os.makedirs(os.path.join(media, 'files'))
+        with open(os.path.join(media, 'files', 'seed.pdf'), 'wb') as f:
+            f.write(b'%PDF')
+        item = File.objects.filter(
+            id__in=self.dense_module.contents.values('object_id'),
+            file='files/seed.pdf').first()
+        with self.settings(MEDIA_ROOT=media):
+            self.check('content_media', call('get', reverse(
+                'content_media', args=['file', item.id, 'file']),
+                self.dense_student))
+
+    def test_stats(self):
+        for name in ('cache_stats', 'enrollment_queue_stats',
+                     'request_stats'):
+            self.check(name, call(
+                'get', reverse(name), self.instructor.username))
+
+    def test_api(self):
+        self.check('api:api-root', call('get', reverse('api:api-root')))
+        self.check('api:subject_list', call(
+            'get', reverse('api:subject_list')))
+        self.check('api:subject_detail', call('get', reverse(
+            'api:subject_detail', args=[self.dense_course.subject_id])))
+        self.check('api:search', call(
+            'get', reverse('api:search'), data={'q': 'graphs'}))
+        self.check('api:course-list', call('get', reverse('api:course-list')))
+        self.check(
+            'api:course-detail',
+            call('get', reverse('api:course-detail', args=[
+                self.dense_course.id])),
+            call('get', reverse('api:course-detail', args=[
+                self.sparse_course.id])))
+        auth = self.basic_auth(self.dense_student)
+        self.check(
+            'api:course-contents',
+            call('get', reverse('api:course-contents', args=[
+                self.dense_course.id]), HTTP_AUTHORIZATION=auth),
+            call('get', reverse('api:course-contents', args=[
+                self.sparse_course.id]), HTTP_AUTHORIZATION=auth))
+        with self.settings(BACKGROUND_TASKS_EAGER=True):
+            self.check('api:course-enroll', call('post', reverse(
+                'api:course-enroll', args=[self.dense_course.id]),
+                HTTP_AUTHORIZATION=self.basic_auth(self.sparse_student)))
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class EnrollmentQueueTest(CourseTestCase):
+
+    def setUp(self):
+        cache.clear()
+        super(EnrollmentQueueTest, self).setUp()
+        self.students = [
+            User.objects.create_user('student{}'.format(i), password='pw')
+            for i in range(3)]
+        self.queue = enrollment.EnrollmentQueue()
+        self.addCleanup(setattr, enrollment, 'queue', enrollment.queue)
+        enrollment.queue = self.queue
+        self.queue.start = lambda: None
+
+    def test_enrolled_before_the_flush(self):
+        student = self.students[0]
+        enrollment.enroll(student, self.course.id)
+        self.assertTrue(enrollment.is_enrolled(student, self.course.id))
+        self.assertIn(self.course.id, enrollment.enrolled_course_ids(student))
+        self.assertFalse(self.course.students.exists())
+        self.assertEqual(self.queue.metrics()['depth'], 1)
+
+    def test_batch_insert_ignores_existing_rows(self):
+        self.course.students.add(self.students[0])
+        received = []
+
+        def receiver(action, pk_set, **kwargs):
+            if action == 'post_add':
+                received.append(set(pk_set))
+        m2m_changed.connect(receiver, sender=Course.students.through)
+        self.addCleanup(
+            m2m_changed.disconnect, receiver,
+            sender=Course.students.through)
+
+        for student in self.students + self.students[1:]:
+            enrollment.enroll(student, self.course.id)
+        self.assertEqual(self.queue.metrics()['duplicates'], 2)
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(received, [
+            set(student.id for student in self.students[1:])])
+        self.assertEqual(self.course.students.count(), 3)
+        self.assertEqual(
+            Course.objects.get(id=self.course.id).total_students, 3)
+        metrics = self.queue.metrics()
+        self.assertEqual((metrics['depth'], metrics['batches']), (0, 1))
+        self.assertEqual(self.queue.flush(), 0)
+
+    def test_deleted_users_and_courses_are_dropped(self):
+        other = Course.objects.create(
+            owner=self.course.owner, subject=self.course.subject,
+            title='Geometry', slug='geometry', overview='Angles')
+        enrollment.enroll(self.students[0], self.course.id)
+        enrollment.enroll(self.students[1], other.id)
+        enrollment.enroll(self.students[2], self.course.id)
+        self.students[0].delete()
+        other.delete()
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(
+            list(self.course.students.values_list('id', flat=True)),
+            [self.students[2].id])
+        self.assertEqual(
+            Course.objects.get(id=self.course.id).total_students, 1)
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_locked_pending_set_is_written_at_once(self):
+        student = self.students[0]
+        self.addCleanup(
+            setattr, enrollment, 'PENDING_LOCK_WAIT',
+            enrollment.PENDING_LOCK_WAIT)
+        enrollment.PENDING_LOCK_WAIT = 0
+        # held by another process, or an unreachable cache server
+        cache.add('enrollment:pending-lock:{}'.format(student.id), 'x', 60)
+        enrollment.enroll(student, self.course.id)
+        self.assertTrue(self.course.students.filter(id=student.id).exists())
+        self.assertEqual(self.queue.depth(), 0)
+        self.assertEqual(
+            cache.get('enrollment:pending-lock:{}'.format(student.id)), 'x')
+
+    def test_another_process_flushes_the_buffer(self):
+        student = self.students[0]
+        enrollment.enroll(student, self.course.id)
+        # the process that enrolled is gone, its queue with it
+        self.assertEqual(enrollment.EnrollmentQueue().flush(), 1)
+        self.assertTrue(self.course.students.filter(id=student.id).exists())
+        self.assertEqual(enrollment.pending_course_ids(student), frozenset())
+
+    def test_enrollments_during_a_flush_stay_pending(self):
+        student = self.students[0]
+        other = Course.objects.create(
+            owner=self.course.owner, subject=self.course.subject,
+            title='Geometry', slug='geometry', overview='Angles')
+
+        def receiver(action, **kwargs):
+            if action == 'post_add':
+                enrollment.enroll(student, other.id)
+        m2m_changed.connect(receiver, sender=Course.students.through)
+        self.addCleanup(
+            m2m_changed.disconnect, receiver,
+            sender=Course.students.through)
+
+        enrollment.enroll(student, self.course.id)
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(
+            enrollment.pending_course_ids(student), frozenset([other.id]))
+        self.assertTrue(enrollment.is_enrolled(student, other.id))
+        m2m_changed.disconnect(receiver, sender=Course.students.through)
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(enrollment.pending_course_ids(student), frozenset())
+        self.assertEqual(
+            enrollment.enrolled_course_ids(student),
+            frozenset([self.course.id, other.id]))
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConditionalCourseApiTest(CourseTestCase):
+
+    def setUp(self):
+        super(ConditionalCourseApiTest, self).setUp()
+        self.student = User.objects.create_user('student', password='pw')
+        self.module = Module.objects.create(course=self.course, title='Intro')
+        self.text = Text.objects.create(
+            owner=self.owner, title='Notes', content='Groups')
+        Content.objects.create(module=self.module, item=self.text)
+        self.course.students.add(self.student)
+        self.auth = 'Basic {}'.format(
+            base64.b64encode(b'student:pw').decode())
+        self.contents_url = reverse(
+            'api:course-contents', args=[self.course.id])
+
+    def contents(self, **headers):
+        return self.client.get(
+            self.contents_url, HTTP_AUTHORIZATION=self.auth, **headers)
+
+    def test_contents_not_modified(self):
+        etag = self.contents()['ETag']
+        with self.assertNumQueries(2):
+            # the user and the course stamp, the enrollments are cached
+            response = self.contents(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.text.content = 'Rings'
+        self.text.save()
+        response = self.contents(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_contents_stamp_follows_module_changes(self):
+        etag = self.contents()['ETag']
+        Module.objects.create(course=self.course, title='Second')
+        self.assertEqual(
+            self.contents(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_contents_permission_checked_first(self):
+        etag = self.contents()['ETag']
+        self.course.students.remove(self.student)
+        self.assertEqual(
+            self.contents(HTTP_IF_NONE_MATCH=etag).status_code, 403)
+
+    def test_list_not_modified(self):
+        url = reverse('api:course-list')
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        other = User.objects.create_user('other', password='pw')
+        etag = self.client.get(url)['ETag']
+        self.course.students.add(other)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertNotEqual(
+            self.client.get(url + '?students=count')['ETag'], etag)
+
+    def test_renderers_have_their_own_etag(self):
+        url = reverse('api:course-list')
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertIn('Accept', response['Vary'])
+        browsable = self.client.get(
+            url, HTTP_ACCEPT='text/html',
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(browsable.status_code, 200)
+        self.assertNotEqual(browsable['ETag'], response['ETag'])
+
+
+def unreachable_metadata(url):
+    raise videos.MetadataError('{}: connection refused'.format(url))
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    VIDEO_METADATA_RESOLVER='courses.videos.local_metadata',
+    BACKGROUND_TASKS_EAGER=True)
+class VideoMetadataTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('instructor', password='pw')
+
+    def test_metadata_stored_on_save(self):
+        video = Video.objects.create(
+            owner=self.owner, title='Talk',
+            url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        video = Video.objects.get(id=video.id)
+        self.assertEqual(
+            (video.provider, video.video_id, video.embed_url,
+             video.width, video.height),
+            ('youtube', 'dQw4w9WgXcQ',
+             'https://www.youtube.com/embed/dQw4w9WgXcQ', 480, 360))
+        self.assertEqual(video.resolved_from, video.url)
+        with self.assertNumQueries(0):
+            html = video.render_uncached()
+        self.assertIn('src="https://www.youtube.com/embed/dQw4w9WgXcQ"', html)
+
+        # a new url is resolved again
+        video.url = 'https://vimeo.com/76979871'
+        video.save()
+        video = Video.objects.get(id=video.id)
+        self.assertEqual(
+            (video.provider, video.embed_url),
+            ('vimeo', 'https://player.vimeo.com/video/76979871'))
+
+    def test_unknown_provider_links_to_the_url(self):
+        video = Video.objects.create(
+            owner=self.owner, title='Talk', url='http://example.com/v')
+        video = Video.objects.get(id=video.id)
+        self.assertEqual(
+            (video.embed_url, video.resolved_from),
+            ('', 'http://example.com/v'))
+        self.assertIn(
+            '<a href="http://example.com/v">', video.render_uncached())
+
+    def test_backfill_command(self):
+        url = 'https://youtu.be/dQw4w9WgXcQ'
+        Video.objects.bulk_create([
+            Video(owner=self.owner, title='Talk', url=url),
+            Video(owner=self.owner, title='Bad', url='http://example.com/v')])
+        out, err = StringIO(), StringIO()
+        call_command('video_metadata', stdout=out, stderr=err)
+        self.assertIn('1 videos resolved, 1 failed', out.getvalue())
+        self.assertEqual(
+            Video.objects.get(title='Talk').thumbnail_url,
+            'https://img.youtube.com/vi/dQw4w9WgXcQ/hqdefault.jpg')
+        out = StringIO()
+        call_command('video_metadata', stdout=out, stderr=err)
+        self.assertIn('0 videos resolved, 0 failed', out.getvalue())
+
+    def test_provider_failure_is_retried(self):
+        url = 'https://youtu.be/dQw4w9WgXcQ'
+        with self.settings(
+                VIDEO_METADATA_RESOLVER='courses.tests.test_courses.unreachable_metadata'):
+            video = Video.objects.create(
+                owner=self.owner, title='Talk', url=url)
+        video = Video.objects.get(id=video.id)
+        self.assertEqual((video.embed_url, video.resolved_from), ('', ''))
+        call_command('video_metadata', stdout=StringIO(), stderr=StringIO())
+        video = Video.objects.get(id=video.id)
+        self.assertEqual(
+            (video.provider, video.resolved_from), ('youtube', url))
+
+
+class CompactSerializerTest(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('instructor', password='pw')
+        students = [
+            User.objects.create_user('s{}'.format(i)) for i in range(3)]
+        for i in range(3):
+            subject = Subject.objects.create(
+                title='Subject {}'.format(i), slug='subject-{}'.format(i))
+            course = Course.objects.create(
+                owner=owner, subject=subject, title='Course {}'.format(i),
+                slug='course-{}'.format(i), overview='Overview')
+            for order in range(i):
+                Module.objects.create(
+                    course=course, title='Module {}'.format(order),
+                    description='')
+            course.students.add(*students[:i])
+
+    def assertSameJSON(self, serializer_class, queryset, context=None):
+        plan = FieldPlan.for_serializer(serializer_class, context)
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(plan.represent(plan.values(queryset))),
+            renderer.render(serializer_class(
+                queryset, many=True, context=context or {}).data))
+
+    def test_same_json_as_the_serializers(self):
+        self.assertSameJSON(SubjectSerializer, Subject.objects.all())
+        courses = Course.objects.order_by('-created', '-id')
+        for students in CourseSerializer.STUDENTS_MODES:
+            self.assertSameJSON(
+                CourseSerializer, courses, {'students': students})
+
+    def test_plan_is_computed_once(self):
+        self.assertIs(
+            FieldPlan.for_serializer(CourseSerializer, {'students': 'count'}),
+            FieldPlan.for_serializer(CourseSerializer, {'students': 'count'}))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class OrderCounterConcurrencyTest(CourseFixtureMixin, TransactionTestCase):
+    """
+    Needs a database with row locking (e.g. PostgreSQL); SQLite
+    serializes writers by failing them instead.
+    """
+    threads = 8
+    inserts = 25
+
+    def test_concurrent_inserts_get_distinct_orders(self):
+        owner = self.owner
+        module = Module.objects.create(course=self.course, title='Intro')
+        errors = []
+
+        def insert():
+            try:
+                for i in range(self.inserts):
+                    text = Text.objects.create(
+                        owner=owner, title='t', content='c')
+                    Content.objects.create(module=module, item=text)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=insert) for i in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            sorted(module.contents.values_list('order', flat=True)),
+            list(range(self.threads * self.inserts)))
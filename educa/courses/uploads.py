@@ -0,0 +1,217 @@
+"""
+Chunked, resumable uploads for File and Image contents.
+
+1. POST course/module/<module_id>/upload/<file|image>/ with
+   {"title", "filename", "size"} starts an upload.
+2. PUT course/upload/<id>/?offset=<n> with a raw chunk as the body writes
+   it at byte n. n must be the number of bytes received so far, which
+   GET course/upload/<id>/ returns, so an interrupted upload resumes
+   from its last received chunk.
+
+Each chunk is streamed, without being buffered in memory, to a
+private temporary file under MEDIA_ROOT/uploads/<id>/. It is renamed
+to the part file of its offset in the transaction that moves the upload
+row from offset to the new received count (a conditional UPDATE only
+one request can win), so a delayed retry of an accepted chunk never
+touches accepted bytes and a failed rename gives the range back. When
+the last byte arrives the parts are concatenated into the media storage
+and attached to a new item and Content row of the module; if that
+fails, the next PUT to the upload attaches it again.
+"""
+import os
+import shutil
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import get_valid_filename
+
+from . import fragments
+from .models import Content, Upload
+
+READ_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    pass
+
+
+class OffsetMismatch(ChunkError):
+    pass
+
+
+def max_chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+
+
+def part_dir(upload):
+    return os.path.join(settings.MEDIA_ROOT, 'uploads', str(upload.id))
+
+
+def part_path(upload, offset):
+    return os.path.join(part_dir(upload), '{:020d}.part'.format(offset))
+
+
+def parts(upload):
+    """
+    Returns:
+        list -- (offset, path) of the accepted chunks, in order
+    """
+    directory = part_dir(upload)
+    return sorted(
+        (int(name[:-len('.part')]), os.path.join(directory, name))
+        for name in os.listdir(directory) if name.endswith('.part'))
+
+
+def status(upload):
+    return {
+        'id': upload.id,
+        'size': upload.size,
+        'received': upload.received,
+        'chunk_size': max_chunk_size(),
+        'content': upload.content_id,
+    }
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Store the chunk of length bytes read from stream that starts at
+    offset and attach the upload once complete.
+
+    Arguments:
+        upload {Upload} -- the upload in progress
+        offset {int} -- where the chunk starts
+        stream {file-like} -- the request, read READ_SIZE bytes at a time
+        length {int} -- the chunk size announced by Content-Length
+
+    Raises:
+        OffsetMismatch -- offset is not the number of received bytes
+        ChunkError -- the chunk is empty or overflows the upload
+    """
+    if upload.content_id is None and upload.received == upload.size:
+        # every byte was accepted but attaching them failed
+        attach(upload)
+        return
+    if upload.content_id or offset != upload.received:
+        raise OffsetMismatch(offset)
+    if length <= 0 or offset + length > upload.size:
+        raise ChunkError('chunk must hold 1 to {} bytes'.format(
+            upload.size - offset))
+
+    directory = part_dir(upload)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    temporary = os.path.join(
+        directory, '{}.{}.tmp'.format(offset, uuid.uuid4().hex))
+    try:
+        with open(temporary, 'wb') as part:
+            remaining = length
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                part.write(data)
+                remaining -= len(data)
+        received = offset + length - remaining
+        if received == offset:
+            raise ChunkError('the chunk body is empty')
+
+        # claim the range: only one request may move the upload from
+        # offset to received, a stale retry loses here; the claim is
+        # only committed with the bytes in place
+        with transaction.atomic():
+            if not Upload.objects.filter(
+                    id=upload.id, received=offset, content=None
+            ).update(received=received):
+                raise OffsetMismatch(offset)
+            os.rename(temporary, part_path(upload, offset))
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    upload.received = received
+    if received == upload.size:
+        attach(upload)
+
+
+def assemble(upload):
+    """
+    Concatenate the parts of a complete upload into one file
+
+    Returns:
+        str -- path of the assembled file, the caller removes it
+
+    Raises:
+        ChunkError -- the parts do not cover the upload exactly
+    """
+    path = os.path.join(
+        part_dir(upload), 'assembled.{}'.format(uuid.uuid4().hex))
+    try:
+        position = 0
+        with open(path, 'wb') as assembled:
+            for offset, part_name in parts(upload):
+                if offset != position:
+                    raise ChunkError('missing bytes at {}'.format(position))
+                with open(part_name, 'rb') as part:
+                    shutil.copyfileobj(part, assembled, READ_SIZE)
+                position = assembled.tell()
+        if position != upload.size:
+            raise ChunkError('missing bytes at {}'.format(position))
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def attach(upload):
+    """
+    Move the assembled file into the media storage and create its item
+    and Content row. The parts are kept until that commits, so a failed
+    attach can be run again.
+    """
+    model = apps.get_model('courses', upload.model_name)
+    field = model._meta.get_field('file')
+    path = assemble(upload)
+    try:
+        with transaction.atomic():
+            # a concurrent retry may have attached it meanwhile
+            current = Upload.objects.select_for_update().get(id=upload.id)
+            if current.content_id:
+                upload.content_id = current.content_id
+                return
+            name = _store(path, os.path.join(
+                field.upload_to,
+                get_valid_filename(os.path.basename(upload.filename))))
+            item = model.objects.create(
+                owner=upload.owner, title=upload.title, file=name)
+            upload.content = Content.objects.create(
+                module_id=upload.module_id, item=item)
+            upload.save(update_fields=['content'])
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(part_dir(upload), ignore_errors=True)
+    fragments.invalidate_modules([upload.module_id])
+
+
+def _store(path, name):
+    """
+    Move the file at path into the media storage under name, or a free
+    variant of it
+
+    Returns:
+        str -- the stored name
+    """
+    name = default_storage.get_available_name(name)
+    try:
+        target = default_storage.path(name)
+    except NotImplementedError:
+        # not a local storage: copy it there
+        with open(path, 'rb') as assembled:
+            return default_storage.save(name, DjangoFile(assembled))
+    if not os.path.isdir(os.path.dirname(target)):
+        os.makedirs(os.path.dirname(target))
+    os.rename(path, target)
+    return name
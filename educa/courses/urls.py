@@ -40,6 +40,21 @@ urlpatterns = [
         views.ContentDeleteView.as_view(),
         name='module_content_delete'
         ),
+    url(
+        r'^module/(?P<module_id>\d+)/upload/(?P<model_name>\w+)/$',
+        views.UploadCreateView.as_view(),
+        name='module_upload_create'
+        ),
+    url(
+        r'^upload/(?P<id>\d+)/$',
+        views.UploadChunkView.as_view(),
+        name='module_upload_chunk'
+        ),
+    url(
+        r'^media/(?P<model_name>file|image)/(?P<id>\d+)/(?P<field>\w+)/$',
+        views.ContentMediaView.as_view(),
+        name='content_media'
+        ),
     url(r'^module/(?P<module_id>\d+)/$',
         views.ModuleContentListView.as_view(),
         name='module_content_list'),
@@ -51,6 +66,22 @@ urlpatterns = [
         r'^content/order/$',
         views.ContentOrderView.as_view(),
         name='content_order'),
+    url(
+        r'^search/$',
+        views.CourseSearchView.as_view(),
+        name='course_search'),
+    url(
+        r'^cache/stats/$',
+        views.CacheStatsView.as_view(),
+        name='cache_stats'),
+    url(
+        r'^enrollments/stats/$',
+        views.EnrollmentQueueStatsView.as_view(),
+        name='enrollment_queue_stats'),
+    url(
+        r'^requests/stats/$',
+        views.RequestStatsView.as_view(),
+        name='request_stats'),
     url(
         r'^subject/(?P<subject>[\w-]+)/$',
         views.CourseListView.as_view(),
@@ -0,0 +1,80 @@
+"""
+Version stamps of courses, for conditional GETs of the API.
+
+Course.updated is maintained as the version of everything a course
+shows: saving the course sets it, and courses.signals (or the views
+writing with UPDATE) touch it when one of its modules, contents or items
+changes and when students leave the course. A course is stamped by
+reading that column, the catalog with one aggregate query.
+"""
+import hashlib
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .conditional import make_etag, timestamp
+from .models import Course, Content
+
+
+def touch_courses(course_ids):
+    course_ids = set(course_ids)
+    if course_ids:
+        Course.objects.filter(id__in=course_ids).update(
+            updated=timezone.now())
+
+
+def touch_modules(module_ids):
+    module_ids = set(module_ids)
+    if module_ids:
+        Course.objects.filter(modules__id__in=module_ids).update(
+            updated=timezone.now())
+
+
+def touch_items(model, item_ids):
+    """
+    Touch the courses showing the given items of model
+    """
+    Course.objects.filter(modules__contents__in=Content.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id__in=list(item_ids))).update(updated=timezone.now())
+
+
+def course_stamp(course_id):
+    """
+    Returns:
+        tuple -- (etag, last modified) of the course contents, or None
+        when the course does not exist
+    """
+    updated = Course.objects.filter(id=course_id).values_list(
+        'updated', flat=True).first()
+    if updated is None:
+        return None
+    return make_etag(
+        'course', course_id, timestamp(updated), updated.microsecond), updated
+
+
+def catalog_stamp(variant):
+    """
+    The stamp of every course listing, read with one MAX/COUNT/SUM
+    aggregate over the whole course table. A change to any course can
+    move rows between cursor pages, so pages are not stamped apart; the
+    MAX uses the index on updated but the COUNT and SUM scan the table,
+    which is the cost of every list request (304 or not).
+
+    Arguments:
+        variant {str} -- what else the representation depends on, e.g.
+        the full path with its query string
+
+    Returns:
+        tuple -- (etag, last modified) of the course listings
+    """
+    stamp = Course.objects.order_by().aggregate(
+        updated=Max('updated'), courses=Count('id'),
+        students=Sum('total_students'))
+    digest = hashlib.md5(variant.encode('utf-8')).hexdigest()[:12]
+    updated = stamp['updated']
+    return make_etag(
+        'courses', timestamp(updated) if updated else 0,
+        updated.microsecond if updated else 0, stamp['courses'],
+        stamp['students'] or 0, digest), updated
@@ -0,0 +1,202 @@
+"""
+Provider metadata of Video contents.
+
+Saving a Video schedules resolve() in the background worker pool (see
+courses.signals). It asks django-embed-video for the provider, video id,
+embed URL and thumbnail of the url, plus the frame size when the
+provider reports it, and stores them on the video; the template only
+reads those fields. Answers are cached per url, so the videos of a
+cloned or imported course are resolved without asking the provider
+again.
+
+A url of no known provider is stored as resolved with empty metadata;
+other failures (the provider not answering) leave the video unresolved
+for the video_metadata command to retry.
+
+The resolver is named by the VIDEO_METADATA_RESOLVER setting;
+local_metadata() recognises YouTube and Vimeo urls without any network
+access and stands in for the providers in tests.
+"""
+import hashlib
+import logging
+import re
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import fragments, versions, workers
+from .models import Content, Video
+
+logger = logging.getLogger(__name__)
+
+# the 'small' size of the embed_video tag the template used to call
+WIDTH = 480
+HEIGHT = 360
+FIELDS = (
+    'provider', 'video_id', 'embed_url', 'thumbnail_url', 'width', 'height')
+
+
+class MetadataError(Exception):
+    """
+    The metadata could not be read this time, e.g. the provider did
+    not answer
+    """
+
+
+class UnknownVideoError(MetadataError):
+    """
+    The url is not one of a known provider, asking again will not help
+    """
+
+
+def _timeout():
+    return getattr(settings, 'VIDEO_METADATA_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+
+def _size(info):
+    """
+    The embed size for a provider reporting a frame of info['width'] by
+    info['height'], keeping the default width
+    """
+    try:
+        width, height = int(info['width']), int(info['height'])
+    except (KeyError, TypeError, ValueError):
+        return WIDTH, HEIGHT
+    if not width or not height:
+        return WIDTH, HEIGHT
+    return WIDTH, WIDTH * height // width
+
+
+def embed_video_metadata(url):
+    """
+    Metadata of url from the django-embed-video backends, which may
+    query the provider (e.g. the Vimeo API for its thumbnails)
+
+    Returns:
+        dict -- values of FIELDS
+    """
+    from embed_video.backends import (
+        detect_backend, UnknownBackendException, VideoDoesntExistException)
+    try:
+        backend = detect_backend(url)
+    except UnknownBackendException as e:
+        raise UnknownVideoError('{}: {}'.format(url, e))
+    try:
+        metadata = {
+            'provider': type(backend).__name__.replace(
+                'Backend', '').lower(),
+            'video_id': backend.code,
+            'embed_url': backend.url,
+            'thumbnail_url': backend.thumbnail or ''}
+        try:
+            info = backend.get_info() or {}
+        except NotImplementedError:
+            info = {}
+    except (VideoDoesntExistException, IOError, ValueError, KeyError) as e:
+        raise MetadataError('{}: {}'.format(url, e))
+    metadata['width'], metadata['height'] = _size(info)
+    return metadata
+
+
+LOCAL_PATTERNS = (
+    ('youtube', re.compile(
+        r'^https?://(?:www\.|m\.)?(?:youtube\.com/(?:watch\?(?:.*&)?v=|'
+        r'embed/|v/)|youtu\.be/)(?P<code>[\w-]{11})')),
+    ('vimeo', re.compile(
+        r'^https?://(?:www\.|player\.)?vimeo\.com/(?:video/)?'
+        r'(?P<code>\d+)')),
+)
+LOCAL_URLS = {
+    'youtube': ('https://www.youtube.com/embed/{}',
+                'https://img.youtube.com/vi/{}/hqdefault.jpg'),
+    'vimeo': ('https://player.vimeo.com/video/{}', ''),
+}
+
+
+def local_metadata(url):
+    """
+    Metadata of YouTube and Vimeo urls, from the url alone
+
+    Returns:
+        dict -- values of FIELDS
+    """
+    for provider, pattern in LOCAL_PATTERNS:
+        match = pattern.match(url)
+        if match:
+            code = match.group('code')
+            embed, thumbnail = LOCAL_URLS[provider]
+            return {
+                'provider': provider, 'video_id': code,
+                'embed_url': embed.format(code),
+                'thumbnail_url': thumbnail.format(code),
+                'width': WIDTH, 'height': HEIGHT}
+    raise UnknownVideoError('{}: unknown video provider'.format(url))
+
+
+def metadata(url):
+    """
+    Metadata of url, from the cache or the configured resolver
+
+    Returns:
+        dict -- values of FIELDS
+    """
+    key = 'video:metadata:{}'.format(
+        hashlib.md5(url.encode('utf-8')).hexdigest())
+    found = cache.get(key)
+    if found is None:
+        resolver = import_string(getattr(
+            settings, 'VIDEO_METADATA_RESOLVER',
+            'courses.videos.embed_video_metadata'))
+        found = resolver(url)
+        cache.set(key, found, _timeout())
+    return found
+
+
+def resolve(video_id, url):
+    """
+    Store the metadata of url on the video, unless its url was
+    changed meanwhile
+
+    Arguments:
+        video_id {int} -- the Video
+        url {str} -- its url
+
+    Returns:
+        dict -- the stored metadata, empty when the url could not be
+        resolved, or None when the url changed
+    """
+    try:
+        fields = metadata(url)
+    except UnknownVideoError as e:
+        logger.warning('cannot resolve video %s: %s', video_id, e)
+        fields = {}
+    except MetadataError as e:
+        # left unresolved, so the next save or video_metadata run
+        # asks again
+        logger.warning('cannot resolve video %s yet: %s', video_id, e)
+        return {}
+    # an unknown url is stored as resolved too, so saving it again does
+    # not ask the provider again; the template links to it instead
+    values = dict((field, '') for field in FIELDS)
+    values['width'] = values['height'] = None
+    values.update(fields)
+    # a new updated value also changes the render cache key of the item
+    updated = Video.objects.filter(id=video_id, url=url).update(
+        resolved_from=url, updated=timezone.now(), **values)
+    if not updated:
+        return None
+    fragments.invalidate_modules(Content.objects.filter(
+        content_type=ContentType.objects.get_for_model(Video),
+        object_id=video_id).values_list('module_id', flat=True))
+    versions.touch_items(Video, [video_id])
+    return fields
+
+
+def schedule(video):
+    if video.url and video.url != video.resolved_from:
+        # an edited row is visible at once, with its previous url
+        workers.submit_for_row(
+            Video, video.id, resolve, video.id, video.url, url=video.url)
@@ -1,5 +1,5 @@
-from django.db.models import Count
 from django.core.urlresolvers import reverse_lazy
+from django.http import Http404
 from django.shortcuts import render, redirect, get_object_or_404
 from django.apps import apps
 from django.forms.models import modelform_factory
@@ -7,13 +7,16 @@ from django.views.generic.base import View, TemplateResponseMixin
 from django.views.generic.list import ListView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.detail import DetailView
-from django.core.cache import cache
 from braces.views import LoginRequiredMixin, PermissionRequiredMixin
 from braces.views import CsrfExemptMixin, JsonRequestResponseMixin
+from braces.views import StaffuserRequiredMixin, JSONResponseMixin
 from students.forms import CourseEnrollForm
 
-from .models import Subject, Course, Module, Content
+from .models import Subject, Course, Module, Content, Upload
 from .forms import ModuleFormSet
+from .cache import stats
+from . import catalog, enrollment, fragments, instrumentation, media
+from . import search, uploads, versions
 
 
 class OwnerMixin(object):
@@ -57,6 +60,11 @@ class OwnerCourseEditMixin(OwnerCourseMixin, OwnerEditMixin):
 class ManageCourseListView(OwnerCourseMixin, ListView):
     template_name = 'courses/manage/course/list.html'
 
+    def get_queryset(self):
+        # the first module of each course is linked to
+        qs = super(ManageCourseListView, self).get_queryset()
+        return qs.prefetch_related('modules')
+
 
 class CourseCreateView(
         PermissionRequiredMixin, OwnerCourseEditMixin,
@@ -109,6 +117,7 @@ class CourseModuleUpdateView(TemplateResponseMixin, View):
         formset = self.get_formset(data=request.POST)
         if formset.is_valid():
             formset.save()
+            fragments.invalidate_courses([self.course.id])
             return redirect('manage_course_list')
         return self.render_to_response(
             {'course': self.course, 'formset': formset}
@@ -206,6 +215,7 @@ class ContentCreateUpdateView(TemplateResponseMixin, View):
                 # new content
                 Content.objects.create(
                     module=self.module, item=obj)
+            fragments.invalidate_modules([self.module.id])
             return redirect('module_content_list', self.module.id)
         return self.render_to_response(
             {'form': form, 'object': self.obj}
@@ -220,6 +230,7 @@ class ContentDeleteView(View):
         module = content.module
         content.item.delete()
         content.delete()
+        fragments.invalidate_modules([module.id])
         return redirect('module_content_list', module.id)
 
 
@@ -228,31 +239,125 @@ class ModuleContentListView(TemplateResponseMixin, View):
 
     def get(self, request, module_id):
         module = get_object_or_404(
-            Module,
+            Module.objects.select_related('course'),
             id=module_id,
             course__owner=request.user
         )
         return self.render_to_response(
-            {'module': module}
+            {'module': module, 'contents': module.contents.with_items()}
         )
 
 
 class ModuleOrderView(
         CsrfExemptMixin, JsonRequestResponseMixin, View):
     def post(self, request):
-        for id, order in self.request_json.items():
-            Module.objects.filter(
-                id=id, course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        rejected = Module.objects.filter(
+            course__owner=request.user).set_order(self.request_json)
+        saved = [id for id in self.request_json if id not in rejected]
+        if saved:
+            course_ids = set(Module.objects.filter(
+                id__in=saved).values_list('course_id', flat=True))
+            fragments.invalidate_courses(course_ids)
+            versions.touch_courses(course_ids)
+        return self.render_json_response(
+            {'saved': 'OK', 'rejected': rejected})
 
 
 class ContentOrderView(
         CsrfExemptMixin, JsonRequestResponseMixin, View):
     def post(self, request):
-        for id, order in self.request_json.items():
-            Content.objects.filter(
-                id=id, module__course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        rejected = Content.objects.filter(
+            module__course__owner=request.user).set_order(self.request_json)
+        saved = [id for id in self.request_json if id not in rejected]
+        if saved:
+            module_ids = set(Content.objects.filter(
+                id__in=saved).values_list('module_id', flat=True))
+            fragments.invalidate_modules(module_ids)
+            versions.touch_modules(module_ids)
+        return self.render_json_response(
+            {'saved': 'OK', 'rejected': rejected})
+
+
+class UploadCreateView(
+        LoginRequiredMixin, CsrfExemptMixin, JsonRequestResponseMixin, View):
+    """
+    Start a chunked upload of a file or image content into a module,
+    see courses.uploads for the protocol
+    """
+    def post(self, request, module_id, model_name):
+        module = get_object_or_404(
+            Module, id=module_id, course__owner=request.user)
+        if model_name not in dict(Upload.MODEL_CHOICES):
+            raise Http404('Only files and images can be uploaded.')
+        data = self.request_json or {}
+        try:
+            size = int(data['size'])
+            filename = str(data['filename'])
+        except (KeyError, TypeError, ValueError):
+            return self.render_bad_request_response(
+                {'error': 'size and filename are required'})
+        if size <= 0 or not filename:
+            return self.render_bad_request_response(
+                {'error': 'size and filename are required'})
+        upload = Upload.objects.create(
+            owner=request.user, module=module, model_name=model_name,
+            title=data.get('title') or filename, filename=filename,
+            size=size)
+        return self.render_json_response(uploads.status(upload), status=201)
+
+
+class UploadChunkView(
+        LoginRequiredMixin, CsrfExemptMixin, JSONResponseMixin, View):
+    """
+    GET the progress of an upload to resume it, PUT its next chunk
+    """
+    upload = None
+
+    def dispatch(self, request, id):
+        if request.user.is_authenticated():
+            self.upload = get_object_or_404(
+                Upload, id=id, owner=request.user)
+        return super(UploadChunkView, self).dispatch(request, id)
+
+    def get(self, request, id):
+        return self.render_json_response(uploads.status(self.upload))
+
+    def put(self, request, id):
+        try:
+            offset = int(request.GET.get('offset', self.upload.received))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return self.render_json_response(
+                {'error': 'invalid offset'}, status=400)
+        if length > uploads.max_chunk_size():
+            return self.render_json_response(
+                {'error': 'chunks are limited to {} bytes'.format(
+                    uploads.max_chunk_size())}, status=413)
+        try:
+            uploads.write_chunk(self.upload, offset, request, length)
+        except uploads.OffsetMismatch:
+            self.upload.refresh_from_db()
+            return self.render_json_response(
+                uploads.status(self.upload), status=409)
+        except uploads.ChunkError as e:
+            return self.render_json_response({'error': str(e)}, status=400)
+        return self.render_json_response(uploads.status(self.upload))
+
+
+class ContentMediaView(LoginRequiredMixin, View):
+    """
+    Serve the file of a file or image content to the course owner and
+    its enrolled students, see courses.media
+    """
+    def get(self, request, model_name, id, field):
+        if field not in media.FIELDS.get(model_name, ()):
+            raise Http404
+        model = apps.get_model(app_label='courses', model_name=model_name)
+        item = get_object_or_404(model, id=id)
+        if not getattr(item, field) or not media.can_access(
+                request.user, item):
+            raise Http404
+        return media.serve(request, item, field)
 
 
 class CourseListView(TemplateResponseMixin, View):
@@ -268,29 +373,10 @@ class CourseListView(TemplateResponseMixin, View):
     template_name = 'courses/course/list.html'
 
     def get(self, request, subject=None):
-        subjects = cache.get('all_subjects')
-        if not subjects:
-            subjects = Subject.objects.annotate(
-                total_courses=Count('courses')
-            )
-            cache.set('all_subjects', subjects)
-        all_courses = Course.objects.annotate(
-            total_modules=Count('modules')
-        )
-
-        if subject:
-            subject = get_object_or_404(Subject, slug=subject)
-            key = 'subject_{}_courses'.format(subject.id)
-            courses = cache.get(key)
-            if not courses:
-                courses = all_courses.filter(subject=subject)
-                cache.set(key, courses)
-        else:
-            courses = cache.get('all_courses')
-            if not courses:
-                courses = all_courses
-                cache.set('all_courses', courses)
-
+        try:
+            subjects, subject, courses = catalog.get_catalog(subject)
+        except Subject.DoesNotExist:
+            raise Http404('No subject matches the given query.')
         return self.render_to_response({
             'subjects': subjects,
             'courses': courses,
@@ -298,17 +384,27 @@ class CourseListView(TemplateResponseMixin, View):
         })
 
 
+class CourseSearchView(TemplateResponseMixin, View):
+    """
+    Public full-text search over courses, modules and texts
+    """
+    template_name = 'courses/course/search.html'
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        return self.render_to_response({
+            'query': query,
+            'results': search.search(query) if query else []
+        })
+
+
 class CourseDetailView(DetailView):
     model = Course
     template_name = 'courses/course/detail.html'
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
-        enrolled_students = (self.object.students.all().values_list(
-                'id',
-                flat=True))
-        if request.user.id in enrolled_students:
-            print(self.object.id)
+        if enrollment.is_enrolled(request.user, self.object.id):
             return redirect('student_course_detail', self.object.id)
         else:
             context = self.get_context_data(object=self.object)
@@ -320,3 +416,31 @@ class CourseDetailView(DetailView):
             initial={'course': self.object}
         )
         return context
+
+
+class CacheStatsView(StaffuserRequiredMixin, JSONResponseMixin, View):
+    """
+    Hit/miss counters of the cached read paths, for this worker process
+    """
+    def get(self, request):
+        return self.render_json_response(stats.snapshot())
+
+
+class EnrollmentQueueStatsView(
+        StaffuserRequiredMixin, JSONResponseMixin, View):
+    """
+    Depth and throughput of the enrollment queue of this worker process
+    """
+    def get(self, request):
+        return self.render_json_response(enrollment.queue.metrics())
+
+
+class RequestStatsView(StaffuserRequiredMixin, JSONResponseMixin, View):
+    """
+    Query, template, cache and latency aggregates per URL name, merged
+    across the processes that published them
+    """
+    def get(self, request):
+        instrumentation.publish()
+        return self.render_json_response(
+            instrumentation.summarize(instrumentation.collect()))
@@ -0,0 +1,95 @@
+"""
+A local pool of background threads for work that must not hold up a
+response (image derivatives, batched writes).
+
+Tasks run in the web process itself (uwsgi runs with enable-threads),
+each thread with its own database connection. With the
+BACKGROUND_TASKS_EAGER setting tasks run inline instead, e.g. in tests.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+# seconds to wait again for the transaction saving a row to commit
+VISIBILITY_DELAYS = (0.1, 0.5, 2, 5, 15, 60)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2))
+    return _executor
+
+
+def _call(fn, args, kwargs):
+    try:
+        fn(*args, **kwargs)
+    except Exception:
+        logger.exception('background task %s failed', fn.__name__)
+
+
+def _run(fn, args, kwargs):
+    try:
+        _call(fn, args, kwargs)
+    finally:
+        connection.close()
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) in the pool; failures are logged, not raised
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        _call(fn, args, kwargs)
+        return
+    get_executor().submit(_run, fn, args, kwargs)
+
+
+def _when_visible(model, pk, fn, args, match, attempt):
+    try:
+        visible = model._default_manager.filter(pk=pk, **match).exists()
+    except DatabaseError:
+        # e.g. SQLite: the table is locked by the writing transaction
+        visible = False
+    if visible:
+        fn(*args)
+    elif attempt < len(VISIBILITY_DELAYS):
+        timer = threading.Timer(
+            VISIBILITY_DELAYS[attempt], get_executor().submit,
+            (_run, _when_visible, (model, pk, fn, args, match, attempt + 1),
+             {}))
+        timer.daemon = True
+        timer.start()
+    else:
+        logger.warning(
+            '%s %s never became visible, %s dropped',
+            model._meta.model_name, pk, fn.__name__)
+
+
+def submit_for_row(model, pk, fn, *args, **match):
+    """
+    Run fn(*args) in the pool once the row pk of model, with the field
+    values of match, is visible to the pool connections.
+
+    Tasks scheduled from post_save would otherwise run before the
+    transaction saving the row commits (there is no on_commit hook on
+    this Django version) and find nothing to update, or the previous
+    values of an updated row. The row is looked up again with growing
+    delays, and the task dropped if it never appears, i.e. the
+    transaction rolled back or the row was changed again.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        _call(fn, args, {})
+        return
+    get_executor().submit(
+        _run, _when_visible, (model, pk, fn, args, match, 0), {})
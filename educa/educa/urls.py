@@ -16,8 +16,6 @@ Including another URLconf
 from django.conf.urls import include, url
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
-from django.conf import settings
-from django.conf.urls.static import static
 
 from courses.views import CourseListView
 
@@ -31,10 +29,7 @@ urlpatterns = [
     url(r'^api/', include('courses.api.urls', namespace='api'))
 ]
 
-urlpatterns += static(
-    settings.MEDIA_URL,
-    document_root=settings.MEDIA_ROOT
-    )
+# media files are served by courses.views.ContentMediaView
 
 # urlpatterns += static(
 #     settings.STATIC_URL,
@@ -1,3 +1,15 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ContentCompletion, CourseProgress
+
+
+@admin.register(CourseProgress)
+class CourseProgressAdmin(admin.ModelAdmin):
+    list_display = ['student', 'course', 'completed_contents', 'updated']
+    raw_id_fields = ['student', 'course']
+
+
+@admin.register(ContentCompletion)
+class ContentCompletionAdmin(admin.ModelAdmin):
+    list_display = ['student', 'content', 'course', 'completed']
+    raw_id_fields = ['student', 'content', 'course']
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class StudentsConfig(AppConfig):
+    name = 'students'
+
+    def ready(self):
+        # connect the progress receivers
+        from . import signals  # noqa
@@ -0,0 +1,159 @@
+"""
+The "my courses" dashboard read model.
+
+Each student has one CourseProgress row per course they enrolled in,
+holding copies of what the dashboard shows (course title, subject,
+module and content counts) next to their progress and the module they
+visited last. The rows are written when enrollments are flushed and
+kept up to date by students.signals when courses, subjects, modules
+and contents change, so listing a student's courses is one query on
+the (student, course) index whatever the number of courses.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from courses import enrollment
+from courses.bulk import batches, insert_ignore
+from courses.models import Course
+
+from .models import CourseProgress
+
+SNAPSHOT_FIELDS = ('title', 'subject_title', 'total_modules', 'total_contents')
+
+
+def snapshots(course_ids):
+    """
+    The dashboard copies of courses
+
+    Returns:
+        dict -- course id to a tuple of SNAPSHOT_FIELDS values
+    """
+    found = {}
+    for batch in batches(course_ids):
+        found.update(
+            (row[0], row[1:]) for row in Course.objects.filter(
+                id__in=batch).values_list(
+                    'id', 'title', 'subject__title', 'total_modules',
+                    'total_contents'))
+    return found
+
+
+def add_rows(pairs, enrolled=False, found=None):
+    """
+    Create the missing rows of (student_id, course_id) pairs
+
+    Keyword Arguments:
+        enrolled {bool} -- whether the rows are shown (default: {False})
+        found {dict} -- the snapshots of the courses, when already read
+        (default: {None})
+
+    Returns:
+        list -- the pairs created
+    """
+    if found is None:
+        found = snapshots(
+            set(course_id for student_id, course_id in pairs))
+    now = timezone.now()
+    inserted = insert_ignore(
+        CourseProgress,
+        ('student', 'course', 'enrolled', 'updated') + SNAPSHOT_FIELDS,
+        [(student_id, course_id, enrolled, now) + found[course_id]
+         for student_id, course_id in pairs if course_id in found],
+        key=('student', 'course'))
+    return [row[:2] for row in inserted]
+
+
+def enroll(course_id, student_ids):
+    """
+    Show a course on the dashboards of students who enrolled in it
+    """
+    found = snapshots([course_id])
+    if course_id not in found:
+        return
+    created = add_rows(
+        [(student_id, course_id) for student_id in student_ids], True, found)
+    if len(created) < len(student_ids):
+        # rows left by an earlier enrollment or made by a progress flush
+        CourseProgress.objects.filter(
+            course_id=course_id, student_id__in=list(student_ids),
+            enrolled=False
+        ).update(enrolled=True, **dict(zip(SNAPSHOT_FIELDS, found[course_id])))
+
+
+def leave(**lookup):
+    """
+    Hide the rows matching lookup, keeping the progress for a later
+    enrollment
+    """
+    CourseProgress.objects.filter(enrolled=True, **lookup).update(
+        enrolled=False)
+
+
+def update_courses(course_ids):
+    """
+    Copy the title and subject of courses to their rows again
+    """
+    for course_id, snapshot in snapshots(course_ids).items():
+        CourseProgress.objects.filter(course_id=course_id).update(
+            title=snapshot[0], subject_title=snapshot[1])
+
+
+def count(course_filter, field_name, amount):
+    """
+    Add amount to a counter of the rows of the courses matching
+    course_filter, e.g. {'course__modules__id': 3}
+    """
+    qs = CourseProgress.objects.filter(**course_filter)
+    if amount < 0:
+        qs = qs.filter(**{'{}__gte'.format(field_name): -amount})
+    qs.update(**{field_name: F(field_name) + amount})
+
+
+def courses(user):
+    """
+    The dashboard rows of user, by title. Enrollments not flushed yet
+    are included as unsaved rows.
+
+    Returns:
+        list -- CourseProgress
+    """
+    rows = list(CourseProgress.objects.filter(
+        student_id=user.id, enrolled=True).order_by('title'))
+    pending = set(enrollment.pending_course_ids(user)) - set(
+        row.course_id for row in rows)
+    if pending:
+        rows.extend(
+            CourseProgress(
+                student_id=user.id, course_id=course_id, enrolled=True,
+                **dict(zip(SNAPSHOT_FIELDS, snapshot)))
+            for course_id, snapshot in snapshots(pending).items())
+        rows.sort(key=lambda row: row.title)
+    return rows
+
+
+def rebuild():
+    """
+    Write every row again from the enrollments and courses, e.g. after
+    the counters were repaired
+
+    Returns:
+        int -- number of rows of enrolled students
+    """
+    pairs = set(
+        enrollment.Enrollment.objects.values_list('user_id', 'course_id'))
+    add_rows(list(pairs), True)
+    for course_id, snapshot in snapshots(
+            set(course_id for student_id, course_id in pairs)).items():
+        CourseProgress.objects.filter(course_id=course_id).update(
+            **dict(zip(SNAPSHOT_FIELDS, snapshot)))
+    wrong = {True: [], False: []}
+    for id, student_id, course_id, enrolled in (
+            CourseProgress.objects.values_list(
+                'id', 'student_id', 'course_id', 'enrolled')):
+        if ((student_id, course_id) in pairs) != enrolled:
+            wrong[not enrolled].append(id)
+    for enrolled, ids in wrong.items():
+        if ids:
+            CourseProgress.objects.filter(id__in=ids).update(
+                enrolled=enrolled)
+    return len(pairs)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from students import dashboard, progress
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the buffered content completions to the database and '
+        'optionally rebuild the dashboard and progress rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true', default=False,
+            help='Rebuild every course progress row from the completions.')
+        parser.add_argument(
+            '--dashboard', action='store_true', default=False,
+            help='Rebuild the dashboard rows from the enrollments.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            inserted = progress.flush()
+            if not inserted:
+                break
+            total += inserted
+        self.stdout.write('{} completions written'.format(total))
+        if options['dashboard']:
+            rows = dashboard.rebuild()
+            self.stdout.write('{} dashboard rows rebuilt'.format(rows))
+        if options['recount']:
+            rows = progress.recount()
+            self.stdout.write('{} progress rows repaired'.format(rows))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0018_course_total_contents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentCompletion',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('completed', models.DateTimeField()),
+                ('content', models.ForeignKey(related_name='completions', to='courses.Content')),
+                ('course', models.ForeignKey(related_name='completions', to='courses.Course')),
+                ('student', models.ForeignKey(related_name='completions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CourseProgress',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('completed_contents', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(related_name='progress', to='courses.Course')),
+                ('student', models.ForeignKey(related_name='course_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='courseprogress',
+            unique_together=set([('student', 'course')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='contentcompletion',
+            unique_together=set([('student', 'content')]),
+        ),
+    ]
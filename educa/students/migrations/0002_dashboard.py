@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    CourseProgress = apps.get_model('students', 'CourseProgress')
+    Enrollment = Course.students.through
+    now = django.utils.timezone.now()
+    for course in Course.objects.select_related('subject').iterator():
+        rows = CourseProgress.objects.filter(course_id=course.id)
+        snapshot = dict(
+            title=course.title, subject_title=course.subject.title,
+            total_modules=course.total_modules,
+            total_contents=course.total_contents)
+        rows.update(**snapshot)
+        student_ids = set(Enrollment.objects.filter(
+            course_id=course.id).values_list('user_id', flat=True))
+        rows.filter(student_id__in=student_ids).update(enrolled=True)
+        student_ids -= set(rows.values_list('student_id', flat=True))
+        CourseProgress.objects.bulk_create([
+            CourseProgress(
+                student_id=student_id, course_id=course.id, enrolled=True,
+                updated=now, **snapshot)
+            for student_id in student_ids], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0018_course_total_contents'),
+        ('students', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='enrolled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='last_module',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, to='courses.Module', null=True),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='last_module_title',
+            field=models.CharField(max_length=200, blank=True),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='last_visited',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='subject_title',
+            field=models.CharField(max_length=200, blank=True),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='title',
+            field=models.CharField(max_length=200, blank=True),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='total_contents',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='total_modules',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill, migrations.RunPython.noop),
+    ]
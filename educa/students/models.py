@@ -1,3 +1,64 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+from courses.models import Course, Module, Content
+
+
+class ContentCompletion(models.Model):
+    """
+    A content a student has completed. Written in batches by
+    students.progress, never on the request path.
+    """
+    student = models.ForeignKey(User, related_name='completions')
+    content = models.ForeignKey(Content, related_name='completions')
+    course = models.ForeignKey(Course, related_name='completions')
+    completed = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('student', 'content')
+
+    def __str__(self):
+        return '{} completed {}'.format(self.student_id, self.content_id)
+
+
+class CourseProgress(models.Model):
+    """
+    What a student's dashboard shows of a course: a copy of the course
+    title, subject and counters, the number of contents completed and
+    the module visited last. Maintained by students.dashboard and
+    students.progress so the dashboard is one indexed query.
+    """
+    student = models.ForeignKey(User, related_name='course_progress')
+    course = models.ForeignKey(Course, related_name='progress')
+    enrolled = models.BooleanField(default=False)
+    title = models.CharField(max_length=200, blank=True)
+    subject_title = models.CharField(max_length=200, blank=True)
+    total_modules = models.PositiveIntegerField(default=0)
+    total_contents = models.PositiveIntegerField(default=0)
+    completed_contents = models.PositiveIntegerField(default=0)
+    last_module = models.ForeignKey(
+        Module, related_name='+', blank=True, null=True,
+        on_delete=models.SET_NULL)
+    last_module_title = models.CharField(max_length=200, blank=True)
+    last_visited = models.DateTimeField(blank=True, null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'course')
+
+    def __str__(self):
+        return '{} on {}'.format(self.student_id, self.course_id)
+
+    @property
+    def percent(self):
+        return percent(self.completed_contents, self.total_contents)
+
+
+def percent(completed, total):
+    """
+    Returns:
+        int -- completed out of total, in whole percents
+    """
+    if not total:
+        return 0
+    return min(100, completed * 100 // total)
@@ -0,0 +1,265 @@
+"""
+Student progress with write-behind buffering.
+
+record() runs on the learning pages and only touches the cache: the
+contents a student already completed are skipped with one read of a
+cached set, the new ones are appended to a buffer shared by every
+process, a courses.buffer.EventBuffer kept in the cache as numbered
+events. A background thread in each process calls flush() every
+PROGRESS_FLUSH_INTERVAL seconds; under a cache lock it writes the
+buffered completions with one bulk insert ignoring existing rows and
+adds the newly inserted ones to the CourseProgress rows, so a
+completion percentage is read from a single row. The module a student
+visited last travels in the same events and lands on the same rows.
+
+Flushing is idempotent: events are only dropped once written, and an
+event number whose key is missing is waited for once (it may still be
+being written) before it is skipped as evicted.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from courses.buffer import EventBuffer
+from courses.bulk import MAX_PARAMETERS, batches, insert_ignore
+from courses.models import Module, Content
+
+from . import dashboard
+from .models import ContentCompletion, CourseProgress, percent
+
+logger = logging.getLogger(__name__)
+
+# events written per flush
+FLUSH_SIZE = 5000
+
+buffer = EventBuffer('progress', 'PROGRESS_BUFFER_TIMEOUT')
+
+
+def _timeout():
+    return buffer.timeout()
+
+
+def _state_key(user_id, course_id):
+    return 'progress:done:{}:{}'.format(user_id, course_id)
+
+
+def _state(user, course_id):
+    """
+    Ids of the contents of the course user completed, flushed or not,
+    and the module visited last, None when not known
+    """
+    key = _state_key(user.id, course_id)
+    state = cache.get(key)
+    if state is None:
+        state = (frozenset(ContentCompletion.objects.filter(
+            student_id=user.id, course_id=course_id
+        ).values_list('content_id', flat=True)), None)
+        cache.set(key, state, _timeout())
+    return state
+
+
+def completed_content_ids(user, course_id):
+    return _state(user, course_id)[0]
+
+
+def record(user, course_id, content_ids, module_id=None):
+    """
+    Buffer the completion of contents of a course by user, and the
+    visit of module_id
+
+    Returns:
+        int -- number of newly completed contents
+    """
+    done, last_module_id = _state(user, course_id)
+    new = frozenset(content_ids) - done
+    if not new and module_id in (None, last_module_id):
+        return 0
+    cache.set(
+        _state_key(user.id, course_id),
+        (done | new, module_id or last_module_id), _timeout())
+    buffer.append(
+        (user.id, course_id, sorted(new), time.time(), module_id))
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        flush()
+    else:
+        flusher.start()
+    return len(new)
+
+
+def course_percent(user, course):
+    """
+    Completion percentage of course for user, from its progress row
+    """
+    completed = CourseProgress.objects.filter(
+        student_id=user.id, course_id=course.id
+    ).values_list('completed_contents', flat=True).first()
+    return percent(completed or 0, course.total_contents)
+
+
+def write(completions, visits=None):
+    """
+    Insert completions, add the new ones to the progress rows and
+    record the visited modules
+
+    Arguments:
+        completions {list} -- (student_id, content_id, course_id,
+        completed datetime) tuples
+
+    Keyword Arguments:
+        visits {dict} -- (student_id, course_id) to the id of the
+        module visited last (default: {None})
+
+    Returns:
+        int -- number of completions inserted
+    """
+    visits = visits or {}
+    # contents and modules deleted since they were viewed
+    existing = set()
+    for batch in batches(set(row[1] for row in completions)):
+        existing.update(Content.objects.filter(
+            id__in=batch).values_list('id', flat=True))
+    completions = [row for row in completions if row[1] in existing]
+    modules = {}
+    for batch in batches(set(visits.values())):
+        modules.update(Module.objects.filter(
+            id__in=batch).values_list('id', 'title'))
+    visits = dict(
+        (pair, module_id) for pair, module_id in visits.items()
+        if module_id in modules)
+    if not completions and not visits:
+        return 0
+    with transaction.atomic():
+        inserted = insert_ignore(
+            ContentCompletion, ('student', 'content', 'course', 'completed'),
+            completions, key=('student', 'content')) if completions else []
+        deltas = Counter((row[0], row[2]) for row in inserted)
+        _update_progress(deltas, visits, modules)
+    return len(inserted)
+
+
+def _update_progress(deltas, visits, modules):
+    pairs = set(deltas) | set(visits)
+    if not pairs:
+        return
+    now = timezone.now()
+    # a progress flush may come before the enrollment flush
+    dashboard.add_rows(list(pairs))
+    by_delta = defaultdict(list)
+    by_module = defaultdict(list)
+    for batch in batches(pairs, MAX_PARAMETERS // 2):
+        rows = CourseProgress.objects.filter(
+            student_id__in=set(student for student, course in batch),
+            course_id__in=set(course for student, course in batch)
+        ).values_list('id', 'student_id', 'course_id')
+        for id, student_id, course_id in rows:
+            if (student_id, course_id) in deltas:
+                by_delta[deltas[student_id, course_id]].append(id)
+            if (student_id, course_id) in visits:
+                by_module[visits[student_id, course_id]].append(id)
+    for delta, ids in by_delta.items():
+        for batch in batches(ids):
+            CourseProgress.objects.filter(id__in=batch).update(
+                completed_contents=F('completed_contents') + delta,
+                updated=now)
+    for module_id, ids in by_module.items():
+        for batch in batches(ids):
+            CourseProgress.objects.filter(id__in=batch).update(
+                last_module=module_id, last_module_title=modules[module_id],
+                last_visited=now, updated=now)
+
+
+def flush(size=FLUSH_SIZE):
+    """
+    Write the buffered events, unless another process is flushing
+
+    Returns:
+        int -- number of completions inserted
+    """
+    return buffer.flush(_write_events, size)
+
+
+def _write_events(events):
+    completions = []
+    visits = {}
+    for user_id, course_id, content_ids, at, module_id in events:
+        completed = datetime.fromtimestamp(at, timezone.utc)
+        completions.extend(
+            (user_id, content_id, course_id, completed)
+            for content_id in content_ids)
+        if module_id is not None:
+            visits[user_id, course_id] = module_id
+    return write(completions, visits)
+
+
+class Flusher(object):
+    """
+    The periodic flush thread of this process
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='progress-flush')
+                    self._thread.daemon = True
+                    self._thread.start()
+                    atexit.register(flush)
+
+    def _run(self):
+        while True:
+            time.sleep(getattr(settings, 'PROGRESS_FLUSH_INTERVAL', 5.0))
+            try:
+                flush()
+            except Exception:
+                logger.exception('progress flush failed')
+            finally:
+                connection.close()
+
+
+flusher = Flusher()
+
+
+def recount(course_ids=None):
+    """
+    Recompute the completed contents of the progress rows from the
+    completions, e.g. after a flush failed half way
+
+    Returns:
+        int -- number of progress rows repaired
+    """
+    completions = ContentCompletion.objects.order_by()
+    progress = CourseProgress.objects.all()
+    if course_ids is not None:
+        completions = completions.filter(course_id__in=list(course_ids))
+        progress = progress.filter(course_id__in=list(course_ids))
+    counts = dict(
+        ((student_id, course_id), total)
+        for student_id, course_id, total in completions.values(
+            'student_id', 'course_id').annotate(
+                total=Count('id')).values_list(
+                    'student_id', 'course_id', 'total'))
+    with transaction.atomic():
+        dashboard.add_rows(list(counts))
+        wrong = defaultdict(list)
+        for id, student_id, course_id, completed in progress.values_list(
+                'id', 'student_id', 'course_id', 'completed_contents'):
+            total = counts.get((student_id, course_id), 0)
+            if total != completed:
+                wrong[total].append(id)
+        for total, ids in wrong.items():
+            CourseProgress.objects.filter(id__in=ids).update(
+                completed_contents=total)
+    return sum(len(ids) for ids in wrong.values())
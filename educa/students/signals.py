@@ -0,0 +1,89 @@
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from courses.models import Subject, Course, Module, Content
+
+from . import dashboard
+from .models import CourseProgress
+
+
+@receiver(pre_delete, sender=Content)
+def uncount_deleted_content(sender, instance, **kwargs):
+    # the completions go with the content; take them off the progress
+    # rows before the cascade deletes them
+    students = instance.completions.values_list('student_id', flat=True)
+    CourseProgress.objects.filter(
+        course__modules__id=instance.module_id,
+        student_id__in=list(students),
+        completed_contents__gt=0
+    ).update(completed_contents=F('completed_contents') - 1)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def update_dashboard_enrollments(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    if action == 'post_add' and reverse:
+        for course_id in pk_set:
+            dashboard.enroll(course_id, [instance.pk])
+    elif action == 'post_add':
+        dashboard.enroll(instance.pk, pk_set)
+    elif action == 'post_remove' and reverse:
+        dashboard.leave(student_id=instance.pk, course_id__in=list(pk_set))
+    elif action == 'post_remove':
+        dashboard.leave(course_id=instance.pk, student_id__in=list(pk_set))
+    elif action == 'pre_clear':
+        # nothing is left to enroll after the clear
+        dashboard.leave(
+            **{'student_id' if reverse else 'course_id': instance.pk})
+
+
+@receiver(post_save, sender=Course)
+def update_dashboard_course(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        dashboard.update_courses([instance.id])
+
+
+@receiver(post_save, sender=Subject)
+def update_dashboard_subject(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        CourseProgress.objects.filter(
+            course__subject_id=instance.id
+        ).update(subject_title=instance.title)
+
+
+@receiver(post_save, sender=Module)
+def update_dashboard_module(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        dashboard.count(
+            {'course_id': instance.course_id}, 'total_modules', 1)
+    else:
+        CourseProgress.objects.filter(last_module_id=instance.id).update(
+            last_module_title=instance.title)
+
+
+@receiver(pre_delete, sender=Module)
+def forget_dashboard_module(sender, instance, **kwargs):
+    CourseProgress.objects.filter(last_module_id=instance.id).update(
+        last_module=None, last_module_title='')
+
+
+@receiver(post_delete, sender=Module)
+def uncount_dashboard_module(sender, instance, **kwargs):
+    dashboard.count({'course_id': instance.course_id}, 'total_modules', -1)
+
+
+@receiver(post_save, sender=Content)
+def count_dashboard_content(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        dashboard.count(
+            {'course__modules__id': instance.module_id}, 'total_contents', 1)
+
+
+@receiver(post_delete, sender=Content)
+def uncount_dashboard_content(sender, instance, **kwargs):
+    dashboard.count(
+        {'course__modules__id': instance.module_id}, 'total_contents', -1)
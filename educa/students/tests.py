@@ -1,3 +1,291 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 
-# Create your tests here.
+from courses import enrollment
+from courses.models import Subject, Course, Module, Content, Text
+from courses.tests.budgets import QueryBudgetTestCase, call, url_names
+from courses.tests.fixtures import CourseTestCase
+
+from . import dashboard, progress
+from .models import ContentCompletion, CourseProgress
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StudentQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Cold-cache query budgets of every named student URL
+    """
+    BUDGETS = {
+        'student_registration': 2,
+        'student_enroll_course': 17,
+        'student_course_list': 3,
+        'student_course_detail': 12,
+        'student_course_detail_module': 12,
+    }
+
+    def check(self, name, dense, sparse=None):
+        self.assertBudget(name, self.BUDGETS[name], dense, sparse)
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(
+            url_names('students.urls') - set(self.BUDGETS), set())
+
+    def test_registration_and_enrollment(self):
+        self.check('student_registration', call(
+            'get', reverse('student_registration')))
+        with self.settings(BACKGROUND_TASKS_EAGER=True):
+            self.check('student_enroll_course', call(
+                'post', reverse('student_enroll_course'), self.sparse_student,
+                data={'course': self.dense_course.id}))
+
+    def test_course_list(self):
+        self.check(
+            'student_course_list',
+            call('get', reverse('student_course_list'), self.dense_student),
+            call('get', reverse('student_course_list'), self.sparse_student))
+
+    def test_course_detail(self):
+        self.check(
+            'student_course_detail',
+            call('get', reverse(
+                'student_course_detail', args=[self.dense_course.id]),
+                self.dense_student),
+            call('get', reverse(
+                'student_course_detail', args=[self.sparse_course.id]),
+                self.dense_student))
+        self.check(
+            'student_course_detail_module',
+            call('get', reverse('student_course_detail_module', args=[
+                self.dense_course.id, self.dense_module.id]),
+                self.dense_student),
+            call('get', reverse('student_course_detail_module', args=[
+                self.sparse_course.id, self.sparse_module.id]),
+                self.dense_student))
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProgressTest(CourseTestCase):
+
+    def setUp(self):
+        cache.clear()
+        super(ProgressTest, self).setUp()
+        self.student = User.objects.create_user('student', password='pw')
+        module = Module.objects.create(course=self.course, title='Intro')
+        self.contents = []
+        for title in ('one', 'two', 'three', 'four'):
+            text = Text.objects.create(
+                owner=self.owner, title=title, content=title)
+            self.contents.append(
+                Content.objects.create(module=module, item=text))
+        self.course = Course.objects.get(id=self.course.id)
+        progress.flusher.start = lambda: None
+        self.addCleanup(delattr, progress.flusher, 'start')
+
+    def ids(self, contents):
+        return [content.id for content in contents]
+
+    def test_completions_are_buffered_until_the_flush(self):
+        self.assertEqual(self.course.total_contents, 4)
+        progress.record(
+            self.student, self.course.id, self.ids(self.contents[:2]))
+        self.assertFalse(ContentCompletion.objects.exists())
+        self.assertEqual(
+            progress.course_percent(self.student, self.course), 0)
+
+        self.assertEqual(progress.flush(), 2)
+        self.assertEqual(ContentCompletion.objects.filter(
+            student=self.student, course=self.course).count(), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                progress.course_percent(self.student, self.course), 50)
+
+    def test_flush_is_idempotent(self):
+        contents = self.ids(self.contents[:3])
+        self.assertEqual(
+            progress.record(self.student, self.course.id, contents), 3)
+        self.assertEqual(
+            progress.record(self.student, self.course.id, contents), 0)
+        # a completion written by an earlier flush whose cursor was lost
+        progress.write([
+            (self.student.id, contents[0], self.course.id,
+             self.contents[0].module.course.created)])
+        self.assertEqual(progress.flush(), 2)
+        self.assertEqual(progress.flush(), 0)
+        self.assertEqual(CourseProgress.objects.get(
+            student=self.student, course=self.course).completed_contents, 3)
+
+    def test_lookups_stay_under_the_parameter_limit(self):
+        # more ids than SQLite accepts in one statement
+        ids = range(10 ** 6, 10 ** 6 + 2000)
+        now = self.course.created
+        self.assertEqual(progress.write(
+            [(self.student.id, id, self.course.id, now) for id in ids],
+            dict(((self.student.id, id), id) for id in ids)), 0)
+        self.assertEqual(dashboard.snapshots(ids), {})
+
+    def test_deleted_content_leaves_the_progress(self):
+        progress.record(self.student, self.course.id, self.ids(self.contents))
+        progress.flush()
+        self.contents[0].delete()
+        course = Course.objects.get(id=self.course.id)
+        self.assertEqual(progress.course_percent(self.student, course), 100)
+        self.assertEqual(progress.recount(), 0)
+        CourseProgress.objects.update(completed_contents=0)
+        self.assertEqual(progress.recount(), 1)
+        self.assertEqual(CourseProgress.objects.get(
+            student=self.student).completed_contents, 3)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user('instructor', password='pw')
+        self.student = User.objects.create_user('student', password='pw')
+        self.subject = Subject.objects.create(title='Maths', slug='maths')
+        self.courses = [
+            Course.objects.create(
+                owner=owner, subject=self.subject, title=title,
+                slug=title.lower(), overview=title)
+            for title in ('Geometry', 'Algebra')]
+        self.module = Module.objects.create(
+            course=self.courses[0], title='Angles')
+        text = Text.objects.create(owner=owner, title='one', content='one')
+        Content.objects.create(module=self.module, item=text)
+        for course in self.courses:
+            course.students.add(self.student)
+        progress.flusher.start = lambda: None
+        self.addCleanup(delattr, progress.flusher, 'start')
+
+    def rows(self):
+        return dashboard.courses(self.student)
+
+    def test_rows_follow_enrollments_and_course_changes(self):
+        self.assertEqual(
+            [(row.title, row.subject_title, row.total_modules,
+              row.total_contents) for row in self.rows()],
+            [('Algebra', 'Maths', 0, 0), ('Geometry', 'Maths', 1, 1)])
+
+        self.subject.title = 'Mathematics'
+        self.subject.save()
+        course = self.courses[1]
+        course.title = 'Linear algebra'
+        course.save()
+        Module.objects.create(course=course, title='Vectors')
+        self.assertEqual(
+            [(row.title, row.subject_title, row.total_modules)
+             for row in self.rows()],
+            [('Geometry', 'Mathematics', 1),
+             ('Linear algebra', 'Mathematics', 1)])
+
+        course.students.remove(self.student)
+        self.assertEqual([row.title for row in self.rows()], ['Geometry'])
+        course.students.add(self.student)
+        self.assertEqual(len(self.rows()), 2)
+
+    def test_last_visited_module_and_progress(self):
+        self.client.login(username='student', password='pw')
+        self.client.get(reverse('student_course_detail_module', args=[
+            self.courses[0].id, self.module.id]))
+        progress.flush()
+        with self.assertNumQueries(1):
+            row = self.rows()[1]
+        self.assertEqual(
+            (row.last_module_id, row.last_module_title, row.percent),
+            (self.module.id, 'Angles', 100))
+
+        response = self.client.get(reverse('student_course_list'))
+        self.assertContains(response, 'Continue with Angles')
+        self.assertContains(response, reverse(
+            'student_course_detail', args=[self.courses[1].id]))
+
+        self.module.delete()
+        self.assertIsNone(self.rows()[1].last_module_id)
+
+    def test_pending_enrollments_are_listed(self):
+        other = Course.objects.create(
+            owner=self.courses[0].owner, subject=self.subject,
+            title='Calculus', slug='calculus', overview='Limits')
+        self.addCleanup(
+            setattr, enrollment, 'queue', enrollment.queue)
+        enrollment.queue = enrollment.EnrollmentQueue()
+        enrollment.queue.start = lambda: None
+        enrollment.enroll(self.student, other.id)
+        self.assertEqual(
+            [row.title for row in self.rows()],
+            ['Algebra', 'Calculus', 'Geometry'])
+        enrollment.queue.flush()
+        self.assertEqual(CourseProgress.objects.filter(
+            student=self.student, enrolled=True).count(), 3)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ModuleNavigationTest(CourseTestCase):
+
+    def setUp(self):
+        cache.clear()
+        super(ModuleNavigationTest, self).setUp()
+        student = User.objects.create_user('student', password='pw')
+        self.modules = []
+        for order in range(12):
+            module = Module.objects.create(
+                course=self.course, title='Module {}'.format(order))
+            for number in range(order % 3 + 1):
+                text = Text.objects.create(
+                    owner=self.owner, title='text', content='text')
+                Content.objects.create(module=module, item=text)
+            self.modules.append(module)
+        self.course.students.add(student)
+        progress.flusher.start = lambda: None
+        self.addCleanup(delattr, progress.flusher, 'start')
+        self.client.login(username='student', password='pw')
+
+    def url(self, module):
+        return reverse(
+            'student_course_detail_module', args=[self.course.id, module.id])
+
+    def test_module_views_cost_constant_queries(self):
+        # caches the navigation and the contents of the first module
+        self.client.get(reverse('student_course_detail', args=[self.course.id]))
+        counts = set()
+        for module in self.modules[1:]:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.url(module))
+            counts.add(len(queries))
+        self.assertEqual(len(counts), 1)
+        for module in self.modules:
+            # session, user, course, progress
+            with self.assertNumQueries(4):
+                self.client.get(self.url(module))
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url(self.modules[5]))
+        self.assertEqual(
+            [module.id for module in response.context['modules']],
+            [module.id for module in self.modules])
+        self.assertEqual(response.context['module'].id, self.modules[5].id)
+
+    def test_navigation_follows_module_changes(self):
+        self.client.get(self.url(self.modules[0]))
+        module = self.modules[0]
+        module.title = 'Renamed'
+        module.save()
+        response = self.client.get(self.url(module))
+        self.assertContains(response, 'Renamed')
+
+    def test_module_of_another_course(self):
+        other = Course.objects.create(
+            owner=self.course.owner, subject=self.course.subject,
+            title='Geometry', slug='geometry', overview='Angles')
+        module = Module.objects.create(course=other, title='Angles')
+        response = self.client.get(reverse(
+            'student_course_detail_module', args=[self.course.id, module.id]))
+        self.assertEqual(response.status_code, 404)
@@ -1,5 +1,4 @@
 from django.conf.urls import url, include
-from django.views.decorators.cache import cache_page
 from . import views
 
 
@@ -21,12 +20,12 @@ urlpatterns = [
     ),
     url(
         r'^course/(?P<pk>\d+)/$',
-        cache_page(60 * 15)(views.StudentCourseDetailView.as_view()),
+        views.StudentCourseDetailView.as_view(),
         name='student_course_detail'
     ),
     url(
         r'^course/(?P<pk>\d+)/(?P<module_id>\d+)/$',
-        cache_page(60 * 15)(views.StudentCourseDetailView.as_view()),
+        views.StudentCourseDetailView.as_view(),
         name='student_course_detail_module'
     ),
 ]
\ No newline at end of file
@@ -1,3 +1,4 @@
+from django.http import Http404
 from django.shortcuts import render
 from django.core.urlresolvers import reverse_lazy
 from django.views.generic.base import View
@@ -10,6 +11,8 @@ from braces.views import LoginRequiredMixin
 
 from .forms import CourseEnrollForm
 from courses.models import Course
+from courses import enrollment, fragments
+from . import dashboard, progress
 
 
 # Create your views here.
@@ -35,7 +38,7 @@ class StudentEnrollCourseView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         self.course = form.cleaned_data['course']
-        self.course.students.add(self.request.user)
+        enrollment.enroll(self.request.user, self.course.id)
         return super(StudentEnrollCourseView, self).form_valid(form)
 
     def get_success_url(self):
@@ -43,12 +46,10 @@ class StudentEnrollCourseView(LoginRequiredMixin, FormView):
 
 
 class StudentCourseListView(LoginRequiredMixin, ListView):
-    model = Course
     template_name = 'students/course/list.html'
 
     def get_queryset(self):
-        qs = super(StudentCourseListView, self).get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        return dashboard.courses(self.request.user)
 
 
 class StudentCourseDetailView(LoginRequiredMixin, DetailView):
@@ -57,20 +58,35 @@ class StudentCourseDetailView(LoginRequiredMixin, DetailView):
 
     def get_queryset(self):
         qs = super(StudentCourseDetailView, self).get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        return qs.filter(
+            id__in=list(enrollment.enrolled_course_ids(self.request.user)))
 
     def get_context_data(self, **kwargs):
         context = super(
             StudentCourseDetailView, self
             ).get_context_data(**kwargs)
-        course = self.get_object()
+        course = self.object
+        modules = fragments.module_skeleton(course)
+        context['modules'] = modules
 
         if 'module_id' in self.kwargs:
-            context['module'] = course.modules.get(
-                id=self.kwargs['module_id']
-            )
-        elif not course.modules.all():
-            context['module'] = []
+            module_id = int(self.kwargs['module_id'])
+            for module in modules:
+                if module.id == module_id:
+                    break
+            else:
+                raise Http404('No module {} in this course'.format(module_id))
+        elif not modules:
+            module = []
         else:
-            context['module'] = course.modules.all()[0]
+            module = modules[0]
+        context['module'] = module
+        if module:
+            context['module_contents'], content_ids = (
+                fragments.module_fragment(module))
+            # viewing a module completes its contents
+            progress.record(
+                self.request.user, course.id, content_ids, module.id)
+        context['progress'] = progress.course_percent(
+            self.request.user, course)
         return context